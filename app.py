@@ -2,26 +2,57 @@ import streamlit as st
 import os
 import pandas as pd
 from PIL import Image
-import shutil
+import time
 
 # Import functions from your existing invoice_processor.py
 # Make sure invoice_processor.py is in the same directory as app.py
 # or adjust the import path accordingly.
-from invoice_processor import process_invoices, INVOICE_DIR, OUTPUT_EXCEL_FILE, ocr_image, extract_text_from_pdf, ocr_pdf_as_images, read_text_from_txt, parse_invoice_text, write_to_excel
+from invoice_processor import SUPPORTED_EXTENSIONS
+from invoice_frames import invoice_dataframe
+from invoice_jobs import cancel_job, get_job, submit_job
+from invoice_timing import summarize_timings
+from upload_store import get_upload_store
 
 # --- Streamlit App Configuration ---
 st.set_page_config(page_title="Invoice Extractor", layout="wide")
+JOB_POLL_SECONDS = 1.0  # How often the page refreshes while a processing job is running
+UPLOAD_STORE_DIR = ".upload_store"  # Uploads of all sessions, stored once per content (see upload_store.py)
+UPLOAD_TTL_SECONDS = 24 * 3600  # Sessions unused for this long are removed with their uploads and outputs
+UPLOAD_STORE_MAX_BYTES = 2 * 1024 ** 3  # Idle sessions are removed, least recently used first, while the store is larger
+EXPORT_FORMATS = {  # Extra downloads written in the same run as the Excel file: extension, MIME type
+    "CSV": (".csv", "text/csv"),
+    "SQLite": (".sqlite", "application/vnd.sqlite3"),
+    "Parquet": (".parquet", "application/vnd.apache.parquet"),
+}
+try:
+    import pyarrow  # noqa: F401  Optional: Parquet export is only offered when it is installed
+except ImportError:
+    del EXPORT_FORMATS["Parquet"]
 
 # --- Helper Functions for Streamlit App ---
-def save_uploaded_file(uploaded_file, target_path):
-    """Saves an uploaded file to a target path."""
+def upload_store():
+    return get_upload_store(UPLOAD_STORE_DIR, UPLOAD_TTL_SECONDS, UPLOAD_STORE_MAX_BYTES)
+
+def save_uploaded_file(uploaded_file, file_name):
+    """
+    Stores an uploaded file in the upload store and links it into this
+    session's directory as file_name. Returns the path, or None on failure.
+    Uploads already stored in this session are not read again on reruns;
+    content already in the store (from any session) is not written again.
+    """
+    upload_key = (getattr(uploaded_file, "file_id", None), uploaded_file.name, uploaded_file.size, file_name)
+    stored = st.session_state.stored_uploads.get(upload_key)
+    if stored and os.path.exists(stored):
+        return stored
     try:
-        with open(target_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-        return True
+        uploaded_file.seek(0)
+        path, _ = upload_store().add(st.session_state.session_id, file_name, uploaded_file)
     except Exception as e:
         st.error(f"Error saving file {uploaded_file.name}: {e}")
-        return False
+        return None
+    st.session_state.stored_uploads[upload_key] = path
+    st.session_state.uploads_changed = True
+    return path
 
 def display_invoice_image(invoice_path):
     """Displays an image or the first page of a PDF."""
@@ -43,21 +74,25 @@ and present it in a table. You can then download the extracted data as an Excel
 # --- Global Variables / Session State ---
 if 'processed_data' not in st.session_state:
     st.session_state.processed_data = None
+if 'timings' not in st.session_state:
+    st.session_state.timings = []
+if 'job_id' not in st.session_state:
+    st.session_state.job_id = None
 if 'output_excel_path' not in st.session_state:
     st.session_state.output_excel_path = None
-if 'temp_invoice_dir' not in st.session_state:
-    # Create a unique temporary directory for this session's uploads
-    # This avoids conflicts if multiple users are using a deployed app
-    # For local use, a fixed subdir might be okay, but this is more robust.
-    temp_dir_name = f"temp_invoices_{os.urandom(4).hex()}"
-    st.session_state.temp_invoice_dir = os.path.join(".", temp_dir_name) # Create in current dir
-    if not os.path.exists(st.session_state.temp_invoice_dir):
-        os.makedirs(st.session_state.temp_invoice_dir, exist_ok=True)
-    # Override the INVOICE_DIR from invoice_processor to use this temp one
-    # This is a bit of a hack; ideally, invoice_processor would be more flexible.
-    # For a cleaner approach, modify invoice_processor to accept invoice_dir as a parameter.
-    globals()['INVOICE_DIR'] = st.session_state.temp_invoice_dir
-    globals()['OUTPUT_EXCEL_FILE'] = os.path.join(st.session_state.temp_invoice_dir, "invoice_data_streamlit.xlsx")
+if 'extra_output_paths' not in st.session_state:
+    st.session_state.extra_output_paths = []
+if 'stored_uploads' not in st.session_state:
+    st.session_state.stored_uploads = {}  # (file id, name, size, stored name) -> path in the session directory
+if 'session_id' not in st.session_state:
+    # Each session gets its own directory in the shared upload store, which avoids conflicts
+    # if multiple users are using a deployed app. Sessions left behind are evicted by age and size.
+    st.session_state.session_id = os.urandom(8).hex()
+    upload_store().evict(keep_session_id=st.session_state.session_id)
+# Looking the directory up marks the session as in use, so it is not evicted while open.
+# Jobs get this directory and their output paths explicitly (see submit_job)
+st.session_state.temp_invoice_dir = upload_store().session_dir(st.session_state.session_id)
+st.session_state.uploads_changed = False
 if 'output_mode' not in st.session_state:
     st.session_state.output_mode = "New Excel File" # Default
 if 'existing_excel_file_path' not in st.session_state:
@@ -96,8 +131,8 @@ with st.expander("Upload and Process Invoices", expanded=True):
             # Save the uploaded existing excel to a temporary location to be accessed by invoice_processor
             # This needs to be a persistent path for the processing step.
             # We'll save it in the session's temp_invoice_dir.
-            existing_excel_path_in_temp = os.path.join(st.session_state.temp_invoice_dir, "existing_" + existing_excel_file_upload.name)
-            if save_uploaded_file(existing_excel_file_upload, existing_excel_path_in_temp):
+            existing_excel_path_in_temp = save_uploaded_file(existing_excel_file_upload, "existing_" + existing_excel_file_upload.name)
+            if existing_excel_path_in_temp:
                 st.session_state.existing_excel_file_path = existing_excel_path_in_temp
                 st.success(f"Existing Excel '{existing_excel_file_upload.name}' ready for appending.")
             else:
@@ -105,95 +140,85 @@ with st.expander("Upload and Process Invoices", expanded=True):
                 st.error(f"Could not save existing Excel file: {existing_excel_file_upload.name}")
 
 
+    export_formats = st.multiselect(
+        "Also export as:", list(EXPORT_FORMATS), key="export_formats",
+        help=None if "Parquet" in EXPORT_FORMATS else "Parquet export needs the pyarrow package (pip install pyarrow).",
+    )
+
     if uploaded_files:
         st.info(f"{len(uploaded_files)} file(s) selected for processing.")
         file_details = [{"FileName": f.name, "FileType": f.type, "FileSize (bytes)": f.size} for f in uploaded_files]
         st.dataframe(file_details)
 
-        # Save uploaded files to the session's temporary invoice directory
+        # Link the uploaded files into the session's directory of the upload store
         saved_file_paths = []
         for uploaded_file in uploaded_files:
-            target_path = os.path.join(st.session_state.temp_invoice_dir, uploaded_file.name)
-            if save_uploaded_file(uploaded_file, target_path):
+            target_path = save_uploaded_file(uploaded_file, uploaded_file.name)
+            if target_path:
                 saved_file_paths.append(target_path)
                 st.success(f"Uploaded {uploaded_file.name}")
+        if st.session_state.uploads_changed:
+            upload_store().evict(keep_session_id=st.session_state.session_id)
 
-        if st.button("Process Uploaded Invoices", key="process"):
+        running_job = get_job(st.session_state.job_id) if st.session_state.job_id else None
+        if st.button("Process Uploaded Invoices", key="process", disabled=running_job is not None and not running_job.finished):
             if not saved_file_paths:
                 st.warning("No invoice files were successfully uploaded or selected for processing.")
             elif st.session_state.output_mode == "Append to Existing Excel File" and not st.session_state.existing_excel_file_path:
                 st.warning("Please upload an existing Excel file to append to, or choose 'New Excel File' mode.")
             else:
-                with st.spinner("Processing invoices... This may take a moment."):
-                    # Ensure the global INVOICE_DIR and OUTPUT_EXCEL_FILE are set for process_invoices
-                    current_app_invoice_dir = st.session_state.temp_invoice_dir
-                    # The output excel file name will be constant, but write_to_excel will handle new/append
-                    current_app_output_excel = os.path.join(current_app_invoice_dir, "invoice_data_streamlit.xlsx")
-
-                    all_extracted_data = []
-                    st.write(f"Looking for invoices in: {os.path.abspath(current_app_invoice_dir)}")
-                    invoice_files = os.listdir(current_app_invoice_dir)
-                    # Filter out the existing excel file if it was uploaded to the same temp dir
-                    invoice_files_to_process = [
-                        f for f in invoice_files
-                        if f != os.path.basename(current_app_output_excel) and
-                           (not st.session_state.existing_excel_file_path or f != os.path.basename(st.session_state.existing_excel_file_path))
-                    ]
-                    st.write(f"Files found for processing: {invoice_files_to_process}")
-
-
-                    for filename in invoice_files_to_process:
-                        # Avoid processing the excel file if it's already there from a previous run in the same session
-                        if filename == os.path.basename(current_app_output_excel):
-                            continue
-
-                        file_path = os.path.join(current_app_invoice_dir, filename)
-                        extracted_text = None
-                        file_type_processed = False
-
-                        if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.tiff', '.bmp', '.gif')):
-                            st.write(f"Processing image: {filename}")
-                            extracted_text = ocr_image(file_path)
-                            file_type_processed = True
-                        elif filename.lower().endswith('.pdf'):
-                            st.write(f"Processing PDF: {filename}")
-                            extracted_text = extract_text_from_pdf(file_path)
-                            if not extracted_text or len(extracted_text.strip()) < 50:
-                                st.write(f"Direct PDF text extraction for {filename} was minimal. Attempting OCR.")
-                                extracted_text = ocr_pdf_as_images(file_path) # poppler_path might be needed
-                            file_type_processed = True
-                        elif filename.lower().endswith('.txt'):
-                            st.write(f"Processing TXT: {filename}")
-                            extracted_text = read_text_from_txt(file_path)
-                            file_type_processed = True
-                        
-                        if file_type_processed:
-                            if extracted_text and extracted_text.strip():
-                                invoice_details = parse_invoice_text(extracted_text)
-                                invoice_details["file_name"] = filename
-                                all_extracted_data.append(invoice_details)
-                            elif extracted_text is not None:
-                                st.warning(f"No text could be extracted from {filename}.")
-                            else:
-                                st.error(f"Skipped or failed to process file: {filename}")
-                        # elif filename != os.path.basename(current_app_output_excel): # Don't warn about the output excel itself
-                        #     st.warning(f"Skipping unsupported file type during processing: {filename}")
-
-
-                    if all_extracted_data:
-                        st.session_state.processed_data = pd.DataFrame(all_extracted_data)
-                        # Pass the existing excel path if in append mode
-                        existing_excel_to_append = None
-                        if st.session_state.output_mode == "Append to Existing Excel File":
-                            existing_excel_to_append = st.session_state.existing_excel_file_path
-                        
-                        write_to_excel(all_extracted_data, current_app_output_excel, existing_excel_path=existing_excel_to_append)
-                        st.session_state.output_excel_path = current_app_output_excel
-                        st.success("Invoice processing complete!")
-                    else:
-                        st.session_state.processed_data = None
-                        st.session_state.output_excel_path = None
-                        st.warning("No data was extracted from the uploaded files.")
+                current_app_invoice_dir = st.session_state.temp_invoice_dir
+                # The output excel file name will be constant, but write_to_excel will handle new/append
+                current_app_output_excel = os.path.join(current_app_invoice_dir, "invoice_data_streamlit.xlsx")
+                # The files currently uploaded; the Excel files are not invoices
+                invoice_files_to_process = sorted({os.path.basename(path) for path in saved_file_paths if path.lower().endswith(SUPPORTED_EXTENSIONS)})
+                st.write(f"Files found for processing: {invoice_files_to_process}")
+
+                # Pass the existing excel path if in append mode
+                existing_excel_to_append = None
+                if st.session_state.output_mode == "Append to Existing Excel File":
+                    existing_excel_to_append = st.session_state.existing_excel_file_path
+
+                # Processing runs in the background; the page polls the job below
+                st.session_state.job_id = submit_job(
+                    [os.path.join(current_app_invoice_dir, f) for f in invoice_files_to_process],
+                    current_app_output_excel,
+                    existing_excel_path=existing_excel_to_append,
+                    extra_outputs=[
+                        os.path.join(current_app_invoice_dir, "invoice_data_streamlit" + EXPORT_FORMATS[name][0]) for name in export_formats
+                    ],
+                )
+                st.session_state.processed_data = None
+                st.session_state.output_excel_path = None
+                st.session_state.extra_output_paths = []
+                st.session_state.timings = []
+
+# --- Background Job Progress ---
+job = get_job(st.session_state.job_id) if st.session_state.job_id else None
+if job is not None:
+    job_state = job.snapshot()
+    st.session_state.processed_data = invoice_dataframe(job_state["rows"]) if job_state["rows"] else None
+    st.session_state.timings = job_state["timings"]
+    total = job_state["total"] or 1
+    st.progress(job_state["completed"] / total, text=f"Job {job_state['job_id']}: {job_state['completed']} of {job_state['total']} file(s) processed ({job_state['status']})")
+    for error in job_state["errors"]:
+        st.warning(error)
+    if job_state["duplicates"]:
+        st.info(f"Skipped {len(job_state['duplicates'])} invoice(s) already in the Excel file: {', '.join(job_state['duplicates'])}")
+    if not job.finished:
+        if st.button("Cancel Processing", key="cancel_job", disabled=job_state["status"] == "cancelling"):
+            cancel_job(job_state["job_id"])
+    elif job_state["status"] == "failed":
+        st.error(f"Processing failed: {job_state['error']}")
+    elif job_state["output_file"]:
+        st.session_state.output_excel_path = job_state["output_file"]
+        st.session_state.extra_output_paths = job_state["extra_outputs"]
+        if job_state["status"] == "cancelled":
+            st.info("Processing was cancelled. The files completed before that were saved.")
+        else:
+            st.success("Invoice processing complete!")
+    elif not job_state["duplicates"]:
+        st.warning("No data was extracted from the uploaded files.")
 
 # --- Display Results ---
 if st.session_state.processed_data is not None:
@@ -214,9 +239,23 @@ if st.session_state.processed_data is not None:
     else:
         st.info("Output Excel file not found or not yet generated.")
 
+    for name, (extension, mime) in EXPORT_FORMATS.items():
+        extra_path = next((path for path in st.session_state.extra_output_paths if path.endswith(extension)), None)
+        if extra_path and os.path.exists(extra_path):
+            with open(extra_path, "rb") as f:
+                st.download_button(label=f"Download Data as {name}", data=f, file_name="invoice_data_extracted" + extension, mime=mime)
+
 else:
     st.info("Upload invoices and click 'Process Uploaded Invoices' to see results.")
 
+if st.session_state.timings:
+    with st.expander("Processing Timings"):
+        timing_summary = summarize_timings(st.session_state.timings)
+        st.markdown("**Slowest files**")
+        st.dataframe(pd.DataFrame(timing_summary["slowest_files"]))
+        st.markdown("**Time per stage**")
+        st.dataframe(pd.DataFrame(timing_summary["stages"]))
+
 
 # --- Footer & Cleanup ---
 st.markdown("---")
@@ -227,23 +266,34 @@ st.markdown("Tesseract PATH in `invoice_processor.py`: `/opt/homebrew/bin/tesser
 if st.button("Clear Session Uploads & Results"): # Moved from sidebar
     if os.path.exists(st.session_state.temp_invoice_dir):
         try:
-            shutil.rmtree(st.session_state.temp_invoice_dir)
+            # Cancel first so the job does not write into the directory being removed
+            if st.session_state.job_id:
+                cancel_job(st.session_state.job_id)
+            upload_store().clear_session(st.session_state.session_id)
+            upload_store().evict(keep_session_id=st.session_state.session_id)
             st.success(f"Cleared temporary files in {st.session_state.temp_invoice_dir}") # Moved from sidebar
             # Reset session state related to processing
+            st.session_state.stored_uploads = {}
+            st.session_state.job_id = None
             st.session_state.processed_data = None
+            st.session_state.timings = []
             st.session_state.output_excel_path = None
+            st.session_state.extra_output_paths = []
             st.session_state.existing_excel_file_path = None # Clear existing excel path
             st.session_state.output_mode = "New Excel File" # Reset to default
             st.session_state.existing_excel_uploader_key += 1 # Change key to reset file uploader
 
-            # Recreate the temp dir for new uploads in the same session
-            os.makedirs(st.session_state.temp_invoice_dir, exist_ok=True)
-            globals()['INVOICE_DIR'] = st.session_state.temp_invoice_dir # Re-override
-            globals()['OUTPUT_EXCEL_FILE'] = os.path.join(st.session_state.temp_invoice_dir, "invoice_data_streamlit.xlsx")
+            # Recreate the session directory for new uploads in the same session
+            upload_store().session_dir(st.session_state.session_id)
 
         except Exception as e:
             st.error(f"Error clearing temporary files: {e}") # Moved from sidebar
-    st.experimental_rerun()
+    st.rerun()
+
+# Keep polling while a background job is running so new rows show up as files complete
+if job is not None and not job.finished:
+    time.sleep(JOB_POLL_SECONDS)
+    st.rerun()
 
 # To run the app:
 # 1. Make sure invoice_processor.py is in the same directory as this app.py.
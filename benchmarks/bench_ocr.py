@@ -0,0 +1,93 @@
+"""
+Per-page OCR latency of the OCR backends (see ocr_backends.py).
+
+Renders synthetic pages with corpus.render_page — small receipts, where
+Tesseract's start-up cost dominates, and full letter-size pages — and OCRs
+them with every available backend:
+  pytesseract  one tesseract process per page (the original path)
+  batch        one tesseract process per --batch-size pages
+  tesserocr    engine kept loaded per thread (only if tesserocr is installed)
+Reports per-page latency percentiles and pages/sec, and the speedup over
+pytesseract. Each backend is warmed up with one page first.
+
+Usage:
+    python benchmarks/bench_ocr.py
+    python benchmarks/bench_ocr.py --pages 40 --batch-size 8 --kind receipt
+"""
+import argparse
+import random
+import shutil
+import sys
+import time
+
+from bench_pipeline import percentile  # Also puts the repository on sys.path
+from corpus import make_invoice, render_page
+
+import ocr_backends
+
+RECEIPT_SIZE = (800, 1000)
+RECEIPT_LINES = 12
+
+
+def make_pages(kind, count, seed=0):
+    rng = random.Random(seed)
+    pages = []
+    for _ in range(count):
+        _, page_lines = make_invoice(rng)
+        if kind == "receipt":
+            image = render_page(page_lines[0][:RECEIPT_LINES], rng, font_size=28).crop((0, 0) + RECEIPT_SIZE)
+        else:
+            image = render_page(page_lines[0], rng)
+        pages.append(image)
+    return pages
+
+
+def time_backend(backend, pages):
+    """Returns per-page latencies in seconds; batched backends spread a batch's time over its pages."""
+    backend.images_to_strings(pages[:1])  # Warm-up
+    latencies = []
+    for start in range(0, len(pages), backend.batch_size):
+        batch = pages[start:start + backend.batch_size]
+        began = time.perf_counter()
+        backend.images_to_strings(batch)
+        elapsed = time.perf_counter() - began
+        latencies += [elapsed / len(batch)] * len(batch)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=24, help="Pages per kind")
+    parser.add_argument("--kind", choices=["receipt", "page", "both"], default="both")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--lang", default="eng")
+    parser.add_argument("--config", default="")
+    args = parser.parse_args()
+
+    if shutil.which("tesseract") is None and ocr_backends.tesserocr is None:
+        print("Neither the tesseract program nor the tesserocr package is available; nothing to benchmark.")
+        sys.exit(1)
+    names = ["pytesseract", "batch"] if shutil.which("tesseract") else []
+    if ocr_backends.tesserocr is not None:
+        names.append("tesserocr")
+
+    kinds = ["receipt", "page"] if args.kind == "both" else [args.kind]
+    print(f"{'kind':<8} {'backend':<12} {'pages':>6} {'p50 ms':>9} {'p90 ms':>9} {'pages/s':>8} {'vs pytesseract':>15}")
+    for kind in kinds:
+        pages = make_pages(kind, args.pages)
+        baseline = None
+        for name in names:
+            backend = ocr_backends.get_ocr_backend(name, args.lang, args.config, args.batch_size)
+            latencies = time_backend(backend, pages)
+            total = sum(latencies)
+            if name == "pytesseract":
+                baseline = total
+            speedup = f"{baseline / total:.2f}x" if baseline and total else "-"
+            print(
+                f"{kind:<8} {name:<12} {len(pages):>6} {percentile(latencies, 0.50) * 1000:>9.1f} "
+                f"{percentile(latencies, 0.90) * 1000:>9.1f} {len(pages) / total:>8.1f} {speedup:>15}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Benchmark for parse_invoice_text.
+
+Compares the precompiled single-pass parser in invoice_processor with the
+original keyword-loop implementation (kept below as legacy_parse_invoice_text)
+on synthetic invoice texts of increasing length, and checks that both return
+the same fields.
+
+Run from the repository root:
+    python benchmarks/bench_parse.py
+    python benchmarks/bench_parse.py --lines 200 2000 20000 --repeat 5
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from invoice_processor import parse_invoice_text  # noqa: E402
+
+HEADER_LINES = [
+    "Al Kendi Computer Systems LLC",
+    "P.O. Box 12345, Dubai",
+    "TAX INVOICE",
+    "Invoice No: INV-2024-0042",
+    "Invoice Date: 14 Nov 2024",
+    "Bill To:",
+    "Printery Trading Company",
+]
+BODY_LINES = [
+    "Item {n} Desktop monitor 27 inch qty 2 @ {price}",
+    "Service charge for period {n} {price}",
+    "Delivery and installation",
+    "Subtotal {price}",
+    "VAT 5% {price}",
+    "Reference PO-{n} approved by procurement",
+    "Room night {n} Luxury Collection Hotel {price}",
+    "Amount carried forward",
+    "{price}",
+]
+FOOTER_LINES = [
+    "Net Total: {price}",
+    "Grand Total: AED {price}",
+    "Balance Due {price}",
+    "Thank you for your business",
+]
+
+
+def make_invoice_text(num_lines, seed=0):
+    """
+    Builds a reproducible synthetic invoice/statement text with roughly num_lines lines.
+    """
+    rng = random.Random(seed)
+    lines = list(HEADER_LINES)
+    while len(lines) < num_lines - len(FOOTER_LINES):
+        template = rng.choice(BODY_LINES)
+        lines.append(template.format(n=len(lines), price=f"{rng.uniform(10, 5000):,.2f}"))
+    lines.extend(t.format(price=f"{rng.uniform(5000, 50000):,.2f}") for t in FOOTER_LINES)
+    return "\n".join(lines)
+
+
+def time_parser(parser, text, repeat):
+    """
+    Returns (best seconds per call, result) over repeat runs, with parser output silenced.
+    """
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = parser(text)
+            best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--lines", type=int, nargs="+", default=[50, 500, 5000, 50000], help="Text sizes to benchmark, in lines")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="Runs per size; the best time is reported")
+    args = arg_parser.parse_args()
+
+    print(f"{'lines':>8} {'chars':>10} {'legacy ms':>12} {'compiled ms':>12} {'speedup':>8}  same result")
+    for num_lines in args.lines:
+        text = make_invoice_text(num_lines)
+        legacy_time, legacy_result = time_parser(legacy_parse_invoice_text, text, args.repeat)
+        new_time, new_result = time_parser(parse_invoice_text, text, args.repeat)
+        print(
+            f"{num_lines:>8} {len(text):>10} {legacy_time * 1000:>12.3f} {new_time * 1000:>12.3f} "
+            f"{legacy_time / new_time:>7.1f}x  {legacy_result == new_result}"
+        )
+
+
+# --- Original implementation, kept for comparison ---
+
+def legacy_parse_invoice_text(text):
+    """
+    Parses the OCR'd text to extract invoice details.
+    This function attempts to handle variations in field names.
+    """
+    invoice_data = {
+        "invoice_number": None,
+        "invoice_date": None,
+        "total_amount": None,
+        "vendor_name": None, # Or Client Name
+        # Add more fields as needed
+    }
+
+    lines = text.split('\n')
+    text_lower = text.lower() # For case-insensitive keyword searching
+
+    # --- Invoice Number --- (Usually more consistent)
+    # Keywords: Invoice No, Invoice #, Invoice Number, Tax Invoice
+    # Pattern: Keyword followed by a value (alphanumeric, dashes, etc.)
+    invoice_no_patterns = [
+        r"invoice\s*(?:no|number|#|id)[:.\s]*([A-Za-z0-9-]+)",
+        r"tax\s*invoice[:.\s]*([A-Za-z0-9-]+)"
+    ]
+    for pattern in invoice_no_patterns:
+        match = re.search(pattern, text_lower)
+        if match:
+            # Extract from original text to preserve case if needed, though usually numbers
+            original_match = re.search(pattern, text, re.IGNORECASE)
+            if original_match:
+                invoice_data["invoice_number"] = original_match.group(1).strip()
+                break
+
+    # --- Invoice Date --- (Usually more consistent)
+    # Keywords: Date, Invoice Date, Billing Date
+    # Pattern: DD/MM/YYYY, MM/DD/YYYY, DD Mon YYYY, etc.
+    date_patterns = [
+        r"date[:\s]*(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})",
+        r"invoice\s*date[:\s]*(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})",
+        r"billing\s*date[:\s]*(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})",
+        r"(\d{1,2}\s(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*[,.]?\s*\d{2,4})",
+        r"(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s*\d{1,2}[,.]?\s*\d{2,4}"
+    ]
+    for pattern in date_patterns:
+        match = re.search(pattern, text, re.IGNORECASE) # Dates can have mixed case (e.g. Jan)
+        if match:
+            invoice_data["invoice_date"] = match.group(1).strip()
+            break
+
+    # --- Total Amount --- (Highly variable keywords)
+    # Keywords: Total, Amount Due, Balance Due, Grand Total, Net Total, Payable Amount, Total Invoice Amount
+    # Pattern: Keyword followed by a currency symbol (optional) and a number (with commas, decimals)
+    amount_keywords = [
+        "total amount", "amount due", "balance due", "grand total", "net total", 
+        "total payable", "invoice total", "total invoice amount", "total", "amount"
+    ]
+    # Regex to capture amounts like: $1,234.56, 1234.56, 1.234,56 (some European formats)
+    amount_regex = r"\$?([\d,]+(?:\.\d{2})?|\d+(?:\.\d{3})*(?:,\d{2})?)" 
+    # More robust amount regex: handles optional currency, commas/periods as separators
+    # Looks for a keyword and then tries to find an amount on the same line or next few lines.
+    
+    possible_amounts = []
+    for i, line in enumerate(lines):
+        line_lower = line.lower()
+        for keyword in amount_keywords:
+            if keyword in line_lower:
+                # Search for amount on the same line
+                match = re.search(amount_regex, line)
+                if match:
+                    amount_str = match.group(1).replace(',', '') # Basic normalization
+                    if '.' in amount_str and amount_str.count('.') > 1: # e.g. 1.234.567 -> invalid for this simple replace
+                        amount_str = amount_str.replace('.', '', amount_str.count('.') -1) # Keep last dot
+                    amount_str = amount_str.replace(',', '.') # For formats like 1.234,56 -> 1234.56
+                    try:
+                        possible_amounts.append(float(amount_str))
+                    except ValueError:
+                        pass # Could not convert
+                else:
+                    # Check next few lines if no amount on current line
+                    for next_line_idx in range(i + 1, min(i + 3, len(lines))):
+                        match_next = re.search(amount_regex, lines[next_line_idx])
+                        if match_next:
+                            amount_str = match_next.group(1).replace(',', '')
+                            if '.' in amount_str and amount_str.count('.') > 1:
+                                amount_str = amount_str.replace('.', '', amount_str.count('.') -1)
+                            amount_str = amount_str.replace(',', '.')
+                            try:
+                                possible_amounts.append(float(amount_str))
+                                break # Found amount for this keyword
+                            except ValueError:
+                                pass
+                break # Move to next line once a keyword is processed on this line
+    
+    if possible_amounts:
+        # Often the grand total is the largest amount found, but this is heuristic
+        invoice_data["total_amount"] = max(possible_amounts) 
+        # Alternative: look for specific keywords like "grand total" and prioritize that.
+        # For now, max is a simple approach.
+
+    # --- Vendor/Client Name --- (Can be very tricky)
+    # Keywords: To, Bill To, Client, Sold To, Attention, Attn, Vendor, From, Supplier
+    # Often at the top, or near an address. Sometimes it's just the first prominent name.
+    vendor_keywords = ["to:", "bill to:", "client:", "sold to:", "attention:", "attn:", "customer:"]
+    
+    # Attempt to find client/customer name
+    found_vendor = False
+    for i, line in enumerate(lines):
+        line_lower = line.lower()
+        for keyword in vendor_keywords:
+            if keyword in line_lower:
+                # The name is often on the same line after the keyword, or the next non-empty line
+                potential_name_line = line.split(keyword, 1)[-1].strip()
+                if not potential_name_line and i + 1 < len(lines):
+                    potential_name_line = lines[i+1].strip()
+                
+                if potential_name_line and len(potential_name_line) > 2: # Basic check
+                    # Further refinement: avoid lines that are just addresses or dates
+                    if not re.match(r"^(\d{1,4}\s|P\.?O\.?\sBox)", potential_name_line, re.IGNORECASE) and not re.search(date_patterns[0], potential_name_line, re.IGNORECASE):
+                        invoice_data["vendor_name"] = potential_name_line.split('\n')[0].strip() # Take first line of it
+                        found_vendor = True
+                        break
+        if found_vendor:
+            break
+    
+    # If no client found with keywords, try a more general approach (e.g. first few lines)
+    if not found_vendor:
+        for i in range(min(5, len(lines))): # Check first 5 lines
+            line_content = lines[i].strip()
+            # Avoid lines that are clearly "Invoice", "Date", numbers, or too short
+            if line_content and not line_content.lower().startswith(("invoice", "date", "page")) and not line_content.isdigit() and len(line_content) > 5:
+                # This is a very rough heuristic, might pick up sender too.
+                # A more robust solution might involve Named Entity Recognition (NER)
+                # or looking for company suffixes (Ltd, Inc, LLC)
+                # For now, let's assume the first suitable line could be it if not found by keywords.
+                # Example: Check for company suffixes
+                if re.search(r"\b(LTD|LLC|INC|LIMITED|GMBH|SARL|CORP|PLC|CO\.?)\b", line_content, re.IGNORECASE):
+                     invoice_data["vendor_name"] = line_content
+                     break
+                # If still no vendor_name, and we haven't found one via keywords, this is a fallback
+                if not invoice_data["vendor_name"] and i < 2: # Only take from first 2 lines as a last resort fallback
+                    invoice_data["vendor_name"] = line_content
+                    # break # Commented out to allow company suffix check to override if it comes later in first 5 lines
+
+    return invoice_data
+
+
+if __name__ == "__main__":
+    main()
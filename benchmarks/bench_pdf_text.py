@@ -0,0 +1,72 @@
+"""
+Text layer extraction speed of the PDF text backends (see pdf_text_backends.py).
+
+Writes synthetic text-layer PDFs with corpus.write_text_pdf, from short
+invoices to long multi-page statements, and extracts them with every
+available backend:
+  pypdf2     PyPDF2's page.extract_text() (the original path)
+  pdftotext  poppler's pdftotext (only if it is installed)
+Reports seconds, pages/sec, pages at or above the OCR threshold, invoice
+fields parsed from the text, the speedup over pypdf2, and the backend that
+PDF_TEXT_BACKEND = "auto" would choose for this sample.
+
+Usage:
+    python benchmarks/bench_pdf_text.py
+    python benchmarks/bench_pdf_text.py --files 20 --pages 40 --pdftotext-args=-layout
+"""
+import argparse
+import os
+import random
+import tempfile
+
+import bench_pipeline  # noqa: F401  Puts the repository on sys.path
+from corpus import make_invoice, write_text_pdf
+
+import invoice_processor
+import pdf_text_backends
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=10, help="PDFs to extract")
+    parser.add_argument("--pages", type=int, default=20, help="Pages of the longest PDF; the others have 1 to this many")
+    parser.add_argument("--pdftotext-args", default="", help="Extra pdftotext options, e.g. -layout")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    backends = [
+        pdf_text_backends.create_backend(name, pdftotext_args=args.pdftotext_args)
+        for name in pdf_text_backends.BACKEND_NAMES
+    ]
+    backends = [backend for backend in backends if backend.is_available()]
+    with tempfile.TemporaryDirectory(prefix="bench_pdf_text_") as temp_dir:
+        paths = []
+        for index in range(args.files):
+            pages = args.pages if index == 0 else rng.randint(1, args.pages)
+            _, page_lines = make_invoice(rng, pages=pages)
+            path = os.path.join(temp_dir, f"invoice_{index:03d}.pdf")
+            write_text_pdf(path, page_lines)
+            paths.append(path)
+        for backend in backends:
+            backend.page_texts(paths[0])  # Warm-up
+        results = pdf_text_backends.benchmark_backends(
+            backends, paths, invoice_processor.MIN_PAGE_TEXT_CHARS, score=invoice_processor._parsed_field_count
+        )
+
+    baseline = next((result["seconds"] for result in results if result["name"] == "pypdf2"), None)
+    print(f"{'backend':<10} {'pages':>6} {'seconds':>8} {'pages/s':>8} {'text pages':>11} {'fields':>7} {'vs pypdf2':>10}")
+    for result in results:
+        if result["error"]:
+            print(f"{result['name']:<10} failed: {result['error']}")
+            continue
+        speedup = f"{baseline / result['seconds']:.2f}x" if baseline and result["seconds"] else "-"
+        print(
+            f"{result['name']:<10} {result['pages']:>6} {result['seconds']:>8.3f} {result['pages'] / result['seconds']:>8.1f} "
+            f"{result['text_pages']:>11} {result['score']:>7} {speedup:>10}"
+        )
+    print(f"auto would choose: {pdf_text_backends.choose_backend(results)}")
+
+
+if __name__ == "__main__":
+    main()
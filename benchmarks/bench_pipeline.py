@@ -0,0 +1,268 @@
+"""
+Throughput benchmark for the invoice pipeline.
+
+Generates (or reuses) a synthetic corpus (see corpus.py) and times each stage
+separately and end to end:
+  ocr_image              PNG/JPEG scans
+  extract_text_from_pdf  text-layer PDFs
+  ocr_pdf_as_images      image-only PDFs
+  parse_invoice_text     TXT invoices (parsing only)
+  write_to_excel         rows built from the corpus manifest (reported as pages)
+  write_csv, write_sqlite, write_parquet
+                         the same rows through the other output sinks (output_sinks.py)
+  end_to_end             process_invoice_file on every file, then write_to_excel
+Every stage runs in a fresh child process so its peak RSS is measured in
+isolation. The report gives files/sec, pages/sec, per-page latency
+percentiles and peak RSS (of the stage process and of its child processes,
+e.g. tesseract). Results can be saved as JSON and compared against an earlier
+run to spot regressions across commits. The extraction cache is disabled
+unless --cache is given.
+
+Usage:
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --scale 3 --json after.json --compare before.json
+    python benchmarks/bench_pipeline.py --stages parse_invoice_text write_to_excel
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; peak RSS is then not reported
+    resource = None
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from corpus import generate_corpus, load_manifest  # noqa: E402
+
+STAGES = [
+    "ocr_image", "extract_text_from_pdf", "ocr_pdf_as_images",
+    "parse_invoice_text", "write_to_excel", "write_csv", "write_sqlite", "write_parquet", "end_to_end",
+]
+# External programs each stage needs; the stage is skipped when one is missing
+STAGE_REQUIREMENTS = {
+    "ocr_image": ["tesseract"],
+    "ocr_pdf_as_images": ["tesseract", "pdftoppm"],
+    "end_to_end": ["tesseract", "pdftoppm"],
+}
+# Python packages a stage needs (optional dependencies)
+STAGE_MODULES = {
+    "write_parquet": ["pyarrow"],
+}
+WRITE_ROWS = 20000  # Rows written by the write_* stages
+SINK_EXTENSIONS = {"write_csv": ".csv", "write_sqlite": ".sqlite", "write_parquet": ".parquet"}
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def _peak_rss_kb(who):
+    if resource is None:
+        return None
+    peak = resource.getrusage(who).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak  # macOS reports bytes, Linux KiB
+
+
+def _files_of(manifest, corpus_dir, kinds):
+    return [(os.path.join(corpus_dir, entry["file_name"]), entry["pages"]) for entry in manifest if entry["kind"] in kinds]
+
+
+def run_stage(stage, corpus_dir, use_cache):
+    """
+    Runs one stage in the current process and returns its measurements.
+    Each sample is (pages, seconds) for one unit of work.
+    """
+    import invoice_processor as ip
+
+    ip.CACHE_ENABLED = use_cache
+    ip.DUPLICATE_CHECK = False  # The write stages repeat the manifest rows
+    manifest = load_manifest(corpus_dir)
+    samples = []
+    files = 0
+
+    def timed(func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        return result, time.perf_counter() - start
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        if stage in ("ocr_image", "extract_text_from_pdf", "ocr_pdf_as_images"):
+            kinds = {"ocr_image": ("png", "jpg"), "extract_text_from_pdf": ("text_pdf",), "ocr_pdf_as_images": ("image_pdf",)}[stage]
+            func = getattr(ip, stage)
+            for path, pages in _files_of(manifest, corpus_dir, kinds):
+                _, seconds = timed(func, path)
+                samples.append((pages, seconds))
+                files += 1
+        elif stage == "parse_invoice_text":
+            for path, pages in _files_of(manifest, corpus_dir, ("txt",)):
+                with open(path, encoding="utf-8") as f:
+                    text = f.read()
+                _, seconds = timed(ip.parse_invoice_text, text)
+                samples.append((pages, seconds))
+                files += 1
+        elif stage == "write_to_excel" or stage in SINK_EXTENSIONS:
+            rows = [dict(entry["fields"], file_name=entry["file_name"]) for entry in manifest]
+            rows = [rows[i % len(rows)] for i in range(WRITE_ROWS)]
+            with tempfile.TemporaryDirectory() as temp_dir:
+                if stage == "write_to_excel":
+                    _, seconds = timed(ip.write_to_excel, rows, os.path.join(temp_dir, "bench.xlsx"))
+                else:
+                    _, seconds = timed(ip.write_outputs, rows, [os.path.join(temp_dir, "bench" + SINK_EXTENSIONS[stage])])
+            samples.append((len(rows), seconds))
+            files = 1
+        elif stage == "end_to_end":
+            results = []
+            for entry in manifest:
+                path = os.path.join(corpus_dir, entry["file_name"])
+                details, seconds = timed(ip.process_invoice_file, path)
+                samples.append((entry["pages"], seconds))
+                files += 1
+                if details:
+                    results.append(details)
+            with tempfile.TemporaryDirectory() as temp_dir:
+                _, seconds = timed(ip.write_to_excel, results, os.path.join(temp_dir, "bench.xlsx"))
+            samples.append((0, seconds))
+        else:
+            raise ValueError(f"Unknown stage: {stage}")
+
+    total_seconds = sum(seconds for _, seconds in samples)
+    pages = sum(p for p, _ in samples)
+    page_latencies = [seconds / p for p, seconds in samples if p]
+    return {
+        "stage": stage,
+        "files": files,
+        "pages": pages,
+        "seconds": total_seconds,
+        "files_per_sec": files / total_seconds if total_seconds else None,
+        "pages_per_sec": pages / total_seconds if total_seconds else None,
+        "page_latency_p50_ms": percentile(page_latencies, 0.50) * 1000 if page_latencies else None,
+        "page_latency_p90_ms": percentile(page_latencies, 0.90) * 1000 if page_latencies else None,
+        "page_latency_p99_ms": percentile(page_latencies, 0.99) * 1000 if page_latencies else None,
+        "peak_rss_kb": _peak_rss_kb(resource.RUSAGE_SELF) if resource else None,
+        "peak_child_rss_kb": _peak_rss_kb(resource.RUSAGE_CHILDREN) if resource else None,
+    }
+
+
+def run_stage_isolated(stage, corpus_dir, use_cache):
+    """Runs a stage in a freshly spawned process so RSS numbers are not shared between stages."""
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(run_stage, stage, corpus_dir, use_cache).result()
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _format(value, digits=1):
+    if value is None:
+        return "-"
+    return f"{value:.{digits}f}"
+
+
+def print_report(results, baseline=None):
+    baseline_by_stage = {r["stage"]: r for r in (baseline or {}).get("results", []) if not r.get("skipped")}
+    header = f"{'stage':<24} {'files':>6} {'pages':>6} {'sec':>8} {'files/s':>9} {'pages/s':>9} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'RSS MiB':>8} {'child MiB':>9}"
+    if baseline_by_stage:
+        header += f" {'vs base':>8}"
+    print(header)
+    for result in results:
+        if result.get("skipped"):
+            print(f"{result['stage']:<24} skipped: {result['skipped']}")
+            continue
+        rss = result["peak_rss_kb"] / 1024 if result["peak_rss_kb"] else None
+        child_rss = result["peak_child_rss_kb"] / 1024 if result["peak_child_rss_kb"] else None
+        line = (
+            f"{result['stage']:<24} {result['files']:>6} {result['pages']:>6} {_format(result['seconds'], 2):>8} "
+            f"{_format(result['files_per_sec']):>9} {_format(result['pages_per_sec']):>9} "
+            f"{_format(result['page_latency_p50_ms'], 2):>8} {_format(result['page_latency_p90_ms'], 2):>8} "
+            f"{_format(result['page_latency_p99_ms'], 2):>8} {_format(rss):>8} {_format(child_rss):>9}"
+        )
+        base = baseline_by_stage.get(result["stage"])
+        if base and base.get("seconds") and result["seconds"]:
+            line += f" {base['seconds'] / result['seconds']:>7.2f}x"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="Corpus directory; generated into a temporary directory if omitted")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scale", type=float, default=1.0, help="Corpus size multiplier")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--cache", action="store_true", help="Leave the extraction cache enabled")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Earlier --json output to compare against (speedup = base sec / new sec)")
+    args = parser.parse_args()
+
+    temp_dir = None
+    corpus_dir = args.corpus
+    if not corpus_dir:
+        temp_dir = tempfile.mkdtemp(prefix="invoice_bench_")
+        corpus_dir = temp_dir
+    try:
+        if not os.path.exists(os.path.join(corpus_dir, "manifest.json")):
+            print(f"Generating corpus in {corpus_dir} (seed={args.seed}, scale={args.scale})")
+            # In a child process: Linux keeps the peak RSS across fork/exec, so generating
+            # here would inflate the RSS reported for every stage.
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                executor.submit(generate_corpus, corpus_dir, args.seed, args.scale).result()
+
+        results = []
+        for stage in args.stages:
+            missing = [tool for tool in STAGE_REQUIREMENTS.get(stage, []) if shutil.which(tool) is None]
+            missing += [module for module in STAGE_MODULES.get(stage, []) if importlib.util.find_spec(module) is None]
+            if missing:
+                results.append({"stage": stage, "skipped": f"{', '.join(missing)} not found"})
+                continue
+            results.append(run_stage_isolated(stage, corpus_dir, args.cache))
+
+        baseline = None
+        if args.compare:
+            with open(args.compare) as f:
+                baseline = json.load(f)
+        print_report(results, baseline)
+
+        if args.json:
+            report = {
+                "commit": _git_commit(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "corpus": {"seed": args.seed, "scale": args.scale, "dir": args.corpus},
+                "cache": args.cache,
+                "results": results,
+            }
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"Results written to {args.json}")
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Time and memory of the OCR preprocessing presets (see image_preprocessing.py).
+
+Generates synthetic "phone photos" (pages rendered at 3x the 200-DPI size,
+i.e. about 600 DPI, saved as JPEG) and runs every preset on them in a
+freshly spawned process, as ocr_image does: decode, preprocess, and OCR
+when Tesseract is available. Reports per image the decode+preprocess time,
+the size of the image handed to Tesseract, the OCR time, the share of
+invoice fields (number, date, total) parsed correctly from the OCR text and
+the peak RSS of the process. Run it before changing the default OCR_PRESET.
+
+Usage:
+    python benchmarks/bench_preprocess.py
+    python benchmarks/bench_preprocess.py --images 10 --upscale 2 --presets off fast
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from bench_pipeline import _peak_rss_kb, percentile, resource  # Also puts the repository on sys.path
+from corpus import make_invoice, render_page
+
+from image_preprocessing import PRESETS, get_preset, prepare_for_decoding, preprocess_image
+
+ACCURACY_FIELDS = ("invoice_number", "invoice_date", "total_amount")  # vendor_name is the customer in parse_invoice_text
+
+
+def make_photos(output_dir, count, upscale, seed=0):
+    """Writes count photos; returns (paths, fields) with the true fields of each."""
+    rng = random.Random(seed)
+    paths, all_fields = [], []
+    for index in range(count):
+        fields, page_lines = make_invoice(rng)
+        page = render_page(page_lines[0], rng)
+        photo = page.resize((page.width * upscale, page.height * upscale), resample=1).convert("RGB")
+        path = os.path.join(output_dir, f"photo_{index:03d}.jpg")
+        photo.save(path, quality=90)
+        paths.append(path)
+        all_fields.append(fields)
+    return paths, all_fields
+
+
+def run_preset(name, paths, all_fields, ocr):
+    """Runs one preset over paths in the current process and returns its measurements."""
+    from PIL import Image
+
+    import invoice_processor
+
+    preset = get_preset(name)
+    backend = None
+    if ocr:
+        import ocr_backends
+        backend = ocr_backends.get_ocr_backend("pytesseract", "eng")
+    prepare_seconds, ocr_seconds, megapixels, megabytes = [], [], [], []
+    correct = 0
+    for path, fields in zip(paths, all_fields):
+        start = time.perf_counter()
+        with Image.open(path) as image:
+            prepared, _ = preprocess_image(prepare_for_decoding(image, preset), preset)
+            prepared.load()
+            prepare_seconds.append(time.perf_counter() - start)
+            megapixels.append(prepared.width * prepared.height / 1e6)
+            bytes_per_pixel = 1 / 8 if prepared.mode == "1" else len(prepared.getbands())
+            megabytes.append(prepared.width * prepared.height * bytes_per_pixel / 1e6)
+            if backend:
+                start = time.perf_counter()
+                text = backend.images_to_strings([prepared])[0]
+                ocr_seconds.append(time.perf_counter() - start)
+                parsed = invoice_processor.parse_invoice_text(text)
+                correct += sum(parsed[field] == fields[field] for field in ACCURACY_FIELDS)
+    return {
+        "preset": name,
+        "prepare_ms_p50": percentile(prepare_seconds, 0.5) * 1000,
+        "megapixels": sum(megapixels) / len(megapixels),
+        "image_mb": sum(megabytes) / len(megabytes),
+        "ocr_ms_p50": percentile(ocr_seconds, 0.5) * 1000 if ocr_seconds else None,
+        "fields_correct": correct / (len(paths) * len(ACCURACY_FIELDS)) if ocr_seconds else None,
+        "peak_rss_kb": _peak_rss_kb(resource.RUSAGE_SELF) if resource else None,
+        "peak_child_rss_kb": _peak_rss_kb(resource.RUSAGE_CHILDREN) if resource else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=6)
+    parser.add_argument("--upscale", type=int, default=3, help="Photo size as a multiple of a 200-DPI page")
+    parser.add_argument("--presets", nargs="+", choices=list(PRESETS), default=list(PRESETS))
+    parser.add_argument("--no-ocr", action="store_true", help="Only measure preprocessing")
+    args = parser.parse_args()
+
+    ocr = not args.no_ocr and shutil.which("tesseract") is not None
+    if not args.no_ocr and not ocr:
+        print("tesseract not found: measuring preprocessing only.")
+    temp_dir = tempfile.mkdtemp(prefix="invoice_preprocess_")
+    try:
+        context = multiprocessing.get_context("spawn")
+        # Linux keeps a process's peak RSS across fork/exec, so the large photos are generated
+        # in a child as well; otherwise every preset process would inherit that peak.
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            paths, all_fields = executor.submit(make_photos, temp_dir, args.images, args.upscale).result()
+        results = []
+        for name in args.presets:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                results.append(executor.submit(run_preset, name, paths, all_fields, ocr).result())
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def fmt(value, digits=1):
+        return "-" if value is None else f"{value:.{digits}f}"
+
+    print(f"{'preset':<10} {'prep ms':>8} {'MPix':>6} {'img MB':>7} {'OCR ms':>8} {'fields':>7} {'RSS MiB':>8} {'child MiB':>9}")
+    for result in results:
+        rss = result["peak_rss_kb"] / 1024 if result["peak_rss_kb"] else None
+        child_rss = result["peak_child_rss_kb"] / 1024 if result["peak_child_rss_kb"] else None
+        fields = result["fields_correct"] * 100 if result["fields_correct"] is not None else None
+        print(
+            f"{result['preset']:<10} {fmt(result['prepare_ms_p50']):>8} {fmt(result['megapixels']):>6} "
+            f"{fmt(result['image_mb']):>7} {fmt(result['ocr_ms_p50']):>8} {fmt(fields):>7} {fmt(rss):>8} {fmt(child_rss):>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Reproducible synthetic invoice corpus for benchmarks.
+
+Generates, from a fixed seed:
+  - TXT invoices
+  - PNG and JPEG "scans" rendered with PIL
+  - text-layer PDFs (hand-written PDF with a Helvetica text layer)
+  - image-only PDFs (rendered pages saved with PIL, no text layer)
+Multi-page documents get varying page counts. A manifest.json records every
+file with its type, page count and the invoice fields it was generated from.
+
+Usage:
+    python benchmarks/corpus.py OUTPUT_DIR [--seed 0] [--scale 1.0]
+"""
+import argparse
+import json
+import os
+import random
+
+from PIL import Image, ImageDraw, ImageFont
+
+VENDORS = [
+    "Al Kendi Computer Systems LLC", "Printery LTD", "Luxury Collection Hotel Inc",
+    "Dubai World Trade Centre LLC", "Northwind Traders Ltd", "Contoso Office Supplies GmbH",
+]
+ITEMS = [
+    "Desktop monitor 27 inch", "ASUS mini PC", "Season's greetings cards", "Office rent",
+    "Room night", "Laptop docking station", "Printer toner", "Consulting hours",
+]
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+PAGE_SIZE = (1700, 2200)  # Letter at 200 DPI, like pdf2image's default rendering
+LINES_PER_PAGE = 40
+
+# Default number of files per kind at scale 1.0
+DEFAULT_COUNTS = {"txt": 20, "png": 8, "jpg": 8, "text_pdf": 10, "image_pdf": 6}
+MAX_PAGES = {"text_pdf": 12, "image_pdf": 6}
+
+
+def make_invoice(rng, pages=1):
+    """
+    Returns (fields, pages_of_lines) for one synthetic invoice.
+    The header with invoice number, date and vendor is on the first page,
+    line items fill the following pages and the total is on the last one.
+    """
+    vendor = rng.choice(VENDORS)
+    fields = {
+        "invoice_number": f"INV-{rng.randint(1000, 999999)}",
+        "invoice_date": f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(2019, 2025)}",
+        "vendor_name": vendor,
+    }
+    header = [
+        vendor,
+        f"P.O. Box {rng.randint(100, 99999)}, Dubai",
+        "TAX INVOICE",
+        f"Invoice No: {fields['invoice_number']}",
+        f"Date: {fields['invoice_date']}",
+        "Bill To:",
+        rng.choice(VENDORS),
+        "",
+    ]
+    item_lines = max(3, pages * LINES_PER_PAGE - len(header) - 6)
+    body = []
+    subtotal = 0.0
+    for n in range(item_lines):
+        price = round(rng.uniform(5, 2500), 2)
+        subtotal += price
+        body.append(f"{n + 1}. {rng.choice(ITEMS)} {rng.randint(1, 12)} {rng.choice(MONTHS)} {price:,.2f}")
+    vat = round(subtotal * 0.05, 2)
+    fields["total_amount"] = round(subtotal + vat, 2)
+    footer = [
+        "",
+        f"Subtotal {subtotal:,.2f}",
+        f"VAT 5% {vat:,.2f}",
+        f"Grand Total {fields['total_amount']:,.2f}",
+        "Thank you for your business",
+    ]
+    lines = header + body + footer
+    page_lines = [lines[i:i + LINES_PER_PAGE] for i in range(0, len(lines), LINES_PER_PAGE)]
+    return fields, page_lines
+
+
+def _font(size):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:  # Pillow < 10.1 has no scalable default font
+        return ImageFont.load_default()
+
+
+def render_page(lines, rng, font_size=34):
+    """
+    Renders lines of text on a white page, with a slight skew and noise like a scan.
+    """
+    image = Image.new("L", PAGE_SIZE, color=255)
+    draw = ImageDraw.Draw(image)
+    font = _font(font_size)
+    y = 120
+    for line in lines:
+        draw.text((120, y), line, fill=0, font=font)
+        y += int(font_size * 1.4)
+    for _ in range(400):
+        draw.point((rng.randrange(PAGE_SIZE[0]), rng.randrange(PAGE_SIZE[1])), fill=rng.randint(120, 200))
+    return image.rotate(rng.uniform(-1.0, 1.0), fillcolor=255, expand=False)
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_text_pdf(path, page_lines):
+    """
+    Writes a minimal PDF with a real text layer (one Helvetica text object per page).
+    """
+    objects = []  # PDF objects in order; object number = index + 1
+    font_number = 3
+    page_numbers = []
+    for lines in page_lines:
+        content = ["BT", "/F1 11 Tf", "14 TL", "72 740 Td"]
+        for line in lines:
+            content.append(f"({_pdf_escape(line)}) Tj T*")
+        content.append("ET")
+        stream = "\n".join(content).encode("latin-1", "replace")
+        page_numbers.append(len(page_numbers) * 2 + 4)
+        objects.append(None)  # page placeholder, filled below
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+    kids = " ".join(f"{n} 0 R" for n in page_numbers)
+    header_objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {len(page_numbers)} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, page_number in enumerate(page_numbers):
+        objects[i * 2] = (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 {font_number} 0 R >> >> /Contents {page_number + 1} 0 R >>"
+        ).encode()
+    objects = header_objects + objects
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref_offset = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset))
+
+
+def write_image_pdf(path, page_lines, rng):
+    """
+    Writes an image-only PDF (no text layer), one rendered page per page of lines.
+    """
+    images = [render_page(lines, rng) for lines in page_lines]
+    images[0].save(path, save_all=True, append_images=images[1:], resolution=200.0)
+
+
+def generate_corpus(output_dir, seed=0, scale=1.0):
+    """
+    Generates the corpus into output_dir and returns the manifest entries.
+    The same seed and scale always produce the same files.
+    """
+    rng = random.Random(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = []
+    for kind, count in DEFAULT_COUNTS.items():
+        for index in range(max(1, int(round(count * scale)))):
+            pages = rng.randint(1, MAX_PAGES[kind]) if kind in MAX_PAGES else 1
+            fields, page_lines = make_invoice(rng, pages=pages)
+            extension = {"txt": "txt", "png": "png", "jpg": "jpg", "text_pdf": "pdf", "image_pdf": "pdf"}[kind]
+            file_name = f"{kind}_{index:04d}.{extension}"
+            path = os.path.join(output_dir, file_name)
+            if kind == "txt":
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write("\n".join(line for lines in page_lines for line in lines))
+            elif kind in ("png", "jpg"):
+                image = render_page(page_lines[0], rng)
+                if kind == "jpg":
+                    image.save(path, quality=85)
+                else:
+                    image.save(path)
+            elif kind == "text_pdf":
+                write_text_pdf(path, page_lines)
+            else:
+                write_image_pdf(path, page_lines, rng)
+            manifest.append({
+                "file_name": file_name,
+                "kind": kind,
+                "pages": len(page_lines),
+                "bytes": os.path.getsize(path),
+                "fields": fields,
+            })
+    with open(os.path.join(output_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_manifest(corpus_dir):
+    with open(os.path.join(corpus_dir, "manifest.json")) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("output_dir")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for the number of files of each kind")
+    args = parser.parse_args()
+    manifest = generate_corpus(args.output_dir, seed=args.seed, scale=args.scale)
+    print(f"Generated {len(manifest)} files in {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,439 @@
+import copy
+import os
+import posixpath
+import re
+import shutil
+import struct
+import tempfile
+import zipfile
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape, unescape
+
+# Streaming append of rows to an existing .xlsx file.
+#
+# openpyxl.load_workbook parses every cell of the workbook into memory just to add a few
+# rows at the end. Here the worksheet XML is copied through in fixed-size chunks instead:
+# only the <dimension> element and the closing </sheetData> tag are touched, and new rows
+# are serialized directly as XML. Existing rows are never parsed, and memory use is bounded
+# by CHUNK_SIZE plus the new rows.
+#
+# All other parts of the package (shared strings, styles, ...) are copied as raw compressed
+# bytes, without inflating and deflating them. The worksheet itself has to be inflated and
+# deflated again, as DEFLATE streams cannot be extended, so an append still takes time linear
+# in the size of the existing sheet; SHEET_COMPRESS_LEVEL trades file size for that time.
+# zipfile has no API for raw copies, so they rely on ZipFile attributes that are not
+# documented (see _copy_member_raw); where those are missing or a raw copy fails, the member
+# is recompressed like the worksheet instead.
+#
+# Given headers, the first row of the sheet is checked before anything is written: headers
+# missing at its end (a column added to the pipeline since the ledger was started) are added
+# to it, any other difference raises HeaderMismatchError.
+
+CHUNK_SIZE = 1024 * 1024
+SHEET_COMPRESS_LEVEL = 1  # zlib level of the rewritten worksheet (1 = fastest, 9 = smallest)
+
+_NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_NS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_NS_PKG_REL = "http://schemas.openxmlformats.org/package/2006/relationships"
+_SHARED_STRINGS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings"
+
+_DIMENSION_RE = re.compile(rb'<dimension ref="([A-Z]+)(\d+)(?::([A-Z]+)(\d+))?"\s*/>')
+_EMPTY_SHEET_DATA_RE = re.compile(rb"<sheetData\s*(?:/>|>\s*</sheetData>)")
+_ILLEGAL_XML_CHARS_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_ROW_NUMBER_RE = re.compile(rb'<row\b[^>]*?\sr="(\d+)"')
+_SHEET_DATA_END = b"</sheetData>"
+_ROW_START_RE = re.compile(rb"<row\b[^>]*?(/?)>")
+_SPANS_RE = re.compile(rb'\sspans="[^"]*"')
+_CELL_RE = re.compile(rb"<c\b([^>]*?)(?:/>|>(.*?)</c>)", re.DOTALL)
+_CELL_REF_RE = re.compile(rb'\sr="([A-Z]+)\d+"')
+_CELL_TYPE_RE = re.compile(rb'\st="(\w+)"')
+_VALUE_RE = re.compile(rb"<v>(.*?)</v>", re.DOTALL)
+_TEXT_RE = re.compile(rb"<t\b[^>]*?(?:/>|>(.*?)</t>)", re.DOTALL)
+_XML_ENTITIES = {"&quot;": '"', "&apos;": "'"}
+_LOCAL_HEADER = struct.Struct("<4s22xHH")  # Signature, file name length, extra field length
+_LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+
+
+class HeaderMismatchError(ValueError):
+    """The first row of a worksheet does not hold the expected headers."""
+
+
+def _column_letter(index):
+    """Converts a 1-based column index to its Excel letter (1 -> A, 27 -> AA)."""
+    letters = ""
+    while index > 0:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+def _cell_xml(value, reference):
+    """
+    Serializes one cell. reference is its coordinate (e.g. "C12"), or None to
+    let the column be implied by the cell's position in the row.
+    """
+    ref = f' r="{reference}"' if reference else ""
+    if value is None or value == "":
+        return f"<c{ref}/>"
+    if isinstance(value, bool):
+        return f'<c{ref} t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f"<c{ref}><v>{value!r}</v></c>"
+    text = escape(_ILLEGAL_XML_CHARS_RE.sub("", str(value)))
+    return f'<c{ref} t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+def rows_to_xml(rows, start_row=None):
+    """
+    Serializes rows (lists of cell values) as <row> elements numbered from start_row.
+    With start_row=None, row and cell numbers are omitted and implied by position.
+    """
+    parts = []
+    for offset, row in enumerate(rows):
+        if start_row is None:
+            cells = "".join(_cell_xml(value, None) for value in row)
+            parts.append(f"<row>{cells}</row>")
+        else:
+            row_number = start_row + offset
+            cells = "".join(
+                _cell_xml(value, f"{_column_letter(column)}{row_number}")
+                for column, value in enumerate(row, start=1)
+            )
+            parts.append(f'<row r="{row_number}">{cells}</row>')
+    return "".join(parts).encode("utf-8")
+
+def _active_sheet_path(archive):
+    """
+    Returns the zip member name of the workbook's active worksheet.
+    """
+    workbook = ET.fromstring(archive.read("xl/workbook.xml"))
+    sheets = workbook.findall(f"{{{_NS_MAIN}}}sheets/{{{_NS_MAIN}}}sheet")
+    active_tab = 0
+    view = workbook.find(f"{{{_NS_MAIN}}}bookViews/{{{_NS_MAIN}}}workbookView")
+    if view is not None:
+        active_tab = int(view.get("activeTab", 0))
+    if not sheets:
+        raise ValueError("Workbook contains no worksheets")
+    relationship_id = sheets[min(active_tab, len(sheets) - 1)].get(f"{{{_NS_REL}}}id")
+
+    relationships = ET.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+    for relationship in relationships.findall(f"{{{_NS_PKG_REL}}}Relationship"):
+        if relationship.get("Id") == relationship_id:
+            target = relationship.get("Target")
+            if target.startswith("/"):
+                return target.lstrip("/")
+            return posixpath.normpath(posixpath.join("xl", target))
+    raise ValueError(f"Worksheet relationship {relationship_id} not found")
+
+def _updated_dimension(match, added_rows, added_columns):
+    start_column, start_row, end_column, end_row = match.groups()
+    end_column = end_column or start_column
+    end_row = int(end_row or start_row)
+    column_count = 0
+    for letter in end_column.decode():
+        column_count = column_count * 26 + ord(letter) - 64
+    new_end_column = _column_letter(max(column_count, added_columns))
+    return b'<dimension ref="%s%s:%s%d"/>' % (start_column, start_row, new_end_column.encode(), end_row + added_rows)
+
+def _last_row_number(data, last_row):
+    matches = _ROW_NUMBER_RE.findall(data)
+    return int(matches[-1]) if matches else last_row
+
+def _read_sheet_head(source):
+    """
+    Reads the worksheet XML up to the <sheetData> start tag, which follows
+    <dimension>, and far enough beyond it to tell an empty <sheetData/> or
+    <sheetData></sheetData> element. Returns everything read so far.
+    """
+    head = b""
+    while True:
+        start = head.find(b"<sheetData")
+        end = head.find(b">", start) if start != -1 else -1
+        if end != -1 and (head[end - 1:end] == b"/" or len(head) > end + 64):
+            return head
+        chunk = source.read(CHUNK_SIZE)
+        if not chunk:
+            return head
+        head += chunk
+
+def _read_first_row(source, head):
+    """
+    Reads on until head holds the whole first <row> element of a non-empty
+    <sheetData>. Returns (head, start, end) with head[start:end] that element.
+    """
+    offset = head.find(b"<sheetData")
+    while True:
+        match = _ROW_START_RE.search(head, offset)
+        if match:
+            end = match.end() if match.group(1) else head.find(b"</row>", match.end())
+            if end != -1:
+                return head, match.start(), end if match.group(1) else end + len(b"</row>")
+        chunk = source.read(CHUNK_SIZE)
+        if not chunk:
+            raise ValueError("Worksheet XML has no complete <row> element")
+        head += chunk
+
+def _column_number(letters):
+    number = 0
+    for letter in letters.decode():
+        number = number * 26 + ord(letter) - 64
+    return number
+
+def _xml_text(data):
+    return unescape(data.decode("utf-8"), _XML_ENTITIES)
+
+def _row_values(row_xml, shared_string):
+    """
+    Returns the cell values of one <row> element as strings, by column
+    (None for empty columns). shared_string(index) looks up the text of a
+    shared string cell.
+    """
+    values = []
+    for match in _CELL_RE.finditer(row_xml):
+        attributes, content = match.group(1), match.group(2) or b""
+        reference = _CELL_REF_RE.search(attributes)
+        column = _column_number(reference.group(1)) if reference else len(values) + 1
+        cell_type = _CELL_TYPE_RE.search(attributes)
+        cell_type = cell_type.group(1) if cell_type else b"n"
+        value = _VALUE_RE.search(content)
+        if cell_type == b"inlineStr":
+            text = "".join(_xml_text(part or b"") for part in _TEXT_RE.findall(content))
+        elif cell_type == b"s" and value:
+            text = shared_string(int(value.group(1)))
+        else:
+            text = _xml_text(value.group(1)) if value else None
+        values += [None] * (column - len(values))
+        values[column - 1] = text
+    return values
+
+def _shared_strings(archive):
+    """
+    Returns a function looking up shared strings of archive by index. The
+    shared string table is parsed incrementally, only as far as the highest
+    index asked for (headers come first in it).
+    """
+    path = None
+    relationships = ET.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+    for relationship in relationships.findall(f"{{{_NS_PKG_REL}}}Relationship"):
+        if relationship.get("Type") == _SHARED_STRINGS_REL:
+            target = relationship.get("Target")
+            path = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("xl", target))
+    strings = []
+
+    def lookup(index):
+        if path is None:
+            raise ValueError("Worksheet uses shared strings but the workbook has none")
+        if len(strings) <= index:
+            with archive.open(path) as source:
+                strings.clear()
+                for _, element in ET.iterparse(source):
+                    if element.tag == f"{{{_NS_MAIN}}}si":
+                        strings.append(_shared_string_text(element))
+                        element.clear()
+                        if len(strings) > index:
+                            break
+        return strings[index]
+
+    return lookup
+
+def _shared_string_text(item):
+    # Plain text is one <t>, rich text a run of <r><t>; phonetic hints (<rPh>) are not part of it
+    parts = []
+    for child in item:
+        if child.tag == f"{{{_NS_MAIN}}}t":
+            parts.append(child.text or "")
+        elif child.tag == f"{{{_NS_MAIN}}}r":
+            parts += [t.text or "" for t in child.iter(f"{{{_NS_MAIN}}}t")]
+    return "".join(parts)
+
+def missing_headers(existing, headers):
+    """
+    Compares the values of an existing header row with headers. Returns
+    the headers missing at its end (all of them for an empty row); raises
+    HeaderMismatchError if the existing headers are not a prefix of headers.
+    """
+    existing = [str(value).strip() if value is not None else "" for value in existing]
+    while existing and not existing[-1]:
+        existing.pop()
+    if existing != list(headers[:len(existing)]) or len(existing) > len(headers):
+        raise HeaderMismatchError(f"The sheet's columns are {existing}, expected {list(headers)}")
+    return list(headers[len(existing):])
+
+def _sheet_header(archive, sheet_path):
+    """Returns the values of the first row of the worksheet, or None if it has no rows."""
+    with archive.open(sheet_path) as source:
+        head = _read_sheet_head(source)
+        if _EMPTY_SHEET_DATA_RE.search(head):
+            return None
+        head, start, end = _read_first_row(source, head)
+    return _row_values(head[start:end], _shared_strings(archive))
+
+def _extended_row(row_xml, values, first_column):
+    """Adds cells with values to a <row> element, from column first_column on."""
+    match = _ROW_START_RE.match(row_xml)
+    row_number = re.search(rb'\sr="(\d+)"', match.group(0))
+    start_tag = _SPANS_RE.sub(b"", match.group(0)).replace(b"/>", b">")  # spans is a hint; it would be stale
+    cells = b"".join(
+        _cell_xml(value, f"{_column_letter(column)}{int(row_number.group(1))}" if row_number else None).encode("utf-8")
+        for column, value in enumerate(values, start=first_column)
+    )
+    body = row_xml[match.end():-len(b"</row>")] if not match.group(1) else b""
+    return start_tag + body + cells + b"</row>"
+
+def _copy_sheet_with_rows(source, target, rows, header_cells=None):
+    """
+    Streams the worksheet XML from source to target, inserting rows before </sheetData>.
+    The number of the last existing row is tracked while copying so the new
+    rows continue from it. header_cells, if given, is (first_column, values):
+    cells added to the end of the first row.
+    """
+    added_columns = max((len(row) for row in rows), default=0)
+    if header_cells:
+        added_columns = max(added_columns, header_cells[0] + len(header_cells[1]) - 1)
+    head = _read_sheet_head(source)
+    if header_cells and not _EMPTY_SHEET_DATA_RE.search(head):
+        head, start, end = _read_first_row(source, head)
+        head = head[:start] + _extended_row(head[start:end], header_cells[1], header_cells[0]) + head[end:]
+
+    if _EMPTY_SHEET_DATA_RE.search(head):
+        # The existing dimension (e.g. "A1") describes no rows, so it ends at the last new one
+        head = _DIMENSION_RE.sub(lambda m: _updated_dimension(m, max(0, len(rows) - 1), max(1, added_columns)), head, count=1)
+        rows_xml = rows_to_xml(rows, start_row=1)
+        head = _EMPTY_SHEET_DATA_RE.sub(lambda m: b"<sheetData>" + rows_xml + _SHEET_DATA_END, head, count=1)
+        target.write(head)
+        shutil.copyfileobj(source, target, CHUNK_SIZE)
+        return
+    head = _DIMENSION_RE.sub(lambda m: _updated_dimension(m, len(rows), added_columns), head, count=1)
+
+    pending = head
+    inserted = False
+    last_row = None
+    while True:
+        if not inserted:
+            position = pending.find(_SHEET_DATA_END)
+            if position != -1:
+                last_row = _last_row_number(pending[:position], last_row)
+                target.write(pending[:position])
+                target.write(rows_to_xml(rows, start_row=last_row + 1 if last_row is not None else None))
+                pending = pending[position:]
+                inserted = True
+            else:
+                # Keep the bytes from the last "<" back: a <row r="..."> tag or </sheetData> may
+                # continue in the next chunk. Text cannot contain "<", so only a tag is kept.
+                split = pending.rfind(b"<")
+                if split > 0:
+                    last_row = _last_row_number(pending[:split], last_row)
+                    target.write(pending[:split])
+                    pending = pending[split:]
+        chunk = source.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        if inserted:
+            target.write(pending)
+            pending = b""
+        pending += chunk
+    target.write(pending)
+    if not inserted:
+        raise ValueError("Worksheet XML has no </sheetData> element")
+
+def _can_copy_raw(item, target_zip):
+    # Members with extra fields (e.g. zip64 sizes) or encryption are recompressed instead, as are
+    # all members if the undocumented ZipFile attributes _copy_member_raw relies on are missing
+    return (
+        not item.extra and not item.flag_bits & 0x1 and item.compress_type in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)
+        and all(hasattr(target_zip, name) for name in ("fp", "start_dir", "filelist", "NameToInfo"))
+        and hasattr(item, "FileHeader")
+    )
+
+def _copy_member_raw(source_zip, item, target_zip):
+    """
+    Copies a member's compressed bytes from source_zip to target_zip without
+    inflating them. zipfile has no public API for this, so it does what
+    ZipFile.write does: write a local header and the data at start_dir and
+    register the ZipInfo, from which close() writes the central directory.
+    The member is only registered once fully copied; if this raises, the
+    next member written overwrites the partial copy.
+    """
+    source = source_zip.fp
+    source.seek(item.header_offset)
+    signature, name_length, extra_length = _LOCAL_HEADER.unpack(source.read(_LOCAL_HEADER.size))
+    if signature != _LOCAL_HEADER_SIGNATURE:
+        raise ValueError(f"{item.filename} has no local file header")
+    source.seek(name_length + extra_length, os.SEEK_CUR)
+
+    info = copy.copy(item)
+    info.flag_bits &= ~0x08  # Sizes and CRC go into the local header, not a data descriptor
+    target = target_zip.fp
+    target.seek(target_zip.start_dir)
+    info.header_offset = target.tell()
+    target.write(info.FileHeader())
+    remaining = item.compress_size
+    while remaining > 0:
+        chunk = source.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            raise ValueError(f"{item.filename} is truncated")
+        target.write(chunk)
+        remaining -= len(chunk)
+    target_zip.start_dir = target.tell()
+    target_zip.filelist.append(info)
+    target_zip.NameToInfo[info.filename] = info
+
+def _set_compress_level(info, level):
+    # ZipInfo.compress_level (Python 3.13+) was ZipInfo._compresslevel before; without either
+    # the member gets zlib's default level
+    for name in ("compress_level", "_compresslevel"):
+        if hasattr(info, name):
+            setattr(info, name, level)
+            return
+
+def append_rows_to_xlsx(xlsx_path, rows, output_path=None, headers=None):
+    """
+    Appends rows to the active worksheet of an existing .xlsx file without loading it.
+    The result is written to output_path (default: xlsx_path, replaced atomically).
+    If headers is given, the sheet's first row must hold them: headers missing
+    at its end are added, an empty sheet gets them as its first row, and any
+    other difference raises HeaderMismatchError before anything is written.
+    Returns the number of rows appended.
+    """
+    output_path = output_path or xlsx_path
+    rows = [list(row) for row in rows]
+    appended = len(rows)
+
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    fd, temp_path = tempfile.mkstemp(suffix=".xlsx", dir=output_dir)
+    os.close(fd)
+    try:
+        with zipfile.ZipFile(xlsx_path) as source_zip, \
+                zipfile.ZipFile(temp_path, "w", compression=zipfile.ZIP_DEFLATED) as target_zip:
+            sheet_path = _active_sheet_path(source_zip)
+            header_cells = None
+            if headers is not None:
+                existing = _sheet_header(source_zip, sheet_path)
+                if existing is None:
+                    rows.insert(0, list(headers))
+                else:
+                    missing = missing_headers(existing, headers)
+                    if missing:
+                        header_cells = (len(headers) - len(missing) + 1, missing)
+            for item in source_zip.infolist():
+                is_sheet = item.filename == sheet_path
+                if not is_sheet and _can_copy_raw(item, target_zip):
+                    try:
+                        _copy_member_raw(source_zip, item, target_zip)
+                        continue
+                    except (OSError, ValueError, struct.error):
+                        pass  # Recompressed below instead
+                target_info = zipfile.ZipInfo(item.filename, date_time=item.date_time)
+                target_info.compress_type = zipfile.ZIP_DEFLATED
+                if is_sheet:
+                    _set_compress_level(target_info, SHEET_COMPRESS_LEVEL)
+                large = is_sheet and item.file_size > zipfile.ZIP64_LIMIT // 2
+                with source_zip.open(item) as source, target_zip.open(target_info, "w", force_zip64=large) as target:
+                    if is_sheet:
+                        _copy_sheet_with_rows(source, target, rows, header_cells)
+                    else:
+                        shutil.copyfileobj(source, target, CHUNK_SIZE)
+        os.replace(temp_path, output_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return appended
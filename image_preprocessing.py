@@ -0,0 +1,168 @@
+from PIL import Image, ImageOps
+
+# Image preparation before OCR. Tesseract's time grows with the pixel count, and it reads
+# text best at a cap height of roughly 20-40 pixels, so oversized scans and phone photos are
+# reduced to a target text height before OCR. Presets trade speed for accuracy:
+#   off       original behaviour: 200 DPI colour rendering, images passed through unchanged
+#   fast      150 DPI, small text height, Otsu binarization, no deskew
+#   balanced  200 DPI, medium text height, deskew; Tesseract binarizes itself
+#   accurate  300 DPI, large text height, deskew
+# benchmarks/bench_preprocess.py measures the time and memory of each preset.
+
+PRESETS = {
+    "off": {"dpi": 200, "min_dpi": 200, "grayscale": False, "target_text_height": None, "max_side": None, "deskew": False, "binarize": False},
+    "fast": {"dpi": 150, "min_dpi": 100, "grayscale": True, "target_text_height": 22, "max_side": 2500, "deskew": False, "binarize": True},
+    "balanced": {"dpi": 200, "min_dpi": 120, "grayscale": True, "target_text_height": 32, "max_side": 3500, "deskew": True, "binarize": False},
+    "accurate": {"dpi": 300, "min_dpi": 200, "grayscale": True, "target_text_height": 44, "max_side": 5000, "deskew": True, "binarize": False},
+}
+PROFILE_STRIPS = 8  # Vertical strips used to find text lines in the row profile
+MIN_TEXT_LINES = 3  # Fewer detected lines than this means the text height is unknown
+SKEW_ANALYSIS_WIDTH = 800  # Skew is estimated on a thumbnail of this width
+MAX_SKEW_DEGREES = 5.0
+MIN_SKEW_DEGREES = 0.3  # Smaller angles are not worth a rotation
+EXIF_ORIENTATION = 0x0112
+
+# --- Helper Functions ---
+
+def get_preset(name):
+    if name not in PRESETS:
+        raise ValueError(f"Unknown preprocessing preset: {name}. Choose one of {', '.join(PRESETS)}.")
+    return PRESETS[name]
+
+def _row_profile(gray, strips=1):
+    """
+    Mean brightness of every pixel row, per vertical strip: a list of
+    `strips` lists, each with one value per row.
+    """
+    width, height = gray.size
+    profile = gray.resize((strips, height), Image.BOX)
+    values = list(profile.getdata())
+    return [values[strip::strips] for strip in range(strips)]
+
+def estimate_text_height(gray):
+    """
+    Estimates the height in pixels of a text line (ascender to descender)
+    from the row brightness profile of a grayscale image.
+    Returns None if no regular text lines were found.
+    """
+    heights = []
+    for column in _row_profile(gray, PROFILE_STRIPS):
+        background = sorted(column)[int(len(column) * 0.9)]
+        darkest = min(column)
+        if background - darkest < 20:
+            continue  # Blank strip
+        threshold = background - (background - darkest) * 0.2
+        run = 0
+        for value in column + [255]:
+            if value < threshold:
+                run += 1
+            else:
+                if run >= 3:
+                    heights.append(run)
+                run = 0
+    if len(heights) < MIN_TEXT_LINES:
+        return None
+    heights.sort()
+    return heights[len(heights) // 2]
+
+def otsu_threshold(gray):
+    """
+    Returns the Otsu threshold of a grayscale image, computed from its histogram.
+    """
+    histogram = gray.histogram()[:256]
+    total = sum(histogram)
+    sum_all = sum(level * count for level, count in enumerate(histogram))
+    sum_background = weight_background = 0
+    best_threshold, best_variance = 127, -1.0
+    for level, count in enumerate(histogram):
+        weight_background += count
+        if weight_background == 0:
+            continue
+        weight_foreground = total - weight_background
+        if weight_foreground == 0:
+            break
+        sum_background += level * count
+        mean_background = sum_background / weight_background
+        mean_foreground = (sum_all - sum_background) / weight_foreground
+        variance = weight_background * weight_foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = level, variance
+    return best_threshold
+
+def _line_sharpness(gray, angle):
+    rotated = gray.rotate(angle, resample=Image.NEAREST, fillcolor=255)
+    column = _row_profile(rotated)[0]
+    return sum((column[i + 1] - column[i]) ** 2 for i in range(len(column) - 1))
+
+def estimate_skew(gray):
+    """
+    Returns the rotation (degrees, counter-clockwise, as for Image.rotate)
+    that straightens the text lines of an image, i.e. makes them sharpest
+    in the row profile.
+    Searched on a thumbnail, coarse then fine, within MAX_SKEW_DEGREES.
+    """
+    scale = min(1.0, SKEW_ANALYSIS_WIDTH / gray.width)
+    thumbnail = gray.resize((max(1, int(gray.width * scale)), max(1, int(gray.height * scale))), Image.BILINEAR)
+    coarse = [step * 0.5 for step in range(int(-MAX_SKEW_DEGREES * 2), int(MAX_SKEW_DEGREES * 2) + 1)]
+    best = max(coarse, key=lambda angle: _line_sharpness(thumbnail, angle))
+    fine = [best + step * 0.1 for step in range(-4, 5)]
+    return max(fine, key=lambda angle: _line_sharpness(thumbnail, angle))
+
+def prepare_for_decoding(image, preset):
+    """
+    Lets the JPEG decoder scale an image down while decoding (to no less
+    than max_side), which avoids decoding a 600-DPI photo at full size.
+    Must be called right after Image.open, before the pixels are loaded.
+    """
+    if preset["max_side"] and image.format == "JPEG":
+        image.draft("L" if preset["grayscale"] else image.mode, (preset["max_side"], preset["max_side"]))
+    return image
+
+def preprocess_image(image, preset):
+    """
+    Prepares an image for OCR according to a preset: fixes EXIF rotation,
+    converts to grayscale, downscales so text lines are about
+    target_text_height pixels tall (never upscales; max_side caps images
+    without detectable text), deskews and binarizes.
+    Returns (prepared_image, text_height); text_height is the line height
+    measured before scaling, or None.
+    """
+    if preset["target_text_height"] is None and not preset["grayscale"]:
+        return image, None
+    if image.getexif().get(EXIF_ORIENTATION, 1) != 1:  # Phone photos are often stored sideways
+        image = ImageOps.exif_transpose(image)
+    if preset["grayscale"] and image.mode != "L":
+        image = image.convert("L")
+    gray = image if image.mode == "L" else image.convert("L")
+
+    text_height = estimate_text_height(gray)
+    scale = 1.0
+    if preset["target_text_height"] and text_height:
+        scale = min(1.0, preset["target_text_height"] / text_height)
+    if preset["max_side"]:
+        scale = min(scale, preset["max_side"] / max(image.size))
+    if scale < 0.95:
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = image.resize(size, Image.LANCZOS, reducing_gap=2.0)
+        gray = image if image.mode == "L" else image.convert("L")
+
+    if preset["deskew"]:
+        angle = estimate_skew(gray)
+        if abs(angle) >= MIN_SKEW_DEGREES:
+            image = image.rotate(angle, resample=Image.BILINEAR, expand=True, fillcolor=255 if image.mode == "L" else (255, 255, 255))
+            gray = image if image.mode == "L" else image.convert("L")
+
+    if preset["binarize"]:
+        threshold = otsu_threshold(gray)
+        image = gray.point(lambda level: 255 if level > threshold else 0).convert("1", dither=Image.NONE)
+    return image, text_height
+
+def suggest_dpi(dpi, text_height, preset):
+    """
+    Returns the rasterization DPI that brings text rendered at `dpi` with
+    line height text_height down to the preset's target text height,
+    never above `dpi` nor below the preset's min_dpi.
+    """
+    if not text_height or not preset["target_text_height"]:
+        return dpi
+    return max(preset["min_dpi"], min(dpi, int(dpi * preset["target_text_height"] / text_height)))
@@ -0,0 +1,101 @@
+import math
+
+# Tiling of oversized image frames for OCR. A frame with more than a given number of pixels is
+# cut into overlapping tiles that are preprocessed and OCR'd independently (and in parallel),
+# so the memory of preprocessing copies and of Tesseract itself is bounded by the tile size
+# instead of the image size. Tiles are full-width bands where possible, since cutting through
+# text lines horizontally is what the overlap repairs best; very wide frames are also split
+# into columns.
+#
+# Every tile owns the part of its box up to the middle of its overlap with each neighbour.
+# The owned regions partition the frame, so a text line OCR'd in two overlapping tiles is
+# kept only from the tile that owns its centre, where it is complete as long as the overlap
+# is larger than the line.
+
+TILE_MAX_ASPECT = 2  # Bands may be up to this many times wider than a square tile of the pixel limit
+
+# --- Helper Functions ---
+
+def tile_boxes(width, height, max_pixels, overlap):
+    """
+    Returns the (left, top, right, bottom) boxes of overlapping tiles that
+    cover a width x height frame, row by row, each with at most about
+    max_pixels pixels. A frame within max_pixels is one tile.
+    """
+    if width * height <= max_pixels:
+        return [(0, 0, width, height)]
+    max_width = int(math.sqrt(max_pixels) * TILE_MAX_ASPECT)
+    columns = max(1, math.ceil((width - overlap) / max(1, max_width - overlap)))
+    tile_width = width if columns == 1 else math.ceil((width - overlap) / columns) + overlap
+    tile_height = max(2 * overlap, max_pixels // tile_width)
+    boxes = []
+    for top in _starts(height, tile_height, overlap):
+        for left in _starts(width, tile_width, overlap):
+            boxes.append((left, top, min(width, left + tile_width), min(height, top + tile_height)))
+    return boxes
+
+def _starts(length, tile_length, overlap):
+    if tile_length >= length:
+        return [0]
+    step = tile_length - overlap
+    starts = list(range(0, length - tile_length, step))
+    starts.append(length - tile_length)  # The last tile ends at the edge
+    return starts
+
+def _owned_spans(spans, length):
+    """
+    Splits 0..length among overlapping (start, end) spans, sorted by start:
+    neighbours meet in the middle of their overlap.
+    """
+    owned = {}
+    for index, (start, end) in enumerate(spans):
+        owned_start = 0 if index == 0 else (start + spans[index - 1][1]) / 2
+        owned_end = length if index == len(spans) - 1 else (spans[index + 1][0] + end) / 2
+        owned[(start, end)] = (owned_start, owned_end)
+    return owned
+
+def owned_regions(boxes, width, height):
+    """
+    The part of every tile box (from tile_boxes) that the tile is responsible
+    for: its box up to the middle of the overlap with each neighbour. The
+    regions partition the frame. Returns {box: (left, top, right, bottom)}.
+    """
+    columns = _owned_spans(sorted({(box[0], box[2]) for box in boxes}), width)
+    rows = _owned_spans(sorted({(box[1], box[3]) for box in boxes}), height)
+    regions = {}
+    for box in boxes:
+        (left, right), (top, bottom) = columns[(box[0], box[2])], rows[(box[1], box[3])]
+        regions[box] = (left, top, right, bottom)
+    return regions
+
+def stitch_tile_lines(tiles, width, height):
+    """
+    Merges the text lines OCR'd from the tiles of one frame into its text in
+    reading order. tiles is a list of (box, lines), with lines as dicts with
+    text, left, right, top and bottom in tile coordinates. Lines are kept
+    from the tile owning their centre; lines from side-by-side tiles at the
+    same height are joined left to right.
+    """
+    regions = owned_regions([box for box, _ in tiles], width, height)
+    kept = []
+    for tile_index, (box, lines) in enumerate(tiles):
+        owned_left, owned_top, owned_right, owned_bottom = regions[box]
+        for line in lines:
+            left, top = line["left"] + box[0], line["top"] + box[1]
+            right, bottom = line["right"] + box[0], line["bottom"] + box[1]
+            middle_x, middle_y = (left + right) / 2, (top + bottom) / 2
+            if owned_left <= middle_x < owned_right and owned_top <= middle_y < owned_bottom:
+                kept.append({"text": line["text"], "left": left, "top": top, "bottom": bottom, "tile": tile_index})
+
+    rows = []
+    for line in sorted(kept, key=lambda line: (line["top"], line["left"])):
+        middle_y = (line["top"] + line["bottom"]) / 2
+        row = rows[-1] if rows else None
+        if row and row["top"] <= middle_y < row["bottom"] and line["tile"] not in row["tiles"]:
+            row["lines"].append(line)
+            row["tiles"].add(line["tile"])
+        else:
+            rows.append({"top": line["top"], "bottom": line["bottom"], "lines": [line], "tiles": {line["tile"]}})
+    return "\n".join(
+        " ".join(line["text"] for line in sorted(row["lines"], key=lambda line: line["left"])) for row in rows
+    )
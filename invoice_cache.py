@@ -0,0 +1,172 @@
+import collections
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# --- Configuration ---
+CACHE_VERSION = 1  # Bump to invalidate every entry written by an older version of the pipeline
+HASH_MEMO_SIZE = 4096  # File hashes remembered per process; the least recently used are dropped beyond this
+
+# --- Helper Functions ---
+
+_hash_memo = collections.OrderedDict()
+_hash_memo_lock = threading.Lock()
+
+def file_content_hash(file_path, chunk_size=1024 * 1024):
+    """
+    Returns the SHA-256 hex digest of a file's content.
+    The digest is memoized per process on (path, size, mtime) so that several
+    pipeline stages looking up the same file only hash it once. The memo
+    keeps the HASH_MEMO_SIZE most recently used digests, so long-running
+    processes (watch mode, the ingestion service) do not grow it forever.
+    """
+    stat = os.stat(file_path)
+    memo_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    with _hash_memo_lock:
+        if memo_key in _hash_memo:
+            _hash_memo.move_to_end(memo_key)
+            return _hash_memo[memo_key]
+
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    content_hash = digest.hexdigest()
+    with _hash_memo_lock:
+        _hash_memo[memo_key] = content_hash
+        while len(_hash_memo) > HASH_MEMO_SIZE:
+            _hash_memo.popitem(last=False)
+    return content_hash
+
+
+class InvoiceCache:
+    """
+    Persistent SQLite cache for pipeline stage outputs (extracted text, parsed fields).
+    Entries are keyed by file content hash, stage name and a settings string,
+    so changing OCR/extractor settings never returns stale results.
+    Values are stored as JSON. When the total stored size exceeds max_bytes,
+    the least recently used entries are evicted.
+    """
+
+    def __init__(self, db_path, max_bytes=256 * 1024 * 1024):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")  # Lets parallel batch workers share the cache file
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS cache_entries (
+                content_hash TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                settings TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (content_hash, stage, settings)
+            )"""
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_last_used ON cache_entries (last_used)")
+        self.conn.commit()
+
+    def _settings_key(self, settings):
+        return f"v{CACHE_VERSION}|{settings}"
+
+    def get(self, content_hash, stage, settings=""):
+        """
+        Returns the cached value for (content_hash, stage, settings), or None on a miss.
+        A hit refreshes the entry's LRU timestamp.
+        """
+        settings_key = self._settings_key(settings)
+        row = self.conn.execute(
+            "SELECT value FROM cache_entries WHERE content_hash = ? AND stage = ? AND settings = ?",
+            (content_hash, stage, settings_key),
+        ).fetchone()
+        if row is None:
+            return None
+        self.conn.execute(
+            "UPDATE cache_entries SET last_used = ? WHERE content_hash = ? AND stage = ? AND settings = ?",
+            (time.time(), content_hash, stage, settings_key),
+        )
+        self.conn.commit()
+        return json.loads(row[0])
+
+    def set(self, content_hash, stage, value, settings=""):
+        """
+        Stores a JSON-serializable value and evicts old entries if the cache is over its size limit.
+        """
+        payload = json.dumps(value)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO cache_entries (content_hash, stage, settings, value, size, last_used) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (content_hash, stage, self._settings_key(settings), payload, len(payload), time.time()),
+        )
+        self.conn.commit()
+        self.evict()
+
+    def total_size(self):
+        """Returns the total size in bytes of all cached values."""
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()[0]
+
+    def evict(self):
+        """
+        Deletes least recently used entries until the cache fits in max_bytes.
+        Returns the number of entries removed.
+        """
+        excess = self.total_size() - self.max_bytes
+        if excess <= 0:
+            return 0
+        removed = 0
+        rows = self.conn.execute(
+            "SELECT rowid, size FROM cache_entries ORDER BY last_used ASC"
+        ).fetchall()
+        for rowid, size in rows:
+            if excess <= 0:
+                break
+            self.conn.execute("DELETE FROM cache_entries WHERE rowid = ?", (rowid,))
+            excess -= size
+            removed += 1
+        self.conn.commit()
+        return removed
+
+    def invalidate(self, content_hash=None, stage=None):
+        """
+        Removes cached entries. With no arguments the whole cache is cleared;
+        otherwise only entries matching the given content hash and/or stage.
+        """
+        query = "DELETE FROM cache_entries"
+        conditions, params = [], []
+        if content_hash is not None:
+            conditions.append("content_hash = ?")
+            params.append(content_hash)
+        if stage is not None:
+            conditions.append("stage = ?")
+            params.append(stage)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        self.conn.execute(query, params)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+_open_caches = threading.local()
+
+def get_cache(db_path, max_bytes=256 * 1024 * 1024):
+    """
+    Returns a shared InvoiceCache for db_path, opened once per process and
+    thread. (SQLite connections cannot be shared across worker processes,
+    and sqlite3 refuses to use a connection from another thread.) The caches
+    are kept in thread-local storage, so a thread's connections are closed
+    when it exits instead of accumulating in threads that come and go.
+    """
+    caches = _open_caches.__dict__.setdefault("caches", {})
+    key = (os.getpid(), os.path.abspath(db_path))
+    cache = caches.get(key)
+    if cache is None:
+        cache = InvoiceCache(db_path, max_bytes=max_bytes)
+        caches[key] = cache
+    cache.max_bytes = max_bytes
+    return cache
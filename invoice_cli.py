@@ -0,0 +1,131 @@
+"""
+Command line interface for batch processing invoices.
+
+  process  Extracts every invoice in a directory into an Excel file (plus
+           optional CSV/SQLite/Parquet outputs). With --shard i/n only the
+           files of shard i of n are processed, so several machines can
+           split one archive: files are assigned by a hash of their name.
+  merge    Combines the Excel outputs of the shards into one workbook,
+           ordered by file name.
+  serve    Runs the HTTP ingestion service (see invoice_service.py): invoice
+           files are POSTed, queued and processed by a pool of workers.
+
+Defaults come from the configuration in invoice_processor.py.
+
+Usage:
+    python invoice_cli.py process --input invoices --output invoice_data.xlsx
+    python invoice_cli.py process --input /archive --shard 2/4 --workers 8
+    python invoice_cli.py process --input invoices --incremental --extra-output invoice_data.csv
+    python invoice_cli.py merge --output invoice_data.xlsx invoice_data.shard-*-of-4.xlsx
+    python invoice_cli.py serve --port 8765 --workers 4 --queue-size 200
+"""
+import argparse
+import os
+import sys
+
+import invoice_processor
+import invoice_service
+
+
+def parse_shard(value):
+    """Parses "i/n" (1 <= i <= n) into (i, n)."""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/n, e.g. 1/4, got {value!r}")
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"shard index must be between 1 and {count}, got {index}")
+    return index, count
+
+
+def shard_output_path(output_file, shard):
+    """invoice_data.xlsx -> invoice_data.shard-2-of-4.xlsx"""
+    base, extension = os.path.splitext(output_file)
+    return f"{base}.shard-{shard[0]}-of-{shard[1]}{extension}"
+
+
+def run_process(args):
+    output_file = args.output
+    extra_outputs = args.extra_output
+    if output_file is None:
+        output_file = invoice_processor.OUTPUT_EXCEL_FILE
+        if args.shard:
+            output_file = shard_output_path(output_file, args.shard)
+    if args.shard and extra_outputs is None:
+        extra_outputs = [shard_output_path(path, args.shard) for path in invoice_processor.EXTRA_OUTPUT_FILES]
+
+    if args.watch:
+        invoice_processor.watch_invoices(
+            args.input, output_file, args.workers, poll_interval=args.poll_seconds,
+            extra_outputs=extra_outputs, shard=args.shard,
+        )
+        return 0
+    if args.incremental:
+        timings = invoice_processor.process_invoices_incremental(
+            args.input, output_file, args.workers, extra_outputs=extra_outputs, shard=args.shard,
+        )
+    else:
+        timings = invoice_processor.process_invoices(
+            args.input, output_file, args.workers, extra_outputs=extra_outputs, shard=args.shard,
+        )
+    if timings is None:  # The input directory does not exist
+        return 1
+    return 1 if any(timing["status"] == "error" for timing in timings) else 0
+
+
+def run_merge(args):
+    missing = [path for path in args.shard_files if not os.path.exists(path)]
+    if missing:
+        print(f"Error: shard output(s) not found: {', '.join(missing)}")
+        return 1
+    count = invoice_processor.merge_outputs(args.shard_files, args.output, extra_outputs=args.extra_output)
+    print(f"Merged {len(args.shard_files)} shard(s) into {args.output}: {count} row(s).")
+    return 0
+
+
+def run_serve(args):
+    invoice_service.serve(args.host, args.port, args.workers, args.queue_size)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    process = commands.add_parser("process", help="Process a directory of invoices")
+    process.add_argument("--input", default=invoice_processor.INVOICE_DIR, help="Directory with the invoice files")
+    process.add_argument("--output", help="Excel file to write (with --shard, defaults to <name>.shard-i-of-n.xlsx)")
+    process.add_argument(
+        "--extra-output", action="append", metavar="PATH",
+        help="Also write the rows to this .csv, .sqlite/.db or .parquet file (repeatable)",
+    )
+    process.add_argument("--workers", type=int, help="Worker processes (default: MAX_WORKERS)")
+    process.add_argument("--shard", type=parse_shard, metavar="I/N", help="Only process shard I of N (e.g. 1/4)")
+    mode = process.add_mutually_exclusive_group()
+    mode.add_argument("--incremental", action="store_true", help="Only process new or changed files and append their rows")
+    mode.add_argument("--watch", action="store_true", help="Keep running and process invoices as they arrive")
+    process.add_argument("--poll-seconds", type=float, help="Polling interval of --watch (default: WATCH_POLL_SECONDS)")
+    process.set_defaults(func=run_process)
+
+    merge = commands.add_parser("merge", help="Merge the Excel outputs of several shards")
+    merge.add_argument("shard_files", nargs="+", metavar="SHARD_OUTPUT", help="Excel files written by process --shard")
+    merge.add_argument("--output", default=invoice_processor.OUTPUT_EXCEL_FILE, help="Merged Excel file to write")
+    merge.add_argument("--extra-output", action="append", metavar="PATH", help="Also write the merged rows to this file (repeatable)")
+    merge.set_defaults(func=run_merge)
+
+    serve = commands.add_parser("serve", help="Run the HTTP ingestion service")
+    serve.add_argument("--host", help="Address to listen on (default: SERVICE_HOST, 127.0.0.1)")
+    serve.add_argument("--port", type=int, help="Port to listen on (default: SERVICE_PORT)")
+    serve.add_argument("--workers", type=int, help="Files processed at the same time (default: SERVICE_WORKERS)")
+    serve.add_argument("--queue-size", type=int, help="Files that may wait for a worker before uploads get 429 (default: SERVICE_QUEUE_SIZE)")
+    serve.set_defaults(func=run_serve)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+import datetime
+import itertools
+import re
+
+try:
+    import pandas  # Optional: needed for DataFrames only (installed with streamlit)
+except ImportError:
+    pandas = None
+
+# --- Configuration ---
+DATE_DAY_FIRST = True  # Read numeric dates such as 03/04/2024 as day/month/year (False: month/day/year)
+FRAME_BATCH_ROWS = 10_000  # Records converted to typed columns at a time
+
+# Typed pandas DataFrames of parsed invoices. invoice_dataframe consumes records (the dicts
+# produced by parse_invoice_text, e.g. from invoice_processor.iter_invoices) in batches, so
+# only one batch of records is held besides the typed columns. Columns:
+#   invoice_number, vendor_name, file_name, status   string
+#   total_amount                                     float64 (NaN if missing)
+#   invoice_date                                     datetime64 (NaT if missing or unreadable)
+#   invoice_date_text                                string, the date as found in the invoice
+
+COLUMN_DTYPES = {
+    "invoice_number": "string",
+    "invoice_date": "datetime64[ns]",
+    "invoice_date_text": "string",
+    "total_amount": "float64",
+    "vendor_name": "string",
+    "file_name": "string",
+    "status": "string",
+}
+
+_NUMERIC_DATE_FORMATS = {
+    True: ("%d/%m/%Y", "%d/%m/%y", "%m/%d/%Y", "%m/%d/%y"),
+    False: ("%m/%d/%Y", "%m/%d/%y", "%d/%m/%Y", "%d/%m/%y"),
+}
+_TEXT_DATE_FORMATS = ("%d %b %Y", "%d %B %Y", "%d %b %y", "%d %B %y", "%b %d %Y", "%B %d %Y", "%b %d %y", "%B %d %y")
+
+# --- Helper Functions ---
+
+def parse_invoice_date(text, day_first=None):
+    """
+    Parses a date as extracted by parse_invoice_text ("03/04/2024",
+    "3-4-24", "5 March 2024", "Mar 5, 2024", ...). Numeric dates are read
+    day first when DATE_DAY_FIRST (or day_first) is set, falling back to the
+    other order when that is not a valid date. Returns a datetime.datetime,
+    or None.
+    """
+    if not text:
+        return None
+    day_first = DATE_DAY_FIRST if day_first is None else day_first
+    value = re.sub(r"\s+", " ", re.sub(r"[,.]", " ", str(text))).strip()
+    if re.search(r"[A-Za-z]", value):
+        value = re.sub(r"\b(Sept)\w*", "Sep", value.title())
+        formats = _TEXT_DATE_FORMATS
+    else:
+        value = value.replace("-", "/").replace(" ", "")
+        formats = _NUMERIC_DATE_FORMATS[bool(day_first)]
+    for date_format in formats:
+        try:
+            return datetime.datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+    return None
+
+def _parse_amount(value):
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _typed_batch(records):
+    columns = {
+        "invoice_number": [record.get("invoice_number") for record in records],
+        "invoice_date": [parse_invoice_date(record.get("invoice_date")) for record in records],
+        "invoice_date_text": [record.get("invoice_date") for record in records],
+        "total_amount": [_parse_amount(record.get("total_amount")) for record in records],
+        "vendor_name": [record.get("vendor_name") for record in records],
+        "file_name": [record.get("file_name") for record in records],
+        "status": [record.get("status") or None for record in records],
+    }
+    frame = pandas.DataFrame({name: pandas.Series(values, dtype="object") for name, values in columns.items()})
+    frame["invoice_date"] = pandas.to_datetime(frame["invoice_date"])
+    return frame.astype(COLUMN_DTYPES)
+
+def invoice_dataframe(records, batch_rows=None):
+    """
+    Builds a DataFrame with the COLUMN_DTYPES columns from an iterable of
+    invoice records, converting batch_rows (default FRAME_BATCH_ROWS)
+    records at a time. Records may be a generator; it is consumed once.
+    """
+    if pandas is None:
+        raise RuntimeError("DataFrames need the pandas package (pip install pandas).")
+    records = iter(records)
+    batch_rows = batch_rows or FRAME_BATCH_ROWS
+    frames = []
+    while True:
+        batch = list(itertools.islice(records, batch_rows))
+        if not batch:
+            break
+        frames.append(_typed_batch(batch))
+    if not frames:
+        return _typed_batch([])
+    return pandas.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
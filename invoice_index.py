@@ -0,0 +1,113 @@
+import os
+import sqlite3
+import threading
+
+# Duplicate-invoice index of an Excel ledger. Every invoice row written to the ledger is
+# recorded by its record key (normalized vendor, invoice number and total; built by
+# invoice_processor) and, when known, the content hash of its source file, so checking a
+# new invoice is one primary-key lookup instead of a scan of the workbook.
+#
+# The index stores the size and mtime of the ledger it describes. If the ledger was changed
+# by anything else (edited by hand, replaced by an upload), the record keys are rebuilt from
+# the ledger in one read-only pass. Content hashes cannot be recovered from the ledger, but
+# they are kept across rebuilds and only count while their record is still in the ledger.
+
+# --- Helper Functions ---
+
+def index_path_for(ledger_path):
+    """Returns the index file kept next to a ledger."""
+    return ledger_path + ".index.sqlite"
+
+def ledger_signature(ledger_path):
+    """Returns "path:size:mtime_ns" of a ledger file, or "" if there is none."""
+    if not ledger_path or not os.path.exists(ledger_path):
+        return ""
+    stat = os.stat(ledger_path)
+    return f"{os.path.abspath(ledger_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class DuplicateIndex:
+    """
+    SQLite index of the invoices in one ledger. add() calls are part of an
+    open transaction until commit() (after the ledger was written) or
+    rollback() (if writing failed), so the index never lists rows that did
+    not reach the ledger.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS records (record_key TEXT PRIMARY KEY, file_name TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS content_hashes (content_hash TEXT PRIMARY KEY, record_key TEXT NOT NULL)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+
+    def _signature(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE name = 'ledger'").fetchone()
+        return row[0] if row else None
+
+    def is_synced(self, ledger_path):
+        """True if the index was last committed for the ledger as it is now."""
+        return self._signature() == ledger_signature(ledger_path)
+
+    def rebuild(self, ledger_path, keyed_rows):
+        """
+        Replaces the record keys with keyed_rows, an iterable of
+        (record_key, file_name) read from the ledger at ledger_path
+        (None for an empty ledger). Returns the number of records.
+        """
+        with self.conn:
+            self.conn.execute("DELETE FROM records")
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO records (record_key, file_name) VALUES (?, ?)",
+                ((key, file_name) for key, file_name in keyed_rows if key),
+            )
+            self.conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('ledger', ?)", (ledger_signature(ledger_path),))
+        return self.conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def find_key(self, record_key):
+        """Returns the file name recorded for record_key, or None."""
+        row = self.conn.execute("SELECT file_name FROM records WHERE record_key = ?", (record_key,)).fetchone()
+        return row[0] if row else None
+
+    def find_hash(self, content_hash):
+        """Returns the file name of the ledger row read from a file with this content, or None."""
+        row = self.conn.execute(
+            "SELECT records.file_name FROM content_hashes JOIN records USING (record_key) WHERE content_hash = ?",
+            (content_hash,),
+        ).fetchone()
+        return row[0] if row else None
+
+    def add(self, record_key, file_name, content_hash=None):
+        self.conn.execute("INSERT OR IGNORE INTO records (record_key, file_name) VALUES (?, ?)", (record_key, file_name))
+        if content_hash:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO content_hashes (content_hash, record_key) VALUES (?, ?)", (content_hash, record_key)
+            )
+
+    def commit(self, ledger_path):
+        """Commits pending additions as the content of the ledger just written to ledger_path."""
+        self.conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('ledger', ?)", (ledger_signature(ledger_path),))
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        self.conn.close()
+
+
+_indexes = threading.local()
+
+def get_duplicate_index(db_path):
+    """
+    Returns a DuplicateIndex for db_path, shared within the current process
+    and thread (like invoice_cache.get_cache, its connection is closed when
+    the thread exits).
+    """
+    indexes = _indexes.__dict__.setdefault("indexes", {})
+    key = (os.getpid(), os.path.abspath(db_path))
+    if key not in indexes:
+        indexes[key] = DuplicateIndex(db_path)
+    return indexes[key]
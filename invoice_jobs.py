@@ -0,0 +1,197 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import invoice_processor
+
+# --- Configuration ---
+JOB_RUNNERS = 2  # Jobs that may run at the same time; further jobs wait in the queue
+FINISHED_JOB_TTL_SECONDS = 3600  # Finished jobs are forgotten after this long
+
+# Background processing for the Streamlit app. A job processes a list of invoice files
+# with the same pipeline as process_invoices (invoice_processor.iter_invoices) on a
+# worker thread, so the script thread only submits the job and polls it. Jobs live in this
+# process; Streamlit sessions keep just the job ID.
+
+_runner = None
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+class InvoiceJob:
+    """
+    State of one background processing job. Results are added as each file
+    completes; read them through snapshot() from other threads.
+    status is one of "queued", "running", "cancelling", "cancelled", "done", "failed".
+    """
+
+    def __init__(self, file_paths, output_file, existing_excel_path=None, workers=None, extra_outputs=None):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.file_paths = list(file_paths)
+        self.output_file = output_file
+        self.existing_excel_path = existing_excel_path
+        self.extra_outputs = list(extra_outputs or [])
+        self.workers = workers or invoice_processor.MAX_WORKERS
+        self.status = "queued"
+        self.rows = []
+        self.errors = []
+        self.duplicates = []
+        self.timings = []
+        self.completed = 0
+        self.output_written = False
+        self.error = None
+        self.finished_at = None
+        self._cancel_event = threading.Event()
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        """
+        Requests cancellation. Files not started yet are skipped. Files being
+        processed are killed when they run under the resource governor
+        (FILE_TIMEOUT_SECONDS / MAX_FILE_MEMORY_BYTES), otherwise finished first.
+        """
+        self._cancel_event.set()
+        with self._lock:
+            if self.status in ("queued", "running"):
+                self.status = "cancelling"
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def finished(self):
+        return self.status in ("cancelled", "done", "failed")
+
+    def snapshot(self):
+        """Returns a consistent copy of the job's progress for display."""
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "status": self.status,
+                "total": len(self.file_paths),
+                "completed": self.completed,
+                "rows": list(self.rows),
+                "errors": list(self.errors),
+                "duplicates": list(self.duplicates),
+                "timings": list(self.timings),
+                "output_file": self.output_file if self.output_written else None,
+                "extra_outputs": [path for path in self.extra_outputs if os.path.exists(path)] if self.output_written else [],
+                "error": self.error,
+            }
+
+    def _add_result(self, file_path, invoice_details, error, timing):
+        with self._lock:
+            self.completed += 1
+            if error:
+                self.errors.append(f"{os.path.basename(file_path)}: {error}")
+            elif invoice_details:
+                self.rows.append(invoice_details)
+            elif invoice_details is None:
+                self.errors.append(f"{os.path.basename(file_path)}: no text could be extracted")
+            if timing:
+                self.timings.append(timing)
+
+    def _add_duplicates(self, file_names, completed=False):
+        """Records files skipped as already in the ledger; their rows are dropped."""
+        file_names = set(file_names)
+        with self._lock:
+            if completed:
+                self.completed += len(file_names)
+            self.duplicates += sorted(file_names)
+            self.rows = [row for row in self.rows if row.get("file_name") not in file_names]
+
+    def _set_status(self, status):
+        with self._lock:
+            self.status = status
+
+
+def _run_files(job, file_paths):
+    # In completion order, so progress shows files as they finish. A cancel stops the
+    # generator, which cancels queued files and kills the governed ones still running.
+    results = invoice_processor.iter_invoices(file_paths, job.workers, ordered=False, stop_event=job._cancel_event)
+    try:
+        for file_path, invoice_details, error, timing in results:
+            job._add_result(file_path, invoice_details, error, timing)
+            if job.cancelled:
+                break
+    finally:
+        results.close()
+
+def _run_job(job):
+    """
+    Job body, run on a runner thread. Processes the files, then writes the
+    rows that completed (also after a cancel) to the job's Excel output.
+    When appending, files already in the existing ledger are skipped before
+    extraction, and rows found to be duplicates are not written.
+    """
+    if job.cancelled:
+        job._set_status("cancelled")
+        job.finished_at = time.time()
+        return
+    with job._lock:
+        if job.status == "queued":
+            job.status = "running"
+    try:
+        file_paths, content_hashes = job.file_paths, {}
+        if job.existing_excel_path:
+            file_paths, content_hashes, known_paths = invoice_processor._find_known_files(
+                job.file_paths, job.output_file, job.existing_excel_path
+            )
+            job._add_duplicates([os.path.basename(path) for path in known_paths], completed=True)
+        _run_files(job, file_paths)
+        rows = sorted(job.snapshot()["rows"], key=lambda row: row.get("file_name", ""))
+        if rows:
+            output_errors = []
+            duplicates = invoice_processor.write_outputs(
+                rows, [job.output_file] + job.extra_outputs, existing_excel_path=job.existing_excel_path,
+                content_hashes=content_hashes, output_errors=output_errors,
+            )
+            job._add_duplicates(duplicates)
+            with job._lock:
+                job.errors += output_errors  # An extra output that failed; the others were written
+            job.output_written = True
+        job._set_status("cancelled" if job.cancelled else "done")
+    except Exception as e:
+        job.error = f"{type(e).__name__}: {e}"
+        job._set_status("failed")
+    finally:
+        job.finished_at = time.time()
+
+def _forget_finished_jobs():
+    now = time.time()
+    for job_id, job in list(_jobs.items()):
+        if job.finished and job.finished_at and now - job.finished_at > FINISHED_JOB_TTL_SECONDS:
+            del _jobs[job_id]
+
+def submit_job(file_paths, output_file, existing_excel_path=None, workers=None, extra_outputs=None):
+    """
+    Queues a job that processes file_paths and writes the results to
+    output_file (appending to existing_excel_path if given) and to the
+    CSV/SQLite/Parquet files in extra_outputs.
+    Returns the job ID; the job runs on a background thread.
+    """
+    global _runner
+    job = InvoiceJob(file_paths, output_file, existing_excel_path, workers, extra_outputs)
+    with _jobs_lock:
+        _forget_finished_jobs()
+        if _runner is None:
+            _runner = ThreadPoolExecutor(max_workers=JOB_RUNNERS, thread_name_prefix="invoice-job")
+        _jobs[job.job_id] = job
+        _runner.submit(_run_job, job)
+    return job.job_id
+
+def get_job(job_id):
+    """Returns the InvoiceJob with this ID, or None if it is unknown or was forgotten."""
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+def cancel_job(job_id):
+    """Requests cancellation of a job. Returns False if the job is unknown."""
+    job = get_job(job_id)
+    if job is None:
+        return False
+    job.cancel()
+    return True
@@ -0,0 +1,141 @@
+import json
+import os
+import time
+
+from invoice_cache import file_content_hash
+
+# --- Configuration ---
+MANIFEST_VERSION = 1  # Bump when the entry format changes; an older manifest is then rebuilt from scratch
+RETRY_STATUSES = ("error", "empty", "quarantined")  # Outcomes that may be transient; see diff_directory
+WRITTEN_STATUSES = ("ok", "quarantined")  # Outcomes whose row is in the output
+
+# --- Helper Functions ---
+
+def manifest_path_for(output_file):
+    """
+    Returns the default manifest location for an output Excel file:
+    it lives next to the output, so each output has its own manifest.
+    """
+    return output_file + ".manifest.json"
+
+def load_manifest(manifest_path):
+    """
+    Loads a processed-file manifest. Returns an empty manifest if the file
+    does not exist, cannot be read or was written by another version.
+    """
+    empty = {"version": MANIFEST_VERSION, "files": {}}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return empty
+    except (OSError, ValueError) as e:
+        print(f"Could not read manifest {manifest_path}: {e}. Starting a new one.")
+        return empty
+    if manifest.get("version") != MANIFEST_VERSION or not isinstance(manifest.get("files"), dict):
+        print(f"Manifest {manifest_path} was written by another version. Starting a new one.")
+        return empty
+    return manifest
+
+def save_manifest(manifest, manifest_path):
+    """
+    Writes the manifest atomically (temporary file + rename), so an
+    interrupted run never leaves a truncated manifest behind.
+    """
+    temp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(temp_path, manifest_path)
+
+def scan_directory(invoice_dir, extensions, exclude=()):
+    """
+    Returns {file_name: (size, mtime_ns)} for the regular files in
+    invoice_dir with one of the given extensions. Only stats the files.
+    exclude lists absolute paths to leave out (e.g. the output file).
+    """
+    exclude = {os.path.abspath(path) for path in exclude}
+    signatures = {}
+    with os.scandir(invoice_dir) as entries:
+        for entry in entries:
+            if not entry.name.lower().endswith(extensions) or not entry.is_file():
+                continue
+            if os.path.abspath(entry.path) in exclude:
+                continue
+            stat = entry.stat()
+            signatures[entry.name] = (stat.st_size, stat.st_mtime_ns)
+    return signatures
+
+def _retry_due(entry, max_attempts):
+    return entry["status"] in RETRY_STATUSES and entry.get("attempts", 1) < max_attempts
+
+def diff_directory(invoice_dir, manifest, signatures, max_attempts=1):
+    """
+    Compares a directory scan against the manifest.
+    Files whose size and mtime match their manifest entry are unchanged
+    without being read. Otherwise the content hash decides: a file that was
+    only touched keeps its entry (with the new size/mtime recorded).
+    Unchanged files whose last outcome was one of RETRY_STATUSES count as
+    changed until they were processed max_attempts times.
+    Returns (changed, deleted): file names to (re)process, and manifest
+    entries whose file no longer exists.
+    """
+    entries = manifest["files"]
+    changed = []
+    for file_name, (size, mtime_ns) in sorted(signatures.items()):
+        entry = entries.get(file_name)
+        if entry and entry["size"] == size and entry["mtime_ns"] == mtime_ns:
+            if _retry_due(entry, max_attempts):
+                changed.append(file_name)
+            continue
+        if entry:
+            try:
+                content_hash = file_content_hash(os.path.join(invoice_dir, file_name))
+            except OSError:
+                continue  # Vanished or unreadable; picked up on the next scan
+            if content_hash == entry["content_hash"]:
+                entry["size"], entry["mtime_ns"] = size, mtime_ns
+                if _retry_due(entry, max_attempts):
+                    changed.append(file_name)
+                continue
+        changed.append(file_name)
+    deleted = sorted(set(entries) - set(signatures))
+    return changed, deleted
+
+def record_entry(manifest, file_name, file_path, signature, status, row):
+    """
+    Stores the outcome for one processed file. status is "ok" (row holds the
+    parsed invoice details), "empty" (no text extracted), "error",
+    "quarantined" (over a resource limit; row holds its status row) or
+    "duplicate" (same content or invoice as one already in the output; its
+    row, if it was extracted, was not written). attempts counts how often
+    this content was processed in a row.
+    """
+    try:
+        content_hash = file_content_hash(file_path)
+        stat = os.stat(file_path)
+        if (stat.st_size, stat.st_mtime_ns) != tuple(signature):
+            content_hash = None  # Modified while being processed; reprocess on the next run
+    except OSError:
+        content_hash = None
+    previous = manifest["files"].get(file_name)
+    attempts = 1
+    if previous and content_hash and previous["content_hash"] == content_hash:
+        attempts = previous.get("attempts", 1) + 1
+    manifest["files"][file_name] = {
+        "size": signature[0],
+        "mtime_ns": signature[1],
+        "content_hash": content_hash,
+        "status": status,
+        "row": row,
+        "attempts": attempts,
+        "processed_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+def manifest_rows(manifest):
+    """
+    Returns the rows of every file whose row belongs in the output (the
+    parsed invoice details, or the status row of a quarantined file), in
+    file name order.
+    """
+    entries = manifest["files"]
+    return [entries[name]["row"] for name in sorted(entries) if entries[name]["status"] in WRITTEN_STATUSES and entries[name]["row"]]
@@ -3,8 +3,28 @@ from PIL import Image
 import os
 import openpyxl
 import re
+import functools
+import hashlib
+import itertools
+import sqlite3
+import collections
+import contextvars
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 import PyPDF2  # Added for PDF text extraction
-from pdf2image import convert_from_path  # Added for PDF to image conversion
+from pdf2image import convert_from_path, pdfinfo_from_path  # Added for PDF to image conversion
+from invoice_cache import file_content_hash, get_cache
+from excel_stream import HeaderMismatchError, append_rows_to_xlsx, missing_headers
+from image_preprocessing import estimate_text_height, get_preset, prepare_for_decoding, preprocess_image, suggest_dpi
+from image_tiles import stitch_tile_lines, tile_boxes
+from vendor_templates import get_template_store, group_lines, learn_bands, lines_to_text, merge_bands, split_stacked_words, stack_bands, words_from_data
+from ocr_backends import get_ocr_backend, resolve_backend_name
+from pdf_text_backends import get_pdf_text_backend, needs_ocr, resolve_backend_name as resolve_pdf_text_backend_name, select_backend, use_backend
+from invoice_index import get_duplicate_index, index_path_for
+from invoice_manifest import WRITTEN_STATUSES, diff_directory, load_manifest, manifest_path_for, manifest_rows, record_entry, save_manifest, scan_directory
+from output_sinks import sink_for
+from resource_governor import ResourceLimitError, run_isolated
+from invoice_timing import FileTiming, note, record_file, stage, timing_rows, write_timings_jsonl
 
 # --- Configuration ---
 # If Tesseract is not in your PATH, you'll need to set the tesseract_cmd
@@ -18,55 +38,491 @@ from pdf2image import convert_from_path  # Added for PDF to image conversion
 
 INVOICE_DIR = "invoices"  # Relative path to the invoices folder
 OUTPUT_EXCEL_FILE = "invoice_data.xlsx"  # Relative path for the output Excel file
+EXTRA_OUTPUT_FILES = []  # Also write the rows to these files, e.g. ["invoice_data.csv", "invoice_data.sqlite", "invoice_data.parquet"] (see output_sinks.py)
+OUTPUT_BATCH_ROWS = 1000  # Rows handed to every output at a time while they are extracted (see write_outputs)
+MAX_WORKERS = 1  # Worker processes for batch mode. Set > 1 (e.g. os.cpu_count()) to process files in parallel.
+LOOKAHEAD_FILES = None  # Files processed ahead of the consumer of iter_invoices; None means 2 * workers
+INCREMENTAL_MODE = False  # Only process new/changed files and append their rows (see process_invoices_incremental)
+WATCH_MODE = False  # Keep running and process invoices as they arrive (implies incremental mode)
+WATCH_POLL_SECONDS = 1.0  # How often watch mode checks INVOICE_DIR for changes
+INCREMENTAL_MAX_ATTEMPTS = 3  # Incremental runs that process an unchanged file which failed, came out empty or was quarantined
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tiff', '.bmp', '.gif')
+MIN_PAGE_TEXT_CHARS = 50  # PDF pages whose text layer has fewer non-whitespace characters than this are OCR'd instead
+PDF_TEXT_BACKEND = "auto"  # Text layer extraction: "pypdf2", "pdftotext" (poppler) or "auto" (see pdf_text_backends.py)
+PDFTOTEXT_CMD = "pdftotext"  # e.g. r"C:\path\to\poppler-xx.xx.x\bin\pdftotext.exe" if it is not in your PATH
+PDFTOTEXT_ARGS = ""  # Extra pdftotext options, e.g. "-layout"
+PDF_TEXT_SAMPLE_FILES = 3  # PDFs of a batch that "auto" benchmarks the backends on before choosing one
+SUPPORTED_EXTENSIONS = IMAGE_EXTENSIONS + ('.pdf', '.txt')
+
+OCR_LANG = "eng"  # Tesseract language(s), e.g. "eng+ara"
+OCR_CONFIG = ""  # Extra Tesseract command line options, e.g. "--psm 6"
+OCR_BACKEND = "pytesseract"  # "pytesseract" (one process per image), "batch" (one process per OCR_BATCH_PAGES pages, opt-in), "tesserocr" (engine kept loaded) or "auto" (tesserocr if installed, else pytesseract)
+OCR_BATCH_PAGES = 4  # Pages per tesseract call with the batch backend
+OCR_PRESET = "off"  # Image preprocessing before OCR: "off", "fast", "balanced" or "accurate" (see image_preprocessing.py)
+VENDOR_TEMPLATES_ENABLED = False  # Learn per-vendor field regions and OCR only those on repeat vendors' images (see vendor_templates.py)
+VENDOR_TEMPLATES_FILE = ".vendor_templates.sqlite"
+TEMPLATE_HEADER_FRACTION = 0.25  # Top part of the page OCR'd first to identify the vendor
+TEMPLATE_MIN_CONFIDENCE = 70  # Lowest Tesseract word confidence (0-100) accepted on a field's line before falling back to full-page OCR
+TEMPLATE_LEARN_AFTER = 2  # Learn a vendor's template once it has been seen this many times
+TEMPLATE_KEY_LINES = 2  # Letterhead lines of the header strip that identify the vendor (see _supplier_key)
+TEMPLATE_TITLE_WORDS = {"invoice", "tax", "bill", "receipt", "statement", "original", "copy", "page", "of"}  # Lines of only these words do not identify a vendor
+TEMPLATE_MAX_LEARN_FAILURES = 3  # Learning attempts in a row, ever further apart, before a vendor is given up
+OCR_THREADS = 4  # PDF pages OCR'd concurrently per document (keep MAX_WORKERS * OCR_THREADS near the core count)
+OCR_TILE_PIXELS = 16_000_000  # Image frames with more pixels are OCR'd in overlapping tiles of about this size, in parallel on OCR_THREADS threads
+OCR_TILE_OVERLAP = 200  # Pixels shared by neighbouring tiles; must be larger than the tallest text line
+OCR_EARLY_EXIT = False  # OCR PDF pages first, last, then the rest, and stop once every invoice field is found
+MAX_IMAGE_PIXELS = 150_000_000  # Images, and PDF pages at the OCR DPI, with more pixels are quarantined without being decoded
+MAX_OCR_PAGES = 200  # PDFs needing OCR on more pages than this are quarantined
+FILE_TIMEOUT_SECONDS = None  # e.g. 300: wall-clock limit per file; the file is killed and quarantined (runs each file in its own process)
+MAX_FILE_MEMORY_BYTES = None  # e.g. 2 * 1024 ** 3: memory ceiling per file process (POSIX only; also runs each file in its own process)
+PDF_PAGE_CHUNK_SIZE = 4  # PDF pages rasterized at a time; bounds memory use on long documents
+
+# Cache of extracted text and parsed fields, keyed by file content hash and the settings above.
+# Re-processing an unchanged file then costs only a hash and a lookup.
+CACHE_ENABLED = True
+CACHE_FILE = ".invoice_cache.sqlite"
+CACHE_MAX_BYTES = 256 * 1024 * 1024  # Least recently used entries are evicted beyond this size
+PARSER_VERSION = 1  # Bump when parse_invoice_text changes so cached parse results are not reused
+
+EXCEL_HEADERS = ["Invoice Number", "Invoice Date", "Total Amount", "Vendor Name", "File Name", "Status"]
+DUPLICATE_CHECK = True  # Skip invoices already in the output ledger (same source file, or same vendor, number and total; see invoice_index.py)
+
+# Per-file, per-stage timings collected by process_invoices (see invoice_timing.py)
+TIMINGS_JSONL_FILE = None  # e.g. "invoice_timings.jsonl"; one JSON line per file is appended after each batch
+EXCEL_TIMINGS_SHEET = False  # Also add a "Timings" sheet to newly created Excel files
+
+# --- Cache Helpers ---
+
+def _get_cache():
+    """
+    Returns the process-wide InvoiceCache, or None if caching is disabled or unavailable.
+    """
+    if not CACHE_ENABLED:
+        return None
+    try:
+        return get_cache(CACHE_FILE, CACHE_MAX_BYTES)
+    except sqlite3.Error as e:
+        print(f"Cache unavailable at {CACHE_FILE}: {e}. Continuing without cache.")
+        return None
+
+def _cache_get(cache, content_hash, stage, settings):
+    try:
+        return cache.get(content_hash, stage, settings)
+    except sqlite3.Error as e:
+        print(f"Cache lookup failed ({stage}): {e}")
+        return None
+
+def _cache_set(cache, content_hash, stage, value, settings):
+    try:
+        cache.set(content_hash, stage, value, settings)
+    except sqlite3.Error as e:
+        print(f"Cache write failed ({stage}): {e}")
+
+def _ocr_settings():
+    return f"tesseract lang={OCR_LANG} config={OCR_CONFIG} backend={resolve_backend_name(OCR_BACKEND)} preset={OCR_PRESET} templates={VENDOR_TEMPLATES_ENABLED} tiles={OCR_TILE_PIXELS}/{OCR_TILE_OVERLAP}"
+
+def _pdf_text_settings():
+    return _pdf_text_backend().version()
+
+def _pdf_ocr_settings():
+    return f"{_ocr_settings()} early exit={OCR_EARLY_EXIT}"
+
+def _hybrid_pdf_settings():
+    return f"{_pdf_text_settings()}|{_pdf_ocr_settings()}|min page text={MIN_PAGE_TEXT_CHARS} non-space chars"
+
+def _parse_settings():
+    return f"parser v{PARSER_VERSION}|{_hybrid_pdf_settings()}"
+
+def _cached_stage(stage, settings_func):
+    """
+    Decorator for extraction stages that take a file path as first argument.
+    The stage's text output is stored in the cache keyed by the file's content
+    hash and settings_func(). Empty results (failures) are not cached.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(file_path, *args, **kwargs):
+            cache = _get_cache()
+            if cache is None:
+                return func(file_path, *args, **kwargs)
+            try:
+                content_hash = file_content_hash(file_path)
+            except OSError:
+                return func(file_path, *args, **kwargs)  # Let the stage report the unreadable file
+            settings = settings_func()
+            cached_text = _cache_get(cache, content_hash, stage, settings)
+            if cached_text is not None:
+                print(f"Cache hit ({stage}): {file_path}")
+                note(cache_hit=stage)
+                return cached_text
+            text = func(file_path, *args, **kwargs)
+            if text:
+                _cache_set(cache, content_hash, stage, text, settings)
+            return text
+        return wrapper
+    return decorator
 
 # --- Helper Functions ---
 
+@_cached_stage("image_ocr", _ocr_settings)
 def ocr_image(image_path):
     """
     Performs OCR on a given image file.
+    Every frame of a multi-frame TIFF or GIF is OCR'd, and frames larger
+    than OCR_TILE_PIXELS are OCR'd in tiles (see ocr_image_frames).
     Returns the extracted text.
     """
     try:
-        text = pytesseract.image_to_string(Image.open(image_path))
+        preset = get_preset(OCR_PRESET)
+        with Image.open(image_path) as image:
+            _check_image_pixels(image.width, image.height)
+            prepare_for_decoding(image, preset)
+            if getattr(image, "n_frames", 1) > 1 or image.width * image.height > OCR_TILE_PIXELS:
+                text = ocr_image_frames(image, image_path)
+            else:
+                with stage("preprocess"):
+                    prepared, _ = preprocess_image(image, preset)
+                text, vendor_key = None, None
+                if VENDOR_TEMPLATES_ENABLED:
+                    text, vendor_key = _ocr_with_vendor_template(prepared)
+                if text is None:
+                    with stage("ocr"):
+                        text = _ocr_backend().images_to_strings([prepared])[0]
+                    if vendor_key:
+                        _learn_vendor_template(prepared, vendor_key)
+                note(pages=1)
         print(f"Successfully OCR'd image: {image_path}")
         return text
+    except ResourceLimitError:
+        raise
+    except Image.DecompressionBombError as e:
+        raise ResourceLimitError(str(e))
     except Exception as e:
         print(f"Error during OCR for image {image_path}: {e}")
         return ""
 
-def extract_text_from_pdf(pdf_path):
+def ocr_image_frames(image, image_path):
     """
-    Extracts text directly from a PDF file.
+    OCRs the frames of an open image one after another, so only one frame is
+    decoded at a time. Frames up to OCR_TILE_PIXELS are OCR'd in batches
+    like PDF pages; larger frames are cut into overlapping tiles
+    (image_tiles.tile_boxes) that are OCR'd on their own and stitched back
+    into reading order, so preprocessing and Tesseract work on tiles of
+    bounded size. Batches and tiles run concurrently on OCR_THREADS threads,
+    with at most twice that many in flight. Vendor templates are not used.
+    Returns the frames' texts joined in frame order.
+    """
+    frame_count = getattr(image, "n_frames", 1)
+    if MAX_OCR_PAGES and frame_count > MAX_OCR_PAGES:
+        raise ResourceLimitError(f"{frame_count} frames need OCR, limit is {MAX_OCR_PAGES}")
+    batch_size = _ocr_backend().batch_size
+    frame_batches = []  # ([frame index, ...], future of their texts)
+    frame_tiles = {}  # frame index -> (frame size, [(box, future of its lines), ...])
+    in_flight = collections.deque()
+
+    with ThreadPoolExecutor(max_workers=OCR_THREADS) as executor:
+        def submit(func, *args):
+            while len(in_flight) >= 2 * OCR_THREADS:
+                in_flight.popleft().exception()  # Wait; errors are raised when results are collected
+            # Run in a copy of this context so OCR time is recorded against the current file
+            future = executor.submit(contextvars.copy_context().run, func, *args)
+            in_flight.append(future)
+            return future
+
+        batch = []
+        for frame_index in range(frame_count):
+            image.seek(frame_index)
+            _check_image_pixels(image.width, image.height, f"frame {frame_index + 1}")
+            if image.width * image.height > OCR_TILE_PIXELS:
+                boxes = tile_boxes(image.width, image.height, OCR_TILE_PIXELS, OCR_TILE_OVERLAP)
+                print(f"OCR'ing frame {frame_index + 1} of {image_path} in {len(boxes)} tiles")
+                frame_tiles[frame_index] = (image.size, [(box, submit(_ocr_tile, image.crop(box))) for box in boxes])
+                continue
+            batch.append((frame_index, image.copy()))
+            if len(batch) == batch_size:
+                frame_batches.append(([index for index, _ in batch], submit(_ocr_page_images, [frame for _, frame in batch])))
+                batch = []
+        if batch:
+            frame_batches.append(([index for index, _ in batch], submit(_ocr_page_images, [frame for _, frame in batch])))
+
+        frame_texts = {}
+        for frame_indices, future in frame_batches:
+            frame_texts.update(zip(frame_indices, future.result()))
+        for frame_index, ((width, height), tiles) in frame_tiles.items():
+            tile_lines = [(box, future.result()) for box, future in tiles]
+            frame_texts[frame_index] = stitch_tile_lines(tile_lines, width, height)
+    note(pages=frame_count)
+    return "\n".join(frame_texts[frame_index] for frame_index in range(frame_count))
+
+def _ocr_tile(tile):
     """
+    Preprocesses and OCRs one tile of a frame. Tiles are not deskewed (a
+    rotation would move them against their neighbours) nor capped by the
+    preset's max_side. Returns its text lines (vendor_templates.group_lines)
+    in tile pixel coordinates.
+    """
+    preset = dict(get_preset(OCR_PRESET), deskew=False, max_side=None)
+    try:
+        with stage("preprocess"):
+            prepared, _ = preprocess_image(tile, preset)
+        scale = tile.width / prepared.width
+        with stage("ocr"):
+            words = _ocr_words(prepared)
+    finally:
+        tile.close()
+    for word in words:
+        word["left"], word["top"] = word["left"] * scale, word["top"] * scale
+        word["width"], word["height"] = word["width"] * scale, word["height"] * scale
+    return group_lines(words)
+
+def _check_image_pixels(width, height, what="image"):
+    if MAX_IMAGE_PIXELS and width * height > MAX_IMAGE_PIXELS:
+        raise ResourceLimitError(
+            f"{what} has {width * height / 1e6:.0f} megapixels ({width}x{height}), limit is {MAX_IMAGE_PIXELS / 1e6:.0f}"
+        )
+
+def _check_pdf_ocr_limits(pdf_path, page_numbers=None, poppler_path=None):
+    """
+    Raises ResourceLimitError if more than MAX_OCR_PAGES pages would be
+    OCR'd, or if a page would rasterize to more than MAX_IMAGE_PIXELS at the
+    OCR_PRESET's DPI. page_numbers are 1-based; None means every page.
+    Page sizes are read with PyPDF2 and not checked if it cannot read the file.
+    """
+    if page_numbers is None:
+        page_count = int(pdfinfo_from_path(pdf_path, poppler_path=poppler_path)["Pages"])
+        page_numbers = range(1, page_count + 1)
+    if MAX_OCR_PAGES and len(page_numbers) > MAX_OCR_PAGES:
+        raise ResourceLimitError(f"{len(page_numbers)} pages need OCR, limit is {MAX_OCR_PAGES}")
+    if not MAX_IMAGE_PIXELS:
+        return
+    dpi = get_preset(OCR_PRESET)["dpi"]
     try:
         with open(pdf_path, 'rb') as f:
             reader = PyPDF2.PdfReader(f)
-            text = ""
-            for page_num in range(len(reader.pages)):
-                page = reader.pages[page_num]
-                extracted_page_text = page.extract_text()
-                if extracted_page_text:
-                    text += extracted_page_text + "\n"
+            for page_number in page_numbers:
+                box = reader.pages[page_number - 1].mediabox
+                width, height = int(float(box.width) / 72 * dpi), int(float(box.height) / 72 * dpi)
+                _check_image_pixels(width, height, f"page {page_number} at {dpi} DPI")
+    except ResourceLimitError:
+        raise
+    except Exception:
+        pass  # Unreadable for PyPDF2; rasterization will tell
+
+def extract_pdf_page_texts(pdf_path):
+    """
+    Extracts the text layer of each page of a PDF file with PDF_TEXT_BACKEND.
+    Returns a list with one string per page (empty for pages without text).
+    Raises on unreadable PDFs.
+    """
+    with stage("pdf_text_layer"):
+        page_texts = _pdf_text_backend().page_texts(pdf_path)
+    note(pages=len(page_texts))
+    return page_texts
+
+def _pdf_text_backend():
+    return get_pdf_text_backend(PDF_TEXT_BACKEND, PDFTOTEXT_CMD, PDFTOTEXT_ARGS)
+
+def _parsed_field_count(text):
+    return sum(1 for value in parse_invoice_text(text).values() if value is not None)
+
+def select_pdf_text_backend(file_paths):
+    """
+    With PDF_TEXT_BACKEND = "auto", benchmarks the available text layer
+    backends on the first PDF_TEXT_SAMPLE_FILES PDFs among file_paths and
+    uses the fastest one that finds as much text, and as many invoice
+    fields, as the best of them (see pdf_text_backends.select_backend).
+    Done once per process, before files are handed to worker processes.
+    Returns the backend name to pass to them (see _process_invoice_file_isolated).
+    """
+    if PDF_TEXT_BACKEND == "auto":
+        sample_paths = [path for path in file_paths if path.lower().endswith('.pdf')][:PDF_TEXT_SAMPLE_FILES]
+        select_backend(sample_paths, MIN_PAGE_TEXT_CHARS, score=_parsed_field_count, pdftotext_command=PDFTOTEXT_CMD, pdftotext_args=PDFTOTEXT_ARGS)
+    return resolve_pdf_text_backend_name(PDF_TEXT_BACKEND, PDFTOTEXT_CMD, PDFTOTEXT_ARGS)
+
+@_cached_stage("pdf_text", _pdf_text_settings)
+def extract_text_from_pdf(pdf_path):
+    """
+    Extracts text directly from a PDF file.
+    """
+    try:
+        text = ""
+        for extracted_page_text in extract_pdf_page_texts(pdf_path):
+            if extracted_page_text:
+                text += extracted_page_text + "\n"
         print(f"Successfully extracted text directly from PDF: {pdf_path}")
         return text
     except Exception as e:
         print(f"Error extracting text directly from PDF {pdf_path}: {e}")
         return ""
 
-def ocr_pdf_as_images(pdf_path, poppler_path=None):
+def _ocr_backend():
+    return get_ocr_backend(OCR_BACKEND, OCR_LANG, OCR_CONFIG, OCR_BATCH_PAGES)
+
+def _ocr_page_images(images):
+    """
+    Preprocesses a batch of rendered PDF pages (OCR_PRESET), OCRs them with
+    one backend call and releases their bitmaps. Returns one string per image.
+    """
+    preset = get_preset(OCR_PRESET)
+    prepared = []
+    try:
+        with stage("preprocess"):
+            for image in images:
+                prepared.append(preprocess_image(image, preset)[0])
+        with stage("ocr"):
+            return _ocr_backend().images_to_strings(prepared)
+    finally:
+        for image in images + prepared:
+            image.close()
+
+def _page_chunks(page_numbers, chunk_size):
+    """
+    Splits sorted 1-based page numbers into runs of consecutive pages,
+    each at most chunk_size long, so every run can be rendered with one
+    convert_from_path(first_page=..., last_page=...) call.
+    """
+    chunk = []
+    for page_number in page_numbers:
+        if chunk and (page_number != chunk[-1] + 1 or len(chunk) >= chunk_size):
+            yield chunk
+            chunk = []
+        chunk.append(page_number)
+    if chunk:
+        yield chunk
+
+def ocr_pdf_pages(pdf_path, page_numbers=None, poppler_path=None, workers=None, chunk_size=None):
+    """
+    Rasterizes and OCRs pages of a PDF in a streaming fashion.
+    Pages are rendered chunk_size at a time and OCR'd concurrently on a
+    thread pool, in batches of the OCR backend's batch size. The next chunk
+    is rendered while the current one is being OCR'd, so at most two chunks
+    of page images are held in memory regardless of document length.
+    Pages are rendered at the OCR_PRESET's DPI; for presets with a target
+    text height, once the first chunk shows how tall the text is, later
+    chunks are rendered at a lower DPI if that still meets the target.
+    page_numbers are 1-based; None means every page.
+    Returns a dict mapping page number to OCR'd text.
+    """
+    workers = workers or OCR_THREADS
+    chunk_size = chunk_size or PDF_PAGE_CHUNK_SIZE
+    if page_numbers is None:
+        page_count = int(pdfinfo_from_path(pdf_path, poppler_path=poppler_path)["Pages"])
+        page_numbers = range(1, page_count + 1)
+        note(pages=page_count)
+    page_numbers = sorted(page_numbers)
+
+    batch_size = _ocr_backend().batch_size
+    preset = get_preset(OCR_PRESET)
+    dpi = preset["dpi"]
+    dpi_calibrated = preset["target_text_height"] is None  # Nothing to calibrate towards (e.g. preset "off")
+
+    page_texts = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        previous_chunk = []
+        for chunk in _page_chunks(page_numbers, chunk_size):
+            with stage("pdf_rasterize"):
+                images = convert_from_path(
+                    pdf_path, dpi=dpi, grayscale=preset["grayscale"],
+                    first_page=chunk[0], last_page=chunk[-1], poppler_path=poppler_path,
+                )
+            if not dpi_calibrated and images:
+                dpi_calibrated = True
+                text_height = estimate_text_height(images[0].convert("L"))
+                dpi = suggest_dpi(dpi, text_height, preset)
+            current_chunk = []
+            for start in range(0, len(images), batch_size):
+                batch_pages = chunk[start:start + batch_size]
+                print(f"OCR'ing page(s) {batch_pages} of PDF {pdf_path}")
+                # Run in a copy of this context so OCR time is recorded against the current file
+                context = contextvars.copy_context()
+                current_chunk.append((batch_pages, executor.submit(context.run, _ocr_page_images, images[start:start + batch_size])))
+            del images
+            # Wait for the previous chunk before rendering the next one to bound memory
+            for batch_pages, future in previous_chunk:
+                page_texts.update(zip(batch_pages, future.result()))
+            previous_chunk = current_chunk
+        for batch_pages, future in previous_chunk:
+            page_texts.update(zip(batch_pages, future.result()))
+    return page_texts
+
+def _priority_page_order(page_numbers):
+    """
+    Orders pages the way invoice fields are usually laid out: the first page
+    (number, date, vendor), the last page (total), then the rest in order.
+    """
+    page_numbers = sorted(page_numbers)
+    if len(page_numbers) <= 2:
+        return page_numbers
+    return [page_numbers[0], page_numbers[-1]] + page_numbers[1:-1]
+
+def _join_page_texts(page_texts):
+    """
+    Joins {page number: text} in page order, skipping empty pages.
+    """
+    combined_text = ""
+    for page_number in sorted(page_texts):
+        if page_texts[page_number]:
+            combined_text += page_texts[page_number] + "\n"
+    return combined_text
+
+def _all_fields_found(page_texts):
+    return all(value is not None for value in parse_invoice_text(_join_page_texts(page_texts)).values())
+
+def ocr_pdf_pages_until_complete(pdf_path, page_numbers=None, known_texts=None, poppler_path=None):
+    """
+    Lazy, field-driven variant of ocr_pdf_pages. Pages are OCR'd on demand in
+    priority order (first, last, then the rest) and the text gathered so far,
+    together with known_texts ({page number: text} from the text layer), is
+    parsed after every round. OCR stops as soon as parse_invoice_text fills
+    every field, so the remaining pages are never rasterized.
+    The first round OCRs the first and last page together; later rounds
+    OCR up to OCR_THREADS pages concurrently.
+    Returns a dict mapping each OCR'd page number to its text.
+    """
+    known_texts = dict(known_texts or {})
+    if page_numbers is None:
+        page_count = int(pdfinfo_from_path(pdf_path, poppler_path=poppler_path)["Pages"])
+        page_numbers = range(1, page_count + 1)
+        note(pages=page_count)
+    pending = _priority_page_order(page_numbers)
+
+    ocr_texts = {}
+    if known_texts and _all_fields_found(known_texts):
+        return ocr_texts
+    round_size = 2
+    while pending:
+        current_round, pending = pending[:round_size], pending[round_size:]
+        ocr_texts.update(ocr_pdf_pages(pdf_path, page_numbers=current_round, poppler_path=poppler_path))
+        if _all_fields_found({**known_texts, **ocr_texts}):
+            if pending:
+                print(f"All invoice fields found in {pdf_path}; skipping OCR of pages {sorted(pending)}.")
+            break
+        round_size = OCR_THREADS
+    return ocr_texts
+
+@_cached_stage("pdf_ocr", _pdf_ocr_settings)
+def ocr_pdf_as_images(pdf_path, poppler_path=None, workers=None, chunk_size=None):
     """
     Converts PDF pages to images and then performs OCR on them.
-    Returns concatenated text from all pages.
+    Pages are streamed through ocr_pdf_pages in bounded chunks, or with
+    OCR_EARLY_EXIT only until every invoice field is found.
+    Returns concatenated text from all (OCR'd) pages, in page order.
     """
     try:
-        images = convert_from_path(pdf_path, poppler_path=poppler_path)
+        _check_pdf_ocr_limits(pdf_path, poppler_path=poppler_path)
+        if OCR_EARLY_EXIT:
+            page_texts = ocr_pdf_pages_until_complete(pdf_path, poppler_path=poppler_path)
+        else:
+            page_texts = ocr_pdf_pages(pdf_path, poppler_path=poppler_path, workers=workers, chunk_size=chunk_size)
+        note(ocr_pages=len(page_texts))
         combined_text = ""
-        for i, image in enumerate(images):
-            print(f"OCR'ing page {i+1} of PDF {pdf_path}")
-            page_text = pytesseract.image_to_string(image)
-            combined_text += page_text + "\n"
+        for page_number in sorted(page_texts):
+            combined_text += page_texts[page_number] + "\n"
         print(f"Successfully OCR'd PDF as images: {pdf_path}")
         return combined_text
+    except ResourceLimitError:
+        raise
     except Exception as e:
         print(f"Error during OCR for PDF {pdf_path} (as images): {e}")
         print("Make sure Poppler is installed and in your PATH, or poppler_path is set correctly in the script.")
@@ -74,12 +530,58 @@ def ocr_pdf_as_images(pdf_path, poppler_path=None):
         print("On Linux, try: sudo apt-get install poppler-utils")
         return ""
 
+@_cached_stage("pdf_hybrid", _hybrid_pdf_settings)
+def extract_text_from_pdf_hybrid(pdf_path, poppler_path=None):
+    """
+    Extracts text from a PDF, deciding per page between the text layer and OCR.
+    Pages whose text layer (PDF_TEXT_BACKEND) has fewer than MIN_PAGE_TEXT_CHARS
+    non-whitespace characters are rasterized and OCR'd; all other pages use their text layer as is.
+    With OCR_EARLY_EXIT, those pages are OCR'd only until the text layer
+    and the pages OCR'd so far yield every invoice field.
+    Returns the merged text in page order.
+    """
+    try:
+        page_texts = extract_pdf_page_texts(pdf_path)
+    except Exception as e:
+        print(f"Error extracting text directly from PDF {pdf_path}: {e}. Falling back to OCR for all pages.")
+        note(ocr_fallback=True)
+        return ocr_pdf_as_images(pdf_path, poppler_path=poppler_path)
+
+    pages_to_ocr = [
+        page_number for page_number, page_text in enumerate(page_texts, start=1)
+        if needs_ocr(page_text, MIN_PAGE_TEXT_CHARS)
+    ]
+    if pages_to_ocr:
+        print(f"Text layer of {pdf_path} is minimal or empty on pages {pages_to_ocr}. Attempting OCR on those pages.")
+        note(ocr_fallback=True, ocr_pages=len(pages_to_ocr))
+        _check_pdf_ocr_limits(pdf_path, pages_to_ocr, poppler_path=poppler_path)
+        try:
+            if OCR_EARLY_EXIT:
+                known_texts = {page_number: page_text for page_number, page_text in enumerate(page_texts, start=1) if page_number not in pages_to_ocr}
+                ocr_texts = ocr_pdf_pages_until_complete(pdf_path, page_numbers=pages_to_ocr, known_texts=known_texts, poppler_path=poppler_path)
+                note(ocr_pages=len(ocr_texts))
+            else:
+                ocr_texts = ocr_pdf_pages(pdf_path, page_numbers=pages_to_ocr, poppler_path=poppler_path)
+        except Exception as e:
+            print(f"Error during OCR for PDF {pdf_path} (as images): {e}")
+            print("Make sure Poppler is installed and in your PATH, or poppler_path is set correctly in the script.")
+            ocr_texts = {}
+        for page_number, ocr_text in ocr_texts.items():
+            page_texts[page_number - 1] = ocr_text
+
+    combined_text = ""
+    for page_text in page_texts:
+        if page_text:
+            combined_text += page_text + "\n"
+    print(f"Successfully extracted text from PDF: {pdf_path} ({len(ocr_texts) if pages_to_ocr else 0} of {len(page_texts)} pages OCR'd)")
+    return combined_text
+
 def read_text_from_txt(txt_path):
     """
     Reads text directly from a .txt file.
     """
     try:
-        with open(txt_path, 'r', encoding='utf-8') as f:
+        with stage("read_text"), open(txt_path, 'r', encoding='utf-8') as f:
             text = f.read()
         print(f"Successfully read text from: {txt_path}")
         return text
@@ -87,10 +589,123 @@ def read_text_from_txt(txt_path):
         print(f"Error reading text file {txt_path}: {e}")
         return ""
 
+# --- Field Extraction Patterns ---
+# Compiled once at import time. Patterns are written in lower case and run
+# case-sensitively against the lower-cased text, which lets the regex engine
+# use its fast literal-prefix scan (re.IGNORECASE disables it).
+
+# Invoice Number keywords: Invoice No, Invoice #, Invoice Number, Tax Invoice
+# Pattern: Keyword followed by a value (alphanumeric, dashes, etc.)
+INVOICE_NO_PATTERNS = [
+    r"invoice\s*(?:no|number|#|id)[:.\s]*([A-Za-z0-9-]+)",
+    r"tax\s*invoice[:.\s]*([A-Za-z0-9-]+)",
+]
+
+# Invoice Date keywords: Date, Invoice Date, Billing Date
+# Pattern: DD/MM/YYYY, MM/DD/YYYY, DD Mon YYYY, Mon DD YYYY, etc. (in priority order)
+DATE_PATTERNS = [
+    r"date[:\s]*(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})",
+    r"invoice\s*date[:\s]*(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})",
+    r"billing\s*date[:\s]*(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})",
+    r"(\d{1,2}\s(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*[,.]?\s*\d{2,4})",
+    r"((?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\s*\d{1,2}[,.]?\s*\d{2,4})",
+]
+
+# Total Amount keywords: Total, Amount Due, Balance Due, Grand Total, Net Total, Payable Amount, Total Invoice Amount
+AMOUNT_KEYWORDS = [
+    "total amount", "amount due", "balance due", "grand total", "net total",
+    "total payable", "invoice total", "total invoice amount", "total", "amount"
+]
+# Regex to capture amounts like: $1,234.56, 1234.56, 1.234,56 (some European formats)
+AMOUNT_RE = re.compile(r"\$?([\d,]+(?:\.\d{2})?|\d+(?:\.\d{3})*(?:,\d{2})?)")
+
+# Vendor/Client Name keywords: To, Bill To, Client, Sold To, Attention, Attn, Customer
+VENDOR_KEYWORDS = ["to:", "bill to:", "client:", "sold to:", "attention:", "attn:", "customer:"]
+ADDRESS_LINE_RE = re.compile(r"^(\d{1,4}\s|P\.?O\.?\sBox)", re.IGNORECASE)
+COMPANY_SUFFIX_RE = re.compile(r"\b(LTD|LLC|INC|LIMITED|GMBH|SARL|CORP|PLC|CO\.?)\b", re.IGNORECASE)
+
+def _compile_folded(patterns):
+    """
+    Compiles each pattern twice: case-sensitive for the lower-cased text, and
+    case-insensitive as a fallback for texts whose length changes when lower-cased.
+    """
+    return [(re.compile(p), re.compile(p, re.IGNORECASE)) for p in patterns]
+
+def _minimal_keywords(keywords):
+    """
+    Drops keywords that contain another keyword ("grand total" contains "total"):
+    any line matching them also matches the shorter one, so they never decide
+    whether a line is a candidate.
+    """
+    return [k for k in keywords if not any(other != k and other in k for other in keywords)]
+
+_INVOICE_NO_REGEXES = _compile_folded(INVOICE_NO_PATTERNS)
+_DATE_REGEXES = _compile_folded(DATE_PATTERNS)
+_AMOUNT_TRIGGER_KEYWORDS = _minimal_keywords(AMOUNT_KEYWORDS)
+_VENDOR_TRIGGER_KEYWORDS = _minimal_keywords(VENDOR_KEYWORDS)
+
+def _search_first_group(regexes, text, text_lower):
+    """
+    Returns group 1 (from the original text, preserving case) of the first
+    pattern in priority order that matches, or None.
+    """
+    same_offsets = len(text) == len(text_lower)
+    for folded_regex, ignorecase_regex in regexes:
+        if same_offsets:
+            match = folded_regex.search(text_lower)
+            if match:
+                return text[match.start(1):match.end(1)]
+        else:
+            match = ignorecase_regex.search(text)
+            if match:
+                return match.group(1)
+    return None
+
+def _keyword_line_indices(keywords, text_lower):
+    """
+    Returns the sorted indices of lines containing at least one keyword.
+    Keywords are located with str.find over the whole lower-cased text; hit
+    positions are then turned into line numbers by counting newlines between
+    consecutive hits, so lines without keywords are never visited.
+    """
+    positions = []
+    for keyword in keywords:
+        position = text_lower.find(keyword)
+        while position != -1:
+            positions.append(position)
+            position = text_lower.find(keyword, position + 1)
+    positions.sort()
+
+    line_indices = []
+    line_index = 0
+    previous_position = 0
+    for position in positions:
+        line_index += text_lower.count('\n', previous_position, position)
+        previous_position = position
+        if not line_indices or line_indices[-1] != line_index:
+            line_indices.append(line_index)
+    return line_indices
+
+def _parse_amount(amount_str):
+    """
+    Normalizes a captured amount string to a float, or returns None.
+    """
+    amount_str = amount_str.replace(',', '') # Basic normalization
+    if '.' in amount_str and amount_str.count('.') > 1: # e.g. 1.234.567 -> invalid for this simple replace
+        amount_str = amount_str.replace('.', '', amount_str.count('.') -1) # Keep last dot
+    amount_str = amount_str.replace(',', '.') # For formats like 1.234,56 -> 1234.56
+    try:
+        return float(amount_str)
+    except ValueError:
+        return None # Could not convert
+
 def parse_invoice_text(text):
     """
     Parses the OCR'd text to extract invoice details.
     This function attempts to handle variations in field names.
+    Patterns are precompiled and run against the lower-cased text once;
+    lines holding amount or vendor keywords are located up front instead
+    of testing every keyword against every line.
     """
     invoice_data = {
         "invoice_number": None,
@@ -104,113 +719,63 @@ def parse_invoice_text(text):
     text_lower = text.lower() # For case-insensitive keyword searching
 
     # --- Invoice Number --- (Usually more consistent)
-    # Keywords: Invoice No, Invoice #, Invoice Number, Tax Invoice
-    # Pattern: Keyword followed by a value (alphanumeric, dashes, etc.)
-    invoice_no_patterns = [
-        r"invoice\s*(?:no|number|#|id)[:.\s]*([A-Za-z0-9-]+)",
-        r"tax\s*invoice[:.\s]*([A-Za-z0-9-]+)"
-    ]
-    for pattern in invoice_no_patterns:
-        match = re.search(pattern, text_lower)
-        if match:
-            # Extract from original text to preserve case if needed, though usually numbers
-            original_match = re.search(pattern, text, re.IGNORECASE)
-            if original_match:
-                invoice_data["invoice_number"] = original_match.group(1).strip()
-                break
+    invoice_number = _search_first_group(_INVOICE_NO_REGEXES, text, text_lower)
+    if invoice_number:
+        invoice_data["invoice_number"] = invoice_number.strip()
 
     # --- Invoice Date --- (Usually more consistent)
-    # Keywords: Date, Invoice Date, Billing Date
-    # Pattern: DD/MM/YYYY, MM/DD/YYYY, DD Mon YYYY, etc.
-    date_patterns = [
-        r"date[:\s]*(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})",
-        r"invoice\s*date[:\s]*(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})",
-        r"billing\s*date[:\s]*(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})",
-        r"(\d{1,2}\s(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*[,.]?\s*\d{2,4})",
-        r"(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s*\d{1,2}[,.]?\s*\d{2,4}"
-    ]
-    for pattern in date_patterns:
-        match = re.search(pattern, text, re.IGNORECASE) # Dates can have mixed case (e.g. Jan)
-        if match:
-            invoice_data["invoice_date"] = match.group(1).strip()
-            break
+    invoice_date = _search_first_group(_DATE_REGEXES, text, text_lower) # Dates can have mixed case (e.g. Jan)
+    if invoice_date:
+        invoice_data["invoice_date"] = invoice_date.strip()
 
     # --- Total Amount --- (Highly variable keywords)
-    # Keywords: Total, Amount Due, Balance Due, Grand Total, Net Total, Payable Amount, Total Invoice Amount
-    # Pattern: Keyword followed by a currency symbol (optional) and a number (with commas, decimals)
-    amount_keywords = [
-        "total amount", "amount due", "balance due", "grand total", "net total", 
-        "total payable", "invoice total", "total invoice amount", "total", "amount"
-    ]
-    # Regex to capture amounts like: $1,234.56, 1234.56, 1.234,56 (some European formats)
-    amount_regex = r"\$?([\d,]+(?:\.\d{2})?|\d+(?:\.\d{3})*(?:,\d{2})?)" 
-    # More robust amount regex: handles optional currency, commas/periods as separators
     # Looks for a keyword and then tries to find an amount on the same line or next few lines.
-    
     possible_amounts = []
-    for i, line in enumerate(lines):
-        line_lower = line.lower()
-        for keyword in amount_keywords:
-            if keyword in line_lower:
-                # Search for amount on the same line
-                match = re.search(amount_regex, line)
-                if match:
-                    amount_str = match.group(1).replace(',', '') # Basic normalization
-                    if '.' in amount_str and amount_str.count('.') > 1: # e.g. 1.234.567 -> invalid for this simple replace
-                        amount_str = amount_str.replace('.', '', amount_str.count('.') -1) # Keep last dot
-                    amount_str = amount_str.replace(',', '.') # For formats like 1.234,56 -> 1234.56
-                    try:
-                        possible_amounts.append(float(amount_str))
-                    except ValueError:
-                        pass # Could not convert
-                else:
-                    # Check next few lines if no amount on current line
-                    for next_line_idx in range(i + 1, min(i + 3, len(lines))):
-                        match_next = re.search(amount_regex, lines[next_line_idx])
-                        if match_next:
-                            amount_str = match_next.group(1).replace(',', '')
-                            if '.' in amount_str and amount_str.count('.') > 1:
-                                amount_str = amount_str.replace('.', '', amount_str.count('.') -1)
-                            amount_str = amount_str.replace(',', '.')
-                            try:
-                                possible_amounts.append(float(amount_str))
-                                break # Found amount for this keyword
-                            except ValueError:
-                                pass
-                break # Move to next line once a keyword is processed on this line
-    
+    for i in _keyword_line_indices(_AMOUNT_TRIGGER_KEYWORDS, text_lower):
+        # Search for amount on the same line
+        match = AMOUNT_RE.search(lines[i])
+        if match:
+            amount = _parse_amount(match.group(1))
+            if amount is not None:
+                possible_amounts.append(amount)
+        else:
+            # Check next few lines if no amount on current line
+            for next_line_idx in range(i + 1, min(i + 3, len(lines))):
+                match_next = AMOUNT_RE.search(lines[next_line_idx])
+                if match_next:
+                    amount = _parse_amount(match_next.group(1))
+                    if amount is not None:
+                        possible_amounts.append(amount)
+                        break # Found amount for this keyword
+
     if possible_amounts:
         # Often the grand total is the largest amount found, but this is heuristic
-        invoice_data["total_amount"] = max(possible_amounts) 
+        invoice_data["total_amount"] = max(possible_amounts)
         # Alternative: look for specific keywords like "grand total" and prioritize that.
         # For now, max is a simple approach.
 
     # --- Vendor/Client Name --- (Can be very tricky)
-    # Keywords: To, Bill To, Client, Sold To, Attention, Attn, Vendor, From, Supplier
     # Often at the top, or near an address. Sometimes it's just the first prominent name.
-    vendor_keywords = ["to:", "bill to:", "client:", "sold to:", "attention:", "attn:", "customer:"]
-    supplier_keywords = ["from:", "vendor:", "supplier:", "invoice from:"]
-    
-    # Attempt to find client/customer name
     found_vendor = False
-    for i, line in enumerate(lines):
+    for i in _keyword_line_indices(_VENDOR_TRIGGER_KEYWORDS, text_lower):
+        line = lines[i]
         line_lower = line.lower()
-        for keyword in vendor_keywords:
+        for keyword in VENDOR_KEYWORDS:
             if keyword in line_lower:
                 # The name is often on the same line after the keyword, or the next non-empty line
                 potential_name_line = line.split(keyword, 1)[-1].strip()
                 if not potential_name_line and i + 1 < len(lines):
                     potential_name_line = lines[i+1].strip()
-                
+
                 if potential_name_line and len(potential_name_line) > 2: # Basic check
                     # Further refinement: avoid lines that are just addresses or dates
-                    if not re.match(r"^(\d{1,4}\s|P\.?O\.?\sBox)", potential_name_line, re.IGNORECASE) and not re.search(date_patterns[0], potential_name_line, re.IGNORECASE):
+                    if not ADDRESS_LINE_RE.match(potential_name_line) and not _DATE_REGEXES[0][1].search(potential_name_line):
                         invoice_data["vendor_name"] = potential_name_line.split('\n')[0].strip() # Take first line of it
                         found_vendor = True
                         break
         if found_vendor:
             break
-    
+
     # If no client found with keywords, try a more general approach (e.g. first few lines)
     if not found_vendor:
         for i in range(min(5, len(lines))): # Check first 5 lines
@@ -220,115 +785,979 @@ def parse_invoice_text(text):
                 # This is a very rough heuristic, might pick up sender too.
                 # A more robust solution might involve Named Entity Recognition (NER)
                 # or looking for company suffixes (Ltd, Inc, LLC)
-                # For now, let's assume the first suitable line could be it if not found by keywords.
-                # Example: Check for company suffixes
-                if re.search(r"\b(LTD|LLC|INC|LIMITED|GMBH|SARL|CORP|PLC|CO\.?)\b", line_content, re.IGNORECASE):
+                if COMPANY_SUFFIX_RE.search(line_content):
                      invoice_data["vendor_name"] = line_content
                      break
                 # If still no vendor_name, and we haven't found one via keywords, this is a fallback
                 if not invoice_data["vendor_name"] and i < 2: # Only take from first 2 lines as a last resort fallback
                     invoice_data["vendor_name"] = line_content
-                    # break # Commented out to allow company suffix check to override if it comes later in first 5 lines
 
     print(f"Parsed data: {invoice_data}")
     return invoice_data
 
-def write_to_excel(all_invoice_data, output_file, existing_excel_path=None):
+# --- Vendor Templates ---
+
+def _vendor_key(vendor_name):
+    """
+    Normalizes a vendor name for template lookup: lower case, letters and
+    digits only, company suffixes (Ltd, LLC, ...) removed.
+    """
+    if not vendor_name:
+        return None
+    words = re.findall(r"[a-z0-9]+", COMPANY_SUFFIX_RE.sub(" ", vendor_name).lower())
+    return " ".join(words) or None
+
+def _supplier_key(header_lines):
+    """
+    Identifies the supplier of a page by its letterhead: the first
+    TEMPLATE_KEY_LINES lines of the header strip, normalized by _vendor_key.
+    Lines with digits (invoice numbers, dates, amounts change from invoice to
+    invoice), document titles such as "Tax Invoice" (TEMPLATE_TITLE_WORDS)
+    and the customer block (a VENDOR_KEYWORDS line such as "Bill to:" and
+    the line after it) are skipped. parse_invoice_text's vendor_name cannot
+    be used: it is read from that customer block.
+    Returns None if the header has no such lines.
+    """
+    keys = []
+    skip_next = False
+    for line in header_lines:
+        text = line["text"]
+        if any(keyword in text.lower() for keyword in VENDOR_KEYWORDS):
+            skip_next = True  # The customer's name follows the keyword
+            continue
+        if skip_next:
+            skip_next = False
+            continue
+        key = _vendor_key(text)
+        if not key or any(character.isdigit() for character in text) or set(key.split()) <= TEMPLATE_TITLE_WORDS:
+            continue
+        if len(key.replace(" ", "")) >= 3:
+            keys.append(key)
+            if len(keys) == TEMPLATE_KEY_LINES:
+                break
+    return " | ".join(keys) or None
+
+def _template_store():
+    try:
+        return get_template_store(VENDOR_TEMPLATES_FILE)
+    except sqlite3.Error as e:
+        print(f"Vendor templates unavailable at {VENDOR_TEMPLATES_FILE}: {e}")
+        return None
+
+def _ocr_words(image):
+    data = pytesseract.image_to_data(image, lang=OCR_LANG, config=OCR_CONFIG, output_type=pytesseract.Output.DICT)
+    return words_from_data(data)
+
+def _field_matchers(invoice_data):
+    """
+    Returns {field: predicate} telling whether a line of text holds the
+    parsed value of that field.
+    """
+    total = invoice_data["total_amount"]
+    return {
+        "invoice_number": lambda line: invoice_data["invoice_number"] in line,
+        "invoice_date": lambda line: invoice_data["invoice_date"] in line,
+        "vendor_name": lambda line: invoice_data["vendor_name"] in line,
+        "total_amount": lambda line: any(_parse_amount(match.group(1)) == total for match in AMOUNT_RE.finditer(line)),
+    }
+
+def _ocr_with_vendor_template(image):
+    """
+    Template fast path for a page image. The header strip is OCR'd to
+    identify the vendor; if a template was learned for it, only the
+    template's bands are OCR'd (stacked into one image, one Tesseract call).
+    The result is accepted when every field is parsed and each field's line
+    has a confidence of at least TEMPLATE_MIN_CONFIDENCE.
+    Returns (text, vendor_key); text is None when full-page OCR is needed.
+    """
+    store = _template_store()
+    if store is None:
+        return None, None
+    try:
+        header_bottom = max(1, int(image.height * TEMPLATE_HEADER_FRACTION))
+        with stage("template_ocr"):
+            header_lines = group_lines(_ocr_words(image.crop((0, 0, image.width, header_bottom))))
+        vendor_key = _supplier_key(header_lines)
+        if vendor_key is None:
+            return None, None
+        bands = store.get(vendor_key, image.height / image.width)
+        if bands is None:
+            return None, vendor_key
+
+        # The header strip has been OCR'd already; only the rest of each band is needed
+        page_bands = merge_bands(
+            (max(top, TEMPLATE_HEADER_FRACTION), bottom) for top, bottom in bands.values() if bottom > TEMPLATE_HEADER_FRACTION
+        )
+        lines = list(header_lines)
+        if page_bands:
+            stacked, offsets = stack_bands(image, page_bands)
+            with stage("template_ocr"):
+                words = _ocr_words(stacked)
+            for band_words in split_stacked_words(words, offsets):
+                lines += group_lines(band_words)
+        text = lines_to_text(lines)
+        invoice_data = parse_invoice_text(text)
+        if all(value is not None for value in invoice_data.values()):
+            confidences = [
+                max((line["conf"] for line in lines if matches(line["text"])), default=0)
+                for matches in _field_matchers(invoice_data).values()
+            ]
+            if min(confidences) >= TEMPLATE_MIN_CONFIDENCE:
+                store.record_use(vendor_key, hit=True)
+                print(f"Used layout template of vendor '{vendor_key}' ({len(page_bands)} band(s) OCR'd)")
+                return text, vendor_key
+        store.record_use(vendor_key, hit=False)
+        print(f"Layout template of vendor '{vendor_key}' did not match confidently. Falling back to full-page OCR.")
+        return None, vendor_key
+    except (sqlite3.Error, pytesseract.TesseractError) as e:
+        print(f"Vendor template lookup failed: {e}. Falling back to full-page OCR.")
+        return None, None
+
+def _learn_vendor_template(image, vendor_key):
+    """
+    Counts a full-page OCR of vendor_key and, when learning is due (the
+    vendor has been seen TEMPLATE_LEARN_AFTER times, see
+    VendorTemplateStore.learning_due), learns the bands holding each field
+    from Tesseract's word boxes of the whole page. That is a second
+    full-page OCR, so a failed attempt pushes the next one further away and
+    TEMPLATE_MAX_LEARN_FAILURES failures in a row stop learning the vendor.
+    """
+    store = _template_store()
+    if store is None:
+        return
+    try:
+        store.mark_seen(vendor_key)
+        if not store.learning_due(vendor_key, TEMPLATE_LEARN_AFTER, TEMPLATE_MAX_LEARN_FAILURES):
+            return
+        bands = None
+        try:
+            with stage("template_learn"):
+                lines = group_lines(_ocr_words(image))
+            invoice_data = parse_invoice_text(lines_to_text(lines))
+            if all(value is not None for value in invoice_data.values()):
+                bands = learn_bands(lines, image.height, _field_matchers(invoice_data))
+        finally:
+            store.record_learning(vendor_key, bands is not None, TEMPLATE_LEARN_AFTER)
+        if bands:
+            store.save(vendor_key, bands, image.height / image.width)
+            print(f"Learned layout template for vendor '{vendor_key}'")
+        else:
+            print(f"Could not find every field on the page; layout template for vendor '{vendor_key}' not learned.")
+    except (sqlite3.Error, pytesseract.TesseractError) as e:
+        print(f"Could not learn layout template for vendor '{vendor_key}': {e}")
+
+def _excel_row(invoice_data):
+    return [
+        invoice_data.get("invoice_number", ""),
+        invoice_data.get("invoice_date", ""),
+        invoice_data.get("total_amount", ""),
+        invoice_data.get("vendor_name", ""),
+        invoice_data.get("file_name", ""),
+        invoice_data.get("status", ""),  # Empty for invoices, the reason for quarantined files
+    ]
+
+def _duplicate_key(invoice_data):
+    """
+    Key that identifies an invoice in the ledger: normalized vendor, invoice
+    number and total. None if the invoice number or total is missing, as
+    such rows cannot be told apart.
+    """
+    invoice_number = invoice_data.get("invoice_number")
+    total = invoice_data.get("total_amount")
+    if isinstance(total, str):
+        total = _parse_amount(total)
+    if not invoice_number or total is None:
+        return None
+    vendor_name = invoice_data.get("vendor_name")
+    vendor_key = _vendor_key(str(vendor_name)) if vendor_name else None
+    number = re.sub(r"\s+", "", str(invoice_number)).upper()
+    return f"{vendor_key or ''}|{number}|{float(total):.2f}"
+
+def _ledger_rows(ledger_path):
+    """
+    Yields the invoice rows of an Excel file written by this pipeline as
+    invoice details dicts, matching columns by their EXCEL_HEADERS name.
+    The workbook is read in openpyxl's read-only mode, which streams the
+    rows instead of loading every cell.
+    """
+    fields = dict(zip(EXCEL_HEADERS, ["invoice_number", "invoice_date", "total_amount", "vendor_name", "file_name", "status"]))
+    workbook = openpyxl.load_workbook(ledger_path, read_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        columns = {fields[name]: header.index(name) for name in EXCEL_HEADERS if name in header}
+        for row in rows:
+            if not any(value is not None for value in row):
+                continue
+            yield {field: row[column] if column < len(row) else None for field, column in columns.items()}
+    finally:
+        workbook.close()
+
+def _ledger_keys(ledger_path):
+    """
+    Yields (duplicate key, file name) for every invoice row of a ledger,
+    in one streaming read.
+    """
+    for invoice_data in _ledger_rows(ledger_path):
+        yield _duplicate_key(invoice_data), invoice_data.get("file_name")
+
+def _duplicate_index(output_file, ledger_path=None):
+    """
+    Returns the duplicate index of output_file, describing ledger_path (the
+    ledger that will be appended to, or None for a new file). It is rebuilt
+    from the ledger first if the ledger changed since the index was last
+    written. Returns None if the index cannot be used.
+    """
+    try:
+        index = get_duplicate_index(index_path_for(output_file))
+        if not index.is_synced(ledger_path):
+            if ledger_path:
+                count = index.rebuild(ledger_path, _ledger_keys(ledger_path))
+                print(f"Rebuilt duplicate index from {ledger_path}: {count} invoice(s).")
+            else:
+                index.rebuild(None, [])
+        return index
+    except Exception as e:
+        print(f"Duplicate check unavailable for {output_file}: {e}")
+        return None
+
+def _drop_duplicates(all_invoice_data, index, content_hashes):
+    """
+    Returns (new_rows, duplicate_file_names). A row is a duplicate if the
+    content hash of its source file or its duplicate key is in the index.
+    Kept rows are added to the index, so repeats within the batch are
+    dropped as well.
+    """
+    new_rows, duplicates = [], []
+    for invoice_data in all_invoice_data:
+        file_name = invoice_data.get("file_name")
+        content_hash = content_hashes.get(file_name)
+        key = _duplicate_key(invoice_data)
+        existing = index.find_hash(content_hash) if content_hash else None
+        if existing is None and key:
+            existing = index.find_key(key)
+        if existing is not None:
+            print(f"Skipping duplicate invoice {file_name}: already in the ledger as {existing or 'an existing row'}.")
+            duplicates.append(file_name)
+            continue
+        if key:
+            index.add(key, file_name, content_hash)
+        new_rows.append(invoice_data)
+    return new_rows, duplicates
+
+def _find_known_files(file_paths, output_file, ledger_path):
+    """
+    Checks files against the ledger before any extraction: a file whose
+    content hash is in the duplicate index has already been written to the
+    ledger and is not OCR'd again. Returns (new_paths, content_hashes,
+    known_paths); content_hashes maps file names to hashes for write_to_excel.
+    """
+    if not DUPLICATE_CHECK:
+        return list(file_paths), {}, []
+    index = _duplicate_index(output_file, ledger_path if ledger_path and os.path.exists(ledger_path) else None)
+    new_paths, content_hashes, known_paths = [], {}, []
+    for file_path in file_paths:
+        try:
+            content_hash = file_content_hash(file_path)
+        except OSError:
+            new_paths.append(file_path)
+            continue
+        content_hashes[os.path.basename(file_path)] = content_hash
+        existing = index.find_hash(content_hash) if index is not None else None
+        if existing is not None:
+            print(f"Skipping {file_path}: same file as {existing or 'an invoice'} already in the ledger.")
+            known_paths.append(file_path)
+        else:
+            new_paths.append(file_path)
+    return new_paths, content_hashes, known_paths
+
+def _write_new_excel(all_invoice_data, output_file, timings=None):
+    """
+    Writes a new Excel file using openpyxl's write-only mode, which streams
+    rows to disk instead of keeping every cell in memory.
+    all_invoice_data may be any iterable, including a generator.
+    If timings (invoice_timing dicts) are given, they go to a "Timings" sheet.
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(EXCEL_HEADERS)
+    for invoice_data in all_invoice_data:
+        sheet.append(_excel_row(invoice_data))
+    _add_timings_sheet(workbook, timings)
+    workbook.save(output_file)
+
+def _add_timings_sheet(workbook, timings):
+    if timings:
+        headers, rows = timing_rows(timings)
+        timings_sheet = workbook.create_sheet("Timings")
+        timings_sheet.append(headers)
+        for row in rows:
+            timings_sheet.append(row)
+
+def _append_with_openpyxl(all_invoice_data, output_file, existing_excel_path):
+    """
+    Fallback append that loads the whole workbook; used only when the
+    streaming append cannot handle the file. Checks the header row like
+    the streaming append (see excel_stream.missing_headers).
+    """
+    workbook = openpyxl.load_workbook(existing_excel_path)
+    sheet = workbook.active
+    existing = [cell.value for cell in sheet[1]]
+    missing = missing_headers(existing if any(value is not None for value in existing) else [], EXCEL_HEADERS)
+    for column, header in enumerate(missing, start=len(EXCEL_HEADERS) - len(missing) + 1):
+        sheet.cell(row=1, column=column, value=header)
+    for invoice_data in all_invoice_data:
+        sheet.append(_excel_row(invoice_data))
+    workbook.save(output_file)
+
+def _batches(rows, size):
+    rows = iter(rows)
+    return iter(lambda: list(itertools.islice(rows, size)), [])
+
+
+class _ExcelOutput:
+    """
+    One Excel output of write_to_excel / write_outputs, fed in batches. A new
+    file is written row by row in openpyxl's write-only mode and saved on
+    close(). Rows for an existing file are collected and appended on close()
+    in one append_rows_to_xlsx pass, which needs the number of new rows
+    before it reaches them (they are also kept for its fallback paths).
+    With DUPLICATE_CHECK, write() drops invoices already in the ledger.
+    """
+
+    def __init__(self, output_file, existing_excel_path=None, timings=None, content_hashes=None):
+        self.output_file = output_file
+        self.existing_excel_path = existing_excel_path
+        self.timings = timings
+        self.content_hashes = content_hashes or {}
+        self.appending = bool(existing_excel_path and os.path.exists(existing_excel_path))
+        self.duplicates = []
+        self.index = _duplicate_index(output_file, existing_excel_path if self.appending else None) if DUPLICATE_CHECK else None
+        if self.appending:
+            self.rows = []
+        else:
+            if existing_excel_path:
+                print(f"Existing Excel file not found at {existing_excel_path}. Creating a new one at {output_file}")
+            else:
+                print(f"Creating new Excel file: {output_file}")
+            self.workbook = openpyxl.Workbook(write_only=True)
+            self.sheet = self.workbook.create_sheet()
+            self.sheet.append(EXCEL_HEADERS)
+
+    def write(self, invoice_rows):
+        """Adds a batch of invoice details dicts. Returns the ones that are not duplicates."""
+        if self.index is not None:
+            invoice_rows, duplicates = _drop_duplicates(invoice_rows, self.index, self.content_hashes)
+            self.duplicates += duplicates
+        if self.appending:
+            self.rows += invoice_rows
+        else:
+            for invoice_data in invoice_rows:
+                self.sheet.append(_excel_row(invoice_data))
+        return invoice_rows
+
+    def close(self):
+        """Writes the file. Returns the file names of the skipped duplicates."""
+        try:
+            if self.appending:
+                index_valid = _append_excel_rows(self.rows, self.output_file, self.existing_excel_path, self.timings)
+            else:
+                _add_timings_sheet(self.workbook, self.timings)
+                self.workbook.save(self.output_file)
+                index_valid = True
+        except Exception:
+            self.abort()
+            raise
+        if self.index is not None:
+            if index_valid:
+                self.index.commit(self.output_file)
+            else:
+                self.index.rollback()  # Left out of sync with the output, so it is rebuilt from it next time
+        print(f"Data written to Excel file: {self.output_file}")
+        return self.duplicates
+
+    def abort(self):
+        if self.index is not None:
+            self.index.rollback()
+
+
+def write_to_excel(all_invoice_data, output_file, existing_excel_path=None, timings=None, content_hashes=None):
     """
     Writes the extracted invoice data to an Excel file.
     If existing_excel_path is provided, it appends to that file.
     Otherwise, it creates a new file.
+    Appending streams the existing worksheet through unchanged and only
+    serializes the new rows (see excel_stream.py); a new file is written as
+    all_invoice_data is consumed, so it may be a generator of any length.
+    timings, if given, are written to a "Timings" sheet of a new file;
+    appends leave the existing workbook's sheets as they are.
+    With DUPLICATE_CHECK, invoices already in the ledger (or repeated within
+    all_invoice_data) are skipped; content_hashes optionally maps file names
+    to the content hash of their source file.
+    Returns the file names of the skipped duplicates.
+    """
+    output = _ExcelOutput(output_file, existing_excel_path, timings, content_hashes)
+    try:
+        for batch in _batches(all_invoice_data, OUTPUT_BATCH_ROWS):
+            output.write(batch)
+    except BaseException:
+        output.abort()
+        raise
+    return output.close()
+
+def _append_excel_rows(all_invoice_data, output_file, existing_excel_path, timings=None):
+    """
+    Appends the rows of an _ExcelOutput to existing_excel_path. Returns False
+    if it had to fall back to writing only the new rows to a new file.
+    The existing header row must be EXCEL_HEADERS or a prefix of it (a
+    ledger started before a column was added), which is then extended;
+    otherwise HeaderMismatchError is raised and nothing is written.
     """
-    if existing_excel_path and os.path.exists(existing_excel_path):
+    print(f"Appending data to existing Excel file: {existing_excel_path}")
+    try:
+        append_rows_to_xlsx(existing_excel_path, (_excel_row(d) for d in all_invoice_data), output_path=output_file, headers=EXCEL_HEADERS)
+        return True
+    except HeaderMismatchError as e:
+        print(f"Not appending to {existing_excel_path}: {e}.")
+        raise
+    except Exception as e:
+        print(f"Streaming append to {existing_excel_path} failed: {e}. Retrying with a full workbook load.")
+    try:
+        _append_with_openpyxl(all_invoice_data, output_file, existing_excel_path)
+    except HeaderMismatchError as e:
+        print(f"Not appending to {existing_excel_path}: {e}.")
+        raise
+    except Exception as e:
+        print(f"Error loading existing Excel file {existing_excel_path}: {e}. Creating a new one instead at {output_file}")
+        _write_new_excel(all_invoice_data, output_file, timings)
+        return False
+    return True
+
+def _output_error(output_errors, output_file, error):
+    print(f"Error writing {output_file}: {error}")
+    if output_errors is not None:
+        output_errors.append(f"{os.path.basename(output_file)}: {error}")
+
+def write_outputs(all_invoice_data, output_files, existing_excel_path=None, append=False, timings=None, content_hashes=None, output_errors=None):
+    """
+    Writes the invoice rows to every file in output_files. The format is
+    chosen by extension: .xlsx goes through write_to_excel (appending to
+    existing_excel_path, with its duplicate check), .csv, .sqlite/.db and
+    .parquet through the sinks of output_sinks. all_invoice_data is consumed
+    once, in batches of OUTPUT_BATCH_ROWS that go to every output in turn,
+    so it may be a generator (e.g. over iter_invoices) and the rows of a run
+    are never all held in memory; only an Excel append collects its new
+    rows (see _ExcelOutput). Rows the Excel duplicate check skips are left
+    out of the other outputs as well. A failing sink is reported and
+    dropped without affecting the other outputs; its error is also
+    appended to output_errors, if given, as "<file>: <error>".
+    With append=True the other outputs are added to instead of replaced.
+    Each output's write time is recorded as stage "<format>_write".
+    Returns the file names of the skipped duplicates.
+    """
+    excel_outputs = [
+        _ExcelOutput(path, existing_excel_path, timings, content_hashes) for path in output_files if path.lower().endswith(".xlsx")
+    ]
+    sink_files = [(path, sink_for(path)) for path in output_files if not path.lower().endswith(".xlsx")]
+
+    sinks = []
+    for output_file, sink_class in sink_files:
+        output_format = os.path.splitext(output_file)[1].lower().lstrip(".")
         try:
-            workbook = openpyxl.load_workbook(existing_excel_path)
-            sheet = workbook.active
-            # Check if headers are already present, if not, add them (optional, good practice)
-            # For simplicity, we assume if the file exists and is loaded, we just append data.
-            # A more robust check would verify header row.
-            print(f"Appending data to existing Excel file: {existing_excel_path}")
+            with stage(f"{output_format}_write"):
+                sinks.append((output_file, output_format, sink_class(output_file, EXCEL_HEADERS, append=append)))
         except Exception as e:
-            print(f"Error loading existing Excel file {existing_excel_path}: {e}. Creating a new one instead at {output_file}")
-            workbook = openpyxl.Workbook()
-            sheet = workbook.active
-            headers = ["Invoice Number", "Invoice Date", "Total Amount", "Vendor Name", "File Name"]
-            sheet.append(headers)
-    else:
-        workbook = openpyxl.Workbook()
-        sheet = workbook.active
-        headers = ["Invoice Number", "Invoice Date", "Total Amount", "Vendor Name", "File Name"]
-        sheet.append(headers)
-        if existing_excel_path:
-            print(f"Existing Excel file not found at {existing_excel_path}. Creating a new one at {output_file}")
-        else:
-            print(f"Creating new Excel file: {output_file}")
+            _output_error(output_errors, output_file, e)
 
-    for invoice_data in all_invoice_data:
-        row = [
-            invoice_data.get("invoice_number", ""),
-            invoice_data.get("invoice_date", ""),
-            invoice_data.get("total_amount", ""),
-            invoice_data.get("vendor_name", ""),
-            invoice_data.get("file_name", ""),
-        ]
-        sheet.append(row)
-    
-    workbook.save(output_file)
-    print(f"Data written to Excel file: {output_file}")
+    try:
+        for batch in _batches(all_invoice_data, OUTPUT_BATCH_ROWS):
+            for output in excel_outputs:
+                with stage("excel_write"):
+                    batch = output.write(batch)
+            rows = [_excel_row(invoice_data) for invoice_data in batch]
+            for sink_entry in list(sinks):
+                output_file, output_format, sink = sink_entry
+                try:
+                    with stage(f"{output_format}_write"):
+                        sink.write(rows)
+                except Exception as e:
+                    _output_error(output_errors, output_file, e)
+                    sink.abort()
+                    sinks.remove(sink_entry)
+    except BaseException:
+        for output in excel_outputs:
+            output.abort()
+        for _, _, sink in sinks:
+            sink.abort()
+        raise
+
+    duplicates = []
+    try:
+        for output in excel_outputs:
+            with stage("excel_write"):
+                duplicates += output.close()
+    except BaseException:
+        for _, _, sink in sinks:
+            sink.abort()
+        raise
+    for output_file, output_format, sink in sinks:
+        try:
+            with stage(f"{output_format}_write"):
+                count = sink.close()
+            print(f"{count} row(s) {'appended' if append else 'written'} to: {output_file}")
+        except Exception as e:
+            _output_error(output_errors, output_file, e)
+    return sorted(set(duplicates))
 
 # --- Main Processing Logic ---
 
-def process_invoices():
+def in_shard(file_name, shard):
+    """
+    True if file_name belongs to shard, an (index, count) pair with index
+    counted from 1, or if shard is None. Files are assigned by a hash of
+    their name, so every machine computes the same partition of a shared
+    archive without reading the files or talking to the others.
+    """
+    if shard is None:
+        return True
+    index, count = shard
+    digest = hashlib.sha1(file_name.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count == index - 1
+
+def extract_invoice_text(file_path):
+    """
+    Runs the extraction chain for a single invoice file:
+    image OCR, PDF text layer with per-page OCR fallback, or plain text.
+    Returns the extracted text, or None if the file type is not supported.
+    """
+    filename = os.path.basename(file_path)
+    if filename.lower().endswith(IMAGE_EXTENSIONS):
+        print(f"\nProcessing image file: {file_path}")
+        return ocr_image(file_path)
+    elif filename.lower().endswith('.pdf'):
+        print(f"\nProcessing PDF file: {file_path}")
+        return extract_text_from_pdf_hybrid(file_path)
+    elif filename.lower().endswith('.txt'):
+        print(f"\nProcessing TXT file: {file_path}")
+        return read_text_from_txt(file_path)
+    print(f"Skipping unsupported file type: {filename}")
+    return None
+
+def process_invoice_file(file_path):
+    """
+    Extracts and parses a single invoice file.
+    Returns the parsed invoice details (with "file_name" set), or None if
+    the file is unsupported or no text could be extracted.
+    Parsed results are cached by file content, so an unchanged file is
+    not extracted or parsed again.
+    """
+    filename = os.path.basename(file_path)
+
+    cache = _get_cache() if filename.lower().endswith(SUPPORTED_EXTENSIONS) else None
+    content_hash = None
+    if cache is not None:
+        try:
+            content_hash = file_content_hash(file_path)
+        except OSError:
+            cache = None
+    if cache is not None:
+        cached_details = _cache_get(cache, content_hash, "parse", _parse_settings())
+        if cached_details is not None:
+            print(f"Cache hit (parse): {file_path}")
+            note(cache_hit="parse")
+            cached_details["file_name"] = filename
+            return cached_details
+
+    extracted_text = extract_invoice_text(file_path)
+
+    if extracted_text and extracted_text.strip():
+        print(f"--- Raw Extracted Text for {filename} (first 300 chars) ---")
+        print(extracted_text[:300] + ("..." if len(extracted_text) > 300 else ""))
+        print("--- End Raw Extracted Text ---")
+        with stage("parse"):
+            invoice_details = parse_invoice_text(extracted_text)
+        if cache is not None:
+            _cache_set(cache, content_hash, "parse", invoice_details, _parse_settings())
+        invoice_details["file_name"] = filename
+        return invoice_details
+    elif extracted_text is not None:
+        print(f"No text could be extracted from {filename}.")
+    return None
+
+def _process_invoice_file_isolated(file_path, pdf_text_backend=None):
+    """
+    Batch task wrapper around process_invoice_file.
+    Never raises: returns (invoice_details, error_message, timing) so that one
+    bad file cannot abort the rest of the batch. timing is the file's
+    invoice_timing record as a dict. A file over a resource limit is
+    quarantined: invoice_details is then its status row.
+    pdf_text_backend is the PDF text backend the parent process selected
+    (select_pdf_text_backend); worker processes started with spawn or
+    forkserver would otherwise resolve "auto" on their own.
+    """
+    if pdf_text_backend and PDF_TEXT_BACKEND == "auto":
+        use_backend(pdf_text_backend, PDFTOTEXT_CMD, PDFTOTEXT_ARGS)
+    with record_file(file_path) as timing:
+        try:
+            invoice_details, error = process_invoice_file(file_path), None
+        except (ResourceLimitError, MemoryError) as e:
+            invoice_details, error = _quarantine_row(file_path, str(e) or "out of memory"), None
+            timing.status = "quarantined"
+        except Exception as e:
+            invoice_details, error = None, f"{type(e).__name__}: {e}"
+            timing.status = "error"
+    if error is None and invoice_details is None:
+        timing.status = "skipped"
+    return invoice_details, error, timing.to_dict()
+
+def _quarantine_row(file_path, reason):
+    """
+    Status row written in place of the invoice for a file that exceeded a
+    resource limit, so that it shows up in the output instead of stalling it.
+    """
+    file_name = os.path.basename(file_path)
+    print(f"Quarantined {file_name}: {reason}")
+    return {
+        "invoice_number": None, "invoice_date": None, "total_amount": None, "vendor_name": None,
+        "file_name": file_name, "status": f"quarantined: {reason}",
+    }
+
+def _isolation_enabled():
+    return bool(FILE_TIMEOUT_SECONDS or MAX_FILE_MEMORY_BYTES)
+
+def _run_governed(file_paths, workers, stop_event=None, pdf_text_backend=None):
+    """
+    Runs _process_invoice_file_isolated on every file in its own process
+    (see resource_governor.run_isolated), enforcing FILE_TIMEOUT_SECONDS and
+    MAX_FILE_MEMORY_BYTES. Yields (index, (invoice_details, error, timing))
+    as files finish; a file that was killed or whose process died is
+    quarantined. Closing the generator, or setting stop_event, kills the
+    files still running.
+    """
+    results = run_isolated(
+        functools.partial(_process_invoice_file_isolated, pdf_text_backend=pdf_text_backend),
+        file_paths, workers, FILE_TIMEOUT_SECONDS, MAX_FILE_MEMORY_BYTES, stop_event=stop_event,
+    )
+    try:
+        for index, status, value in results:
+            if status == "done":
+                yield index, value
+                continue
+            if status == "timeout":
+                reason = f"timed out after {FILE_TIMEOUT_SECONDS}s"
+            elif status == "memory":
+                reason = f"exceeded the memory limit of {MAX_FILE_MEMORY_BYTES // (1024 * 1024)} MiB"
+            else:
+                reason = f"worker process died (exit code {value})"
+            timing = FileTiming(os.path.basename(file_paths[index]))
+            timing.status = "quarantined"
+            timing.total_seconds = FILE_TIMEOUT_SECONDS if status == "timeout" else None
+            yield index, (_quarantine_row(file_paths[index], reason), None, timing.to_dict())
+    finally:
+        results.close()
+
+def _with_timing(file_path, invoice_details, error, timing):
+    if timing is None:  # The worker died before it could report
+        failed = FileTiming(os.path.basename(file_path))
+        failed.status = "error"
+        timing = failed.to_dict()
+    return file_path, invoice_details, error, timing
+
+def iter_invoices(file_paths, workers=None, lookahead=None, ordered=True, stop_event=None):
+    """
+    Lazily processes invoice files and yields one record per file,
+    (file_path, invoice_details, error, timing) as returned by
+    _process_invoice_file_isolated, as soon as the file is done. With
+    ordered=True records come in the order of file_paths, otherwise in
+    completion order.
+    With workers > 1 files run in a process pool, at most lookahead files
+    (default LOOKAHEAD_FILES, or twice the workers) ahead of the consumer,
+    so results do not pile up when the consumer is slower than extraction.
+    When FILE_TIMEOUT_SECONDS or MAX_FILE_MEMORY_BYTES is set, every file
+    runs in its own governed process instead (see _run_governed).
+    Processing stops when the generator is closed or stop_event is set;
+    files still running are then cancelled or killed.
+    """
+    file_paths = list(file_paths)
+    workers = workers or MAX_WORKERS
+    lookahead = max(1, lookahead or LOOKAHEAD_FILES or 2 * workers)
+    pdf_text_backend = select_pdf_text_backend(file_paths)
+
+    if _isolation_enabled():
+        results = _run_governed(file_paths, workers, stop_event=stop_event, pdf_text_backend=pdf_text_backend)
+        waiting = {}  # index -> result finished ahead of an earlier file
+        next_index = 0
+        try:
+            for index, result in results:
+                if not ordered:
+                    yield _with_timing(file_paths[index], *result)
+                    continue
+                waiting[index] = result
+                while next_index in waiting:
+                    yield _with_timing(file_paths[next_index], *waiting.pop(next_index))
+                    next_index += 1
+        finally:
+            results.close()
+    elif workers > 1 and len(file_paths) > 1:
+        print(f"Processing {len(file_paths)} files with {workers} worker processes.")
+        executor = ProcessPoolExecutor(max_workers=workers)
+        pending_paths = iter(file_paths)
+        in_flight = collections.OrderedDict()  # future -> file path, in submission order
+        try:
+            while True:
+                if stop_event is not None and stop_event.is_set():
+                    return
+                for file_path in itertools.islice(pending_paths, lookahead - len(in_flight)):
+                    in_flight[executor.submit(_process_invoice_file_isolated, file_path, pdf_text_backend)] = file_path
+                if not in_flight:
+                    return
+                if ordered:
+                    done = [next(iter(in_flight))]
+                else:
+                    done, _ = wait(in_flight, timeout=1.0, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file_path = in_flight.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:  # e.g. BrokenProcessPool if a worker process died
+                        result = (None, f"{type(e).__name__}: {e}", None)
+                    yield _with_timing(file_path, *result)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+    else:
+        for file_path in file_paths:
+            if stop_event is not None and stop_event.is_set():
+                return
+            yield _with_timing(file_path, *_process_invoice_file_isolated(file_path))
+
+def _timed_write_outputs(all_invoice_data, output_files, existing_excel_path=None, append=False, timings=None, content_hashes=None):
+    """
+    write_outputs, returning (a timing dict for the writes themselves, the
+    file names of the skipped duplicates).
+    all_invoice_data may be a generator that extracts the rows while they
+    are written, so the total is the sum of the write stages rather than
+    the wall time of the block.
+    """
+    with record_file("(output)") as output_timing:
+        duplicates = write_outputs(
+            all_invoice_data, output_files, existing_excel_path=existing_excel_path, append=append,
+            timings=timings, content_hashes=content_hashes,
+        )
+    output_timing.total_seconds = sum(output_timing.stage_seconds.values())
+    return output_timing.to_dict(), duplicates
+
+def _export_timings(timings):
+    if TIMINGS_JSONL_FILE:
+        write_timings_jsonl(timings, TIMINGS_JSONL_FILE)
+        print(f"Timings written to: {TIMINGS_JSONL_FILE}")
+
+def _extracted_rows(results, timings):
+    """
+    Yields the invoice details of the iter_invoices results, printing errors
+    and appending every file's timing to timings.
+    """
+    for file_path, invoice_details, error, timing in results:
+        if error:
+            print(f"Error processing {os.path.basename(file_path)}: {error}")
+        elif invoice_details:
+            yield invoice_details
+        timings.append(timing)
+
+def process_invoices(invoice_dir=None, output_file=None, workers=None, extra_outputs=None, shard=None):
     """
     Main function to process all invoices in the directory.
+    With workers > 1, each file is processed as an independent task in a
+    process pool. Results are written in file name order as they arrive,
+    to Excel and to every file in extra_outputs (default
+    EXTRA_OUTPUT_FILES; CSV, SQLite or Parquet, see write_outputs), without
+    collecting the rows of the whole directory first.
+    With shard=(index, count), only the files of that shard are processed
+    (see in_shard); merge_outputs combines the outputs of all shards. A
+    shard without any rows still writes its outputs, with only the headers.
+    Per-file timings are appended to TIMINGS_JSONL_FILE and/or written to a
+    "Timings" sheet (EXCEL_TIMINGS_SHEET) when configured, and returned.
     """
-    if not os.path.exists(INVOICE_DIR):
-        print(f"Error: Invoice directory '{INVOICE_DIR}' not found. Please create it and add your invoice files.")
+    invoice_dir = invoice_dir or INVOICE_DIR
+    output_file = output_file or OUTPUT_EXCEL_FILE
+    workers = workers or MAX_WORKERS
+    output_files = [output_file] + list(EXTRA_OUTPUT_FILES if extra_outputs is None else extra_outputs)
+
+    if not os.path.exists(invoice_dir):
+        print(f"Error: Invoice directory '{invoice_dir}' not found. Please create it and add your invoice files.")
         return
 
-    all_extracted_data = []
-    
-    print(f"Looking for invoices in: {os.path.abspath(INVOICE_DIR)}")
-    invoice_files = os.listdir(INVOICE_DIR)
-    print(f"Files found in '{INVOICE_DIR}': {invoice_files}")
-
-    for filename in invoice_files:
-        file_path = os.path.join(INVOICE_DIR, filename)
-        extracted_text = None  # Initialize for each file
-
-        if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.tiff', '.bmp', '.gif')):
-            print(f"\nProcessing image file: {file_path}")
-            extracted_text = ocr_image(file_path)
-        elif filename.lower().endswith('.pdf'):
-            print(f"\nProcessing PDF file: {file_path}")
-            extracted_text = extract_text_from_pdf(file_path)
-            if not extracted_text or len(extracted_text.strip()) < 50: 
-                print(f"Direct text extraction from {file_path} was minimal or empty. Attempting OCR by converting PDF to images.")
-                extracted_text = ocr_pdf_as_images(file_path)
-        elif filename.lower().endswith('.txt'):
-            print(f"\nProcessing TXT file: {file_path}")
-            extracted_text = read_text_from_txt(file_path)
-        else:
-            print(f"Skipping unsupported file type: {filename}")
-            continue
-            
-        if extracted_text and extracted_text.strip():
-            print(f"--- Raw Extracted Text for {filename} (first 300 chars) ---")
-            print(extracted_text[:300] + ("..." if len(extracted_text) > 300 else ""))
-            print("--- End Raw Extracted Text ---")
-            invoice_details = parse_invoice_text(extracted_text)
-            invoice_details["file_name"] = filename
-            all_extracted_data.append(invoice_details)
-        elif extracted_text is not None:
-            print(f"No text could be extracted from {filename}.")
-            
-    if all_extracted_data:
-        write_to_excel(all_extracted_data, OUTPUT_EXCEL_FILE)
+    print(f"Looking for invoices in: {os.path.abspath(invoice_dir)}")
+    invoice_files = sorted(filename for filename in os.listdir(invoice_dir) if in_shard(filename, shard))
+    if shard:
+        print(f"Shard {shard[0]}/{shard[1]}: {len(invoice_files)} file(s).")
+    print(f"Files found in '{invoice_dir}': {invoice_files}")
+    file_paths = [os.path.join(invoice_dir, filename) for filename in invoice_files]
+
+    timings = []
+    extracted_data = _extracted_rows(iter_invoices(file_paths, workers), timings)
+    first_row = next(extracted_data, None)
+    if first_row is not None:
+        timings.append(_timed_write_outputs(
+            itertools.chain([first_row], extracted_data), output_files, timings=timings if EXCEL_TIMINGS_SHEET else None
+        )[0])
     else:
         print("No data successfully extracted and parsed from any invoices.")
+        if shard:
+            # merge_outputs expects an output from every shard, so an empty shard writes just the headers
+            timings.append(_timed_write_outputs([], output_files, timings=timings if EXCEL_TIMINGS_SHEET else None)[0])
+
+    _export_timings(timings)
+    return timings
+
+def process_invoices_incremental(invoice_dir=None, output_file=None, workers=None, manifest_path=None, extra_outputs=None, shard=None):
+    """
+    Processes only the invoices that are new or changed since the last run.
+    A manifest (by default next to the output file) records each file's
+    size, mtime, content hash and parsed row. Files whose size and mtime are
+    unchanged are not even read. Rows of new files are appended to the
+    existing output; if files were changed or deleted, or the output is
+    missing, the output is rewritten from the manifest's rows instead (no
+    file is extracted again for that). extra_outputs (default
+    EXTRA_OUTPUT_FILES) are appended to or rewritten along with it.
+    shard limits the run to one shard of the directory, as in process_invoices. The output is owned by the manifest:
+    rows added to it by other means are lost on a rewrite.
+    When only appending, new files whose content is already in the output
+    (see DUPLICATE_CHECK) are recorded as duplicates without being extracted;
+    files whose rows the duplicate check drops while writing are recorded as
+    duplicates as well. Duplicates are processed again once any file is deleted.
+    Files that failed, came out empty or were quarantined are processed again
+    on later runs, up to INCREMENTAL_MAX_ATTEMPTS times for the same content.
+    Returns the timings of the files processed in this run.
+    """
+    invoice_dir = invoice_dir or INVOICE_DIR
+    output_file = output_file or OUTPUT_EXCEL_FILE
+    workers = workers or MAX_WORKERS
+    manifest_path = manifest_path or manifest_path_for(output_file)
+    output_files = [output_file] + list(EXTRA_OUTPUT_FILES if extra_outputs is None else extra_outputs)
+
+    if not os.path.exists(invoice_dir):
+        print(f"Error: Invoice directory '{invoice_dir}' not found. Please create it and add your invoice files.")
+        return
+
+    manifest = load_manifest(manifest_path)
+    signatures = scan_directory(invoice_dir, SUPPORTED_EXTENSIONS, exclude=(output_file, manifest_path))
+    signatures = {name: signature for name, signature in signatures.items() if in_shard(name, shard)}
+    changed, deleted = diff_directory(invoice_dir, manifest, signatures, INCREMENTAL_MAX_ATTEMPTS)
+    if deleted:
+        # The row a duplicate was skipped for may be gone now
+        changed = sorted(set(changed) | {
+            name for name, entry in manifest["files"].items() if entry["status"] == "duplicate" and name in signatures
+        })
+    replaced = [name for name in changed if manifest["files"].get(name, {}).get("status") in WRITTEN_STATUSES]
+    if not changed and not deleted and os.path.exists(output_file):
+        save_manifest(manifest, manifest_path)  # Keeps refreshed size/mtime of touched files
+        print(f"No new or changed invoices in '{invoice_dir}'.")
+        return []
+
+    print(f"Incremental run on '{invoice_dir}': {len(changed)} new or changed, {len(deleted)} deleted, {len(signatures) - len(changed)} unchanged.")
+    file_paths = [os.path.join(invoice_dir, name) for name in changed]
+    content_hashes = {}
+    if not replaced and not deleted and os.path.exists(output_file):
+        file_paths, content_hashes, known_paths = _find_known_files(file_paths, output_file, output_file)
+        for file_path in known_paths:
+            file_name = os.path.basename(file_path)
+            record_entry(manifest, file_name, file_path, signatures[file_name], "duplicate", None)
+
+    new_rows = []
+    timings = []
+    for file_path, invoice_details, error, timing in iter_invoices(file_paths, workers):
+        file_name = os.path.basename(file_path)
+        if error:
+            print(f"Error processing {file_name}: {error}")
+            status = "error"
+        elif timing["status"] == "quarantined":
+            status = "quarantined"
+        else:
+            status = "ok" if invoice_details else "empty"
+        record_entry(manifest, file_name, file_path, signatures[file_name], status, invoice_details)
+        if invoice_details:
+            new_rows.append(invoice_details)
+        timings.append(timing)
+    for file_name in deleted:
+        print(f"Invoice removed since the last run: {file_name}")
+        del manifest["files"][file_name]
+
+    sheet_timings = timings if EXCEL_TIMINGS_SHEET else None
+    output_timing, duplicates = None, []
+    if replaced or deleted or not os.path.exists(output_file):
+        # Rows of changed or deleted files must go; rebuild from the manifest (no re-extraction)
+        manifest_hashes = {name: entry["content_hash"] for name, entry in manifest["files"].items() if entry["content_hash"]}
+        output_timing, duplicates = _timed_write_outputs(manifest_rows(manifest), output_files, timings=sheet_timings, content_hashes=manifest_hashes)
+    elif new_rows:
+        output_timing, duplicates = _timed_write_outputs(new_rows, output_files, existing_excel_path=output_file, append=True, content_hashes=content_hashes)
+    if output_timing:
+        timings.append(output_timing)
+    for file_name in duplicates:
+        if file_name in manifest["files"]:
+            manifest["files"][file_name]["status"] = "duplicate"  # Its row was not written, so it is not exported
+    save_manifest(manifest, manifest_path)
+    _export_timings(timings)
+    return timings
+
+def watch_invoices(invoice_dir=None, output_file=None, workers=None, poll_interval=None, stop_event=None, extra_outputs=None, shard=None):
+    """
+    Watches invoice_dir and runs process_invoices_incremental whenever files
+    appear, change or disappear. Each poll only stats the directory. A change
+    is processed once the directory looked the same for two consecutive polls,
+    so files that are still being copied in are not picked up half-written.
+    Runs until interrupted (Ctrl+C) or until stop_event (a threading.Event) is set.
+    """
+    invoice_dir = invoice_dir or INVOICE_DIR
+    output_file = output_file or OUTPUT_EXCEL_FILE
+    poll_interval = poll_interval or WATCH_POLL_SECONDS
+    manifest_path = manifest_path_for(output_file)
+
+    print(f"Watching '{invoice_dir}' for invoices (every {poll_interval}s). Press Ctrl+C to stop.")
+    process_invoices_incremental(invoice_dir, output_file, workers, extra_outputs=extra_outputs, shard=shard)
+    processed_snapshot = scan_directory(invoice_dir, SUPPORTED_EXTENSIONS, exclude=(output_file, manifest_path))
+    previous_snapshot = processed_snapshot
+    try:
+        while not (stop_event and stop_event.is_set()):
+            if stop_event:
+                stop_event.wait(poll_interval)
+            else:
+                time.sleep(poll_interval)
+            try:
+                snapshot = scan_directory(invoice_dir, SUPPORTED_EXTENSIONS, exclude=(output_file, manifest_path))
+            except OSError as e:
+                print(f"Could not scan '{invoice_dir}': {e}")
+                continue
+            if snapshot == previous_snapshot and snapshot != processed_snapshot:
+                process_invoices_incremental(invoice_dir, output_file, workers, extra_outputs=extra_outputs, shard=shard)
+                processed_snapshot = snapshot
+            previous_snapshot = snapshot
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+
+def merge_outputs(shard_files, output_file, extra_outputs=None):
+    """
+    Combines the Excel outputs of several shards into one workbook with the
+    rows ordered by file name. Shards are read in read-only mode and the
+    merged rows go through write_outputs, so the duplicate check applies
+    across shards and extra_outputs are written too.
+    Returns the number of rows written.
+    """
+    all_invoice_data = []
+    for shard_file in shard_files:
+        shard_rows = list(_ledger_rows(shard_file))
+        print(f"Read {len(shard_rows)} row(s) from {shard_file}")
+        all_invoice_data += shard_rows
+    all_invoice_data.sort(key=lambda invoice_data: str(invoice_data.get("file_name") or ""))
+    duplicates = write_outputs(all_invoice_data, [output_file] + list(extra_outputs or []))
+    return len(all_invoice_data) - len(duplicates)
 
 if __name__ == "__main__":
     if not os.path.exists(INVOICE_DIR):
         os.makedirs(INVOICE_DIR)
         print(f"Created directory: {INVOICE_DIR}. Please add your invoice files there.")
-    process_invoices()
+    if WATCH_MODE:
+        watch_invoices()
+    elif INCREMENTAL_MODE:
+        process_invoices_incremental()
+    else:
+        process_invoices()
@@ -0,0 +1,363 @@
+import collections
+import json
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import invoice_processor
+
+# --- Configuration ---
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+SERVICE_WORKERS = 2  # Files extracted at the same time (worker processes)
+SERVICE_QUEUE_SIZE = 100  # Files waiting for a worker; further uploads get 429
+SERVICE_MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+SERVICE_RESULT_TTL_SECONDS = 3600  # Finished jobs are forgotten after this long
+SERVICE_RETRY_AFTER_SECONDS = 5  # Retry-After sent with 429 responses
+METRICS_WINDOW_SECONDS = 60  # Throughput and latency percentiles cover this many recent seconds
+UPLOAD_CHUNK_BYTES = 1024 * 1024  # Uploads are spooled to disk in chunks of this size
+
+# Headless ingestion service. Other programs POST invoice files over HTTP; they are spooled
+# to disk and queued on a bounded queue, from which a fixed number of workers process them
+# with the same per-file pipeline as process_invoices (invoice_processor.iter_invoices). The service listens on localhost by default and has
+# no authentication. Start it with: python invoice_cli.py serve
+#
+#   POST /invoices?filename=NAME   Body: the file's bytes. 202 with the job ID; 400 for a
+#                                  missing or unsupported file name; 413 above
+#                                  SERVICE_MAX_UPLOAD_BYTES; 429 with Retry-After while the
+#                                  queue is full (checked before the body is read).
+#   GET  /invoices/ID              Job status: queued, running, done or failed.
+#   GET  /invoices/ID/result       200 with the parsed invoice (or the error) once the job
+#                                  finished, 202 before.
+#   GET  /metrics                  Queue depth, running jobs, counters, throughput and
+#                                  processing time percentiles.
+#   GET  /healthz                  200 while the service accepts work.
+
+
+class ServiceJob:
+    """
+    One uploaded file and, once processed, its result.
+    status is one of "queued", "running", "done", "failed".
+    """
+
+    def __init__(self, file_name, file_path):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.file_name = file_name
+        self.file_path = file_path
+        self.status = "queued"
+        self.invoice = None
+        self.error = None
+        self.timing = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    def to_dict(self, with_result=False):
+        state = {
+            "job_id": self.job_id,
+            "file_name": self.file_name,
+            "status": self.status,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+        if with_result:
+            state["invoice"] = self.invoice
+            state["timing"] = self.timing
+        return state
+
+
+class IngestionService:
+    """
+    Bounded queue of ServiceJobs and the worker threads that process them.
+    Each worker thread hands its file to a shared process pool (or processes
+    it in this process with one worker), so extraction runs in parallel.
+    Uploaded files are spooled to spool_dir and removed once processed.
+    """
+
+    def __init__(self, workers=None, queue_size=None, spool_dir=None):
+        self.workers = workers or SERVICE_WORKERS
+        self.queue_size = queue_size or SERVICE_QUEUE_SIZE
+        self.spool_dir = spool_dir or tempfile.mkdtemp(prefix="invoice_service_")
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._threads = []
+        self._recent = collections.deque()  # (finished_at, processing seconds) within METRICS_WINDOW_SECONDS
+        self.started_at = time.time()
+        self.counters = {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0}
+
+    def start(self):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"invoice-service-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Stops the workers after their current file; queued files are dropped."""
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
+
+    @property
+    def accepting(self):
+        return not self._stop_event.is_set()
+
+    def is_full(self):
+        return self._queue.full()
+
+    def submit(self, file_name, stream, length):
+        """
+        Spools length bytes of stream as file_name and queues the file.
+        Returns the ServiceJob, or None if the queue is full (the spooled
+        file is removed again).
+        """
+        job_dir = tempfile.mkdtemp(dir=self.spool_dir)
+        job = ServiceJob(file_name, os.path.join(job_dir, file_name))
+        try:
+            with open(job.file_path, "wb") as f:
+                remaining = length
+                while remaining > 0:
+                    chunk = stream.read(min(UPLOAD_CHUNK_BYTES, remaining))
+                    if not chunk:
+                        raise ConnectionError(f"upload ended after {length - remaining} of {length} bytes")
+                    f.write(chunk)
+                    remaining -= len(chunk)
+            with self._lock:
+                self._forget_finished_jobs()
+                self._queue.put_nowait(job)
+                self._jobs[job.job_id] = job
+                self.counters["submitted"] += 1
+            return job
+        except queue.Full:
+            with self._lock:
+                self.counters["rejected"] += 1
+            shutil.rmtree(job_dir, ignore_errors=True)
+            return None
+        except BaseException:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+
+    def reject(self):
+        """Counts an upload refused before it was read."""
+        with self._lock:
+            self.counters["rejected"] += 1
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _forget_finished_jobs(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and now - job.finished_at > SERVICE_RESULT_TTL_SECONDS:
+                del self._jobs[job_id]
+
+    def _work(self):
+        while not self._stop_event.is_set():
+            try:
+                job = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            with self._lock:
+                job.status = "running"
+                job.started_at = time.time()
+            try:
+                invoice, error, timing = self._process(job.file_path)
+            except Exception as e:
+                invoice, error, timing = None, f"{type(e).__name__}: {e}", None
+            finally:
+                shutil.rmtree(os.path.dirname(job.file_path), ignore_errors=True)
+            if error is None and invoice is None:
+                error = "no text could be extracted"
+            with self._lock:
+                job.invoice, job.error, job.timing = invoice, error, timing
+                job.status = "failed" if error else "done"
+                job.finished_at = time.time()
+                self.counters["failed" if error else "completed"] += 1
+                self._recent.append((job.finished_at, job.finished_at - job.started_at))
+
+    def _process(self, file_path):
+        """
+        Extracts one file: with one worker, or when FILE_TIMEOUT_SECONDS /
+        MAX_FILE_MEMORY_BYTES run every file in its own governed process,
+        through iter_invoices; otherwise in the shared process pool.
+        """
+        if self.workers == 1 or invoice_processor._isolation_enabled():
+            _, invoice, error, timing = next(invoice_processor.iter_invoices([file_path], workers=1))
+            return invoice, error, timing
+        pdf_text_backend = invoice_processor.select_pdf_text_backend([file_path])
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            pool = self._pool
+        try:
+            result = pool.submit(invoice_processor._process_invoice_file_isolated, file_path, pdf_text_backend).result()
+        except Exception as e:  # e.g. BrokenProcessPool if a worker process died; start a new pool
+            with self._pool_lock:
+                if self._pool is pool:
+                    self._pool = None
+            pool.shutdown(wait=False, cancel_futures=True)
+            result = (None, f"{type(e).__name__}: {e}", None)
+        return invoice_processor._with_timing(file_path, *result)[1:]
+
+    def metrics(self):
+        """Returns queue depth, running jobs, counters, throughput and latency of the service."""
+        now = time.time()
+        with self._lock:
+            while self._recent and now - self._recent[0][0] > METRICS_WINDOW_SECONDS:
+                self._recent.popleft()
+            durations = sorted(seconds for _, seconds in self._recent)
+            running = sum(1 for job in self._jobs.values() if job.status == "running")
+            counters = dict(self.counters)
+        window = min(METRICS_WINDOW_SECONDS, max(now - self.started_at, 1e-9))
+        return {
+            "queue_depth": self._queue.qsize(),
+            "queue_capacity": self.queue_size,
+            "running": running,
+            "workers": self.workers,
+            **counters,
+            "throughput_per_second": len(durations) / window,
+            "processing_seconds_p50": _percentile(durations, 0.50),
+            "processing_seconds_p90": _percentile(durations, 0.90),
+            "window_seconds": METRICS_WINDOW_SECONDS,
+            "uptime_seconds": now - self.started_at,
+        }
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "InvoiceService/1.0"
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def log_message(self, format, *args):
+        pass  # Requests are not logged; see /metrics
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _refuse(self, status, message, headers=None):
+        # The body was not read, so the connection cannot be reused
+        self.close_connection = True
+        self._send_json(status, {"error": message}, dict(headers or {}, Connection="close"))
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/invoices":
+            self._refuse(404, "not found")
+            return
+        file_name = os.path.basename(parse_qs(url.query).get("filename", [""])[0])
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            self._refuse(411, "Content-Length is required")
+            return
+        if not self.service.accepting:
+            self._refuse(503, "service is shutting down")
+        elif not file_name or not file_name.lower().endswith(invoice_processor.SUPPORTED_EXTENSIONS):
+            self._refuse(400, f"filename must end with one of {', '.join(invoice_processor.SUPPORTED_EXTENSIONS)}")
+        elif length > SERVICE_MAX_UPLOAD_BYTES:
+            self._refuse(413, f"file is larger than {SERVICE_MAX_UPLOAD_BYTES} bytes")
+        elif self.service.is_full():
+            self.service.reject()
+            self._refuse(429, "queue is full", {"Retry-After": str(SERVICE_RETRY_AFTER_SECONDS)})
+        else:
+            job = self.service.submit(file_name, self.rfile, length)
+            if job is None:  # Filled up while the upload was read
+                self._send_json(429, {"error": "queue is full"}, {"Retry-After": str(SERVICE_RETRY_AFTER_SECONDS)})
+                return
+            self._send_json(202, {
+                **job.to_dict(),
+                "status_url": f"/invoices/{job.job_id}",
+                "result_url": f"/invoices/{job.job_id}/result",
+            }, {"Location": f"/invoices/{job.job_id}"})
+
+    def do_GET(self):
+        parts = [part for part in urlsplit(self.path).path.split("/") if part]
+        if parts == ["metrics"]:
+            self._send_json(200, self.service.metrics())
+        elif parts == ["healthz"]:
+            self._send_json(200 if self.service.accepting else 503, {"ok": self.service.accepting})
+        elif len(parts) in (2, 3) and parts[0] == "invoices" and parts[2:] in ([], ["result"]):
+            job = self.service.get(parts[1])
+            if job is None:
+                self._send_json(404, {"error": f"unknown job {parts[1]}"})
+            elif len(parts) == 2:
+                self._send_json(200, job.to_dict())
+            else:
+                self._send_json(200 if job.finished else 202, job.to_dict(with_result=job.finished))
+        else:
+            self._send_json(404, {"error": "not found"})
+
+
+class InvoiceServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service):
+        super().__init__(address, _Handler)
+        self.service = service
+
+
+def start_service(host=None, port=None, workers=None, queue_size=None):
+    """
+    Starts the service in background threads and returns the InvoiceServer;
+    server.server_address holds the actual port (use port=0 for any free
+    port). Stop it with stop_service(server).
+    """
+    service = IngestionService(workers, queue_size)
+    service.start()
+    server = InvoiceServer((host or SERVICE_HOST, SERVICE_PORT if port is None else port), service)
+    threading.Thread(target=server.serve_forever, name="invoice-service-http", daemon=True).start()
+    return server
+
+def stop_service(server):
+    server.shutdown()
+    server.server_close()
+    server.service.stop()
+
+def serve(host=None, port=None, workers=None, queue_size=None):
+    """Runs the service until interrupted (Ctrl+C)."""
+    server = start_service(host, port, workers, queue_size)
+    host, port = server.server_address[:2]
+    print(f"Invoice service listening on http://{host}:{port} ({server.service.workers} workers, queue of {server.service.queue_size}).")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print("Stopping invoice service.")
+    finally:
+        stop_service(server)
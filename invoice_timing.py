@@ -0,0 +1,172 @@
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+
+# Per-file, per-stage instrumentation for the invoice pipeline.
+#
+# process_invoice_file and the extraction stages call stage() / note() freely; they only
+# record something while a FileTiming is active (see record_file), so the functions stay
+# usable on their own. The active record lives in a context variable: to record from worker
+# threads, submit work through contextvars.copy_context().run.
+
+_current_record = contextvars.ContextVar("invoice_timing_record", default=None)
+
+
+class FileTiming:
+    """
+    Timing record for one file: wall time per stage, page count, bytes read,
+    whether OCR fallback fired and which stages were served from the cache.
+    """
+
+    def __init__(self, file_name, bytes_read=None):
+        self.file_name = file_name
+        self.bytes_read = bytes_read
+        self.total_seconds = None
+        self.stage_seconds = {}
+        self.pages = None
+        self.ocr_fallback = False
+        self.ocr_pages = 0
+        self.cache_hits = []
+        self.status = "ok"
+        self._lock = threading.Lock()
+
+    def add_stage(self, name, seconds):
+        with self._lock:
+            self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + seconds
+
+    def to_dict(self):
+        return {
+            "file_name": self.file_name,
+            "status": self.status,
+            "total_seconds": self.total_seconds,
+            "stage_seconds": dict(self.stage_seconds),
+            "pages": self.pages,
+            "bytes_read": self.bytes_read,
+            "ocr_fallback": self.ocr_fallback,
+            "ocr_pages": self.ocr_pages,
+            "cache_hits": list(self.cache_hits),
+        }
+
+
+def current_record():
+    """Returns the active FileTiming, or None outside record_file()."""
+    return _current_record.get()
+
+
+@contextlib.contextmanager
+def record_file(file_path):
+    """
+    Makes a new FileTiming for file_path the active record for the duration of the block
+    and measures the block's total wall time.
+    """
+    try:
+        bytes_read = os.path.getsize(file_path)
+    except OSError:
+        bytes_read = None
+    record = FileTiming(os.path.basename(file_path), bytes_read)
+    token = _current_record.set(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException:
+        record.status = "error"
+        raise
+    finally:
+        record.total_seconds = time.perf_counter() - start
+        _current_record.reset(token)
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Adds the block's wall time to stage `name` of the active record, if any."""
+    record = _current_record.get()
+    if record is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record.add_stage(name, time.perf_counter() - start)
+
+
+def note(**fields):
+    """
+    Sets fields on the active record, if any. cache_hit=<stage> is appended
+    to the record's cache hits instead of replacing them.
+    """
+    record = _current_record.get()
+    if record is None:
+        return
+    cache_hit = fields.pop("cache_hit", None)
+    if cache_hit:
+        record.cache_hits.append(cache_hit)
+    for key, value in fields.items():
+        setattr(record, key, value)
+
+
+def write_timings_jsonl(timings, path):
+    """Appends timing dicts to a JSON lines file, one line per file."""
+    with open(path, "a", encoding="utf-8") as f:
+        for timing in timings:
+            f.write(json.dumps(timing) + "\n")
+
+
+def timing_rows(timings):
+    """
+    Flattens timing dicts into rows for a spreadsheet or table: one row per
+    file with a column per stage. Returns (headers, rows).
+    """
+    stage_names = sorted({name for timing in timings for name in timing["stage_seconds"]})
+    headers = ["File Name", "Status", "Total Seconds", "Pages", "Bytes Read", "OCR Fallback", "OCR Pages", "Cache Hits"]
+    headers += [f"{name} (s)" for name in stage_names]
+    rows = []
+    for timing in timings:
+        row = [
+            timing["file_name"], timing["status"], timing["total_seconds"], timing["pages"],
+            timing["bytes_read"], timing["ocr_fallback"], timing["ocr_pages"], ", ".join(timing["cache_hits"]),
+        ]
+        row += [timing["stage_seconds"].get(name) for name in stage_names]
+        rows.append(row)
+    return headers, rows
+
+
+def summarize_timings(timings, top=5):
+    """
+    Returns {"slowest_files": [...], "stages": [...]}: the `top` slowest files and
+    the total/mean time and share of every stage, slowest stage first.
+    """
+    slowest = sorted(timings, key=lambda t: t["total_seconds"] or 0, reverse=True)[:top]
+    totals = {}
+    counts = {}
+    for timing in timings:
+        for name, seconds in timing["stage_seconds"].items():
+            totals[name] = totals.get(name, 0.0) + seconds
+            counts[name] = counts.get(name, 0) + 1
+    grand_total = sum(t["total_seconds"] or 0 for t in timings) or 1.0
+    stages = [
+        {
+            "stage": name,
+            "total_seconds": seconds,
+            "mean_seconds": seconds / counts[name],
+            "files": counts[name],
+            "share": seconds / grand_total,
+        }
+        for name, seconds in sorted(totals.items(), key=lambda item: item[1], reverse=True)
+    ]
+    return {
+        "slowest_files": [
+            {
+                "file_name": t["file_name"],
+                "total_seconds": t["total_seconds"],
+                "slowest_stage": max(t["stage_seconds"], key=t["stage_seconds"].get) if t["stage_seconds"] else None,
+                "pages": t["pages"],
+                "ocr_fallback": t["ocr_fallback"],
+            }
+            for t in slowest
+        ],
+        "stages": stages,
+    }
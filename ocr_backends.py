@@ -0,0 +1,180 @@
+import os
+import shlex
+import subprocess
+import tempfile
+import threading
+
+import pytesseract
+
+try:
+    import tesserocr  # Optional: keeps the Tesseract engine loaded between pages
+except ImportError:
+    tesserocr = None
+
+# OCR backends. Every backend turns a list of PIL images into a list of strings with the same
+# lang/config semantics as pytesseract.image_to_string; they differ in how often the Tesseract
+# start-up cost (process spawn, temp files, loading language data) is paid:
+#   pytesseract  one tesseract process per image (the original behaviour)
+#   batch        one tesseract process per list of images, read from a file list
+#   tesserocr    one engine per thread, reused for every image (needs the tesserocr package)
+
+BACKEND_NAMES = ("pytesseract", "batch", "tesserocr")
+PAGE_SEPARATOR = "\f"  # Tesseract's default page separator in multi-image output
+
+
+class PytesseractBackend:
+    """
+    Calls pytesseract.image_to_string once per image.
+    """
+    name = "pytesseract"
+    batch_size = 1
+
+    def __init__(self, lang, config=""):
+        self.lang = lang
+        self.config = config
+
+    def images_to_strings(self, images):
+        return [pytesseract.image_to_string(image, lang=self.lang, config=self.config) for image in images]
+
+
+class BatchTesseractBackend:
+    """
+    OCRs a list of images with a single tesseract process: the images are
+    written as uncompressed PNM files, tesseract reads them from a list file
+    and separates their text with form feeds. The start-up cost is paid once
+    per batch instead of once per image.
+    """
+    name = "batch"
+
+    def __init__(self, lang, config="", batch_size=8):
+        self.lang = lang
+        self.config = config
+        self.batch_size = batch_size
+
+    def images_to_strings(self, images):
+        if not images:
+            return []
+        with tempfile.TemporaryDirectory(prefix="invoice_ocr_") as temp_dir:
+            list_path = os.path.join(temp_dir, "images.txt")
+            with open(list_path, 'w', encoding='utf-8') as list_file:
+                for index, image in enumerate(images):
+                    image_path = os.path.join(temp_dir, f"{index:04d}.pnm")
+                    _as_pnm_mode(image).save(image_path, format="PPM")
+                    list_file.write(image_path + "\n")
+            command = [pytesseract.pytesseract.tesseract_cmd, list_path, "stdout", "-l", self.lang]
+            command += shlex.split(self.config)
+            completed = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if completed.returncode != 0:
+            raise pytesseract.TesseractError(completed.returncode, completed.stderr.decode("utf-8", "replace").strip())
+        texts = completed.stdout.decode("utf-8", "replace").split(PAGE_SEPARATOR)
+        # Tesseract ends every page with a separator, so there is one trailing empty piece
+        if len(texts) == len(images) + 1 and not texts[-1].strip():
+            texts.pop()
+        if len(texts) != len(images):
+            raise pytesseract.TesseractError(-1, f"expected {len(images)} pages of output, got {len(texts)}")
+        return texts
+
+
+class TesserocrBackend:
+    """
+    Keeps one initialized Tesseract engine per thread (tesserocr.PyTessBaseAPI)
+    and reuses it for every image, so language data is loaded only once per
+    thread. Supports --psm, --oem and -c name=value in config.
+    """
+    name = "tesserocr"
+    batch_size = 1
+
+    def __init__(self, lang, config=""):
+        if tesserocr is None:
+            raise RuntimeError("The tesserocr package is not installed (pip install tesserocr).")
+        self.lang = lang
+        self.config = config
+        self.psm, self.oem, self.variables = _parse_tesseract_config(config)
+        self._local = threading.local()
+
+    def _api(self):
+        api = getattr(self._local, "api", None)
+        if api is None:
+            kwargs = {"lang": self.lang}
+            if self.oem is not None:
+                kwargs["oem"] = tesserocr.OEM(self.oem)
+            api = tesserocr.PyTessBaseAPI(**kwargs)
+            if self.psm is not None:
+                api.SetPageSegMode(tesserocr.PSM(self.psm))
+            for name, value in self.variables.items():
+                api.SetVariable(name, value)
+            self._local.api = api
+        return api
+
+    def images_to_strings(self, images):
+        api = self._api()
+        texts = []
+        for image in images:
+            api.SetImage(image)
+            texts.append(api.GetUTF8Text())
+        return texts
+
+
+def _as_pnm_mode(image):
+    if image.mode in ("1", "L", "RGB"):
+        return image
+    return image.convert("RGB")
+
+def _parse_tesseract_config(config):
+    """
+    Splits a tesseract command line config into (psm, oem, variables).
+    Raises ValueError for options tesserocr cannot apply.
+    """
+    psm = oem = None
+    variables = {}
+    args = shlex.split(config)
+    index = 0
+    while index < len(args):
+        arg = args[index]
+        if arg in ("--psm", "--oem", "-c") and index + 1 < len(args):
+            value = args[index + 1]
+            index += 2
+        else:
+            raise ValueError(f"Unsupported option for the tesserocr backend: {arg}")
+        if arg == "--psm":
+            psm = int(value)
+        elif arg == "--oem":
+            oem = int(value)
+        else:
+            name, _, setting = value.partition("=")
+            variables[name] = setting
+    return psm, oem, variables
+
+def resolve_backend_name(name):
+    """
+    Returns the backend name that will be used for name. "auto" picks
+    tesserocr when it is installed and pytesseract otherwise; batch is only
+    used when chosen explicitly.
+    """
+    if name == "auto":
+        return "tesserocr" if tesserocr is not None else "pytesseract"
+    if name not in BACKEND_NAMES:
+        raise ValueError(f"Unknown OCR backend: {name}. Choose one of {', '.join(BACKEND_NAMES)} or auto.")
+    return name
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+def get_ocr_backend(name, lang, config="", batch_size=8):
+    """
+    Returns a shared backend instance for (name, lang, config, batch_size).
+    Backends are reused so that engines kept by tesserocr stay loaded.
+    """
+    name = resolve_backend_name(name)
+    key = (name, lang, config, batch_size)
+    with _backends_lock:
+        backend = _backends.get(key)
+        if backend is None:
+            if name == "tesserocr":
+                backend = TesserocrBackend(lang, config)
+            elif name == "batch":
+                backend = BatchTesseractBackend(lang, config, batch_size)
+            else:
+                backend = PytesseractBackend(lang, config)
+            _backends[key] = backend
+    return backend
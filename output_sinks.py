@@ -0,0 +1,254 @@
+import csv
+import itertools
+import os
+import re
+import sqlite3
+import tempfile
+
+try:
+    import pyarrow  # Optional: needed for Parquet output only
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# --- Configuration ---
+WRITE_BATCH_ROWS = 5000  # Rows handed to a sink at a time by write_csv, write_sqlite and write_parquet
+SQLITE_TABLE = "invoices"
+SQLITE_BATCH_ROWS = 5000  # Rows per executemany call; all batches share one transaction
+PARQUET_ROW_GROUP_ROWS = 64 * 1024
+PARQUET_FLOAT_COLUMNS = ("Total Amount",)  # Stored as float64; every other column is stored as text
+
+# Tabular output sinks besides Excel. Every sink is a class
+#   sink = Sink(path, headers, append=False)
+#   sink.write(rows)    any number of times, rows being lists of cell values in header order
+#   sink.close()        finishes the file and returns the number of rows written
+#   sink.abort()        gives up, leaving the file as it was
+# so that invoice_processor.write_outputs can feed every output from one pass over the rows
+# without collecting them. With append=False the file is replaced (atomically, on close);
+# with append=True rows are added to it. write_outputs picks the sink from the file extension
+# (see SINKS); write_csv, write_sqlite and write_parquet write an iterable of rows in one call.
+#   .csv             csv module, streamed row by row
+#   .sqlite / .db    one table, bulk inserted with executemany inside a single transaction
+#   .parquet         columnar file written with pyarrow (pip install pyarrow), one row group
+#                    per PARQUET_ROW_GROUP_ROWS rows
+
+# --- Helper Functions ---
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+def _temp_path_for(path):
+    """A new file in the same directory as path, to be moved over it when complete."""
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=os.path.splitext(path)[1])
+    os.close(fd)
+    return temp_path
+
+def _remove(path):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+def _write_all(sink, rows):
+    try:
+        for batch in _batches(rows, WRITE_BATCH_ROWS):
+            sink.write(batch)
+    except BaseException:
+        sink.abort()
+        raise
+    return sink.close()
+
+
+class CsvSink:
+    """
+    Writes rows as UTF-8 CSV. Appending to a non-empty file adds the rows
+    without repeating the header.
+    """
+
+    def __init__(self, path, headers, append=False):
+        self.path = path
+        self.count = 0
+        self.temp_path = None
+        if append and os.path.exists(path) and os.path.getsize(path) > 0:
+            self.file = open(path, "a", newline="", encoding="utf-8")
+            self.writer = csv.writer(self.file)
+        else:
+            self.temp_path = _temp_path_for(path)
+            self.file = open(self.temp_path, "w", newline="", encoding="utf-8")
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(headers)
+
+    def write(self, rows):
+        for row in rows:
+            self.writer.writerow(row)
+            self.count += 1
+
+    def close(self):
+        self.file.close()
+        if self.temp_path:
+            os.replace(self.temp_path, self.path)
+        return self.count
+
+    def abort(self):
+        self.file.close()
+        _remove(self.temp_path)  # Rows already appended to an existing file stay
+
+
+def sqlite_column_name(header):
+    """Turns an Excel header into a column name: "Invoice Number" -> invoice_number."""
+    return re.sub(r"\W+", "_", header.strip().lower()).strip("_")
+
+
+class SqliteSink:
+    """
+    Writes rows to the SQLITE_TABLE table of a SQLite database, with
+    executemany per batch inside one transaction. Without append the table
+    is dropped and recreated. Columns are declared without a type, so
+    numbers and text keep their Python types.
+    """
+
+    def __init__(self, path, headers, append=False):
+        columns = [sqlite_column_name(header) for header in headers]
+        column_list = ", ".join(f'"{column}"' for column in columns)
+        placeholders = ", ".join("?" for _ in columns)
+        self.insert = f'INSERT INTO "{SQLITE_TABLE}" ({column_list}) VALUES ({placeholders})'
+        self.count = 0
+        self.conn = sqlite3.connect(path, timeout=30)
+        try:
+            self.conn.execute("BEGIN")
+            if not append:
+                self.conn.execute(f'DROP TABLE IF EXISTS "{SQLITE_TABLE}"')
+            self.conn.execute(f'CREATE TABLE IF NOT EXISTS "{SQLITE_TABLE}" ({column_list})')
+        except BaseException:
+            self.abort()
+            raise
+
+    def write(self, rows):
+        for batch in _batches(rows, SQLITE_BATCH_ROWS):
+            self.conn.executemany(self.insert, batch)
+            self.count += len(batch)
+
+    def close(self):
+        try:
+            self.conn.commit()
+        finally:
+            self.conn.close()
+        return self.count
+
+    def abort(self):
+        try:
+            self.conn.rollback()
+        finally:
+            self.conn.close()
+
+
+def parquet_schema(headers):
+    """
+    The fixed Parquet schema of the output: float64 for PARQUET_FLOAT_COLUMNS,
+    string for every other column. It does not depend on the values, so a
+    column that is empty in one batch still matches the next batch.
+    """
+    return pyarrow.schema([
+        (header, pyarrow.float64() if header in PARQUET_FLOAT_COLUMNS else pyarrow.string()) for header in headers
+    ])
+
+def _parquet_table(headers, rows):
+    """Builds a pyarrow table with parquet_schema(headers) from rows."""
+    schema = parquet_schema(headers)
+    columns = [list(column) for column in zip(*rows)] if rows else [[] for _ in headers]
+    arrays = []
+    for field, values in zip(schema, columns):
+        if field.type == pyarrow.float64():
+            arrays.append(pyarrow.array([None if value in (None, "") else float(value) for value in values], type=field.type))
+        else:
+            arrays.append(pyarrow.array([None if value in (None, "") else str(value) for value in values], type=field.type))
+    return pyarrow.Table.from_arrays(arrays, schema=schema)
+
+
+class ParquetSink:
+    """
+    Writes rows as a Parquet file, one row group per PARQUET_ROW_GROUP_ROWS
+    rows. Parquet files cannot be extended in place, so appending copies the
+    existing file's row groups into a new file first (a columnar read, one
+    row group at a time) and adds the rows after them; the new file replaces
+    the old one on close.
+    """
+
+    def __init__(self, path, headers, append=False):
+        if pyarrow is None:
+            raise RuntimeError("Parquet output needs the pyarrow package (pip install pyarrow).")
+        self.path = path
+        self.headers = headers
+        self.schema = parquet_schema(headers)
+        self.count = 0
+        self.pending = []
+        self.temp_path = _temp_path_for(path)
+        try:
+            self.writer = pyarrow.parquet.ParquetWriter(self.temp_path, self.schema)
+            if append and os.path.exists(path):
+                with pyarrow.parquet.ParquetFile(path) as existing:
+                    for group in range(existing.num_row_groups):
+                        table = existing.read_row_group(group)
+                        if not table.schema.equals(self.schema):  # Written before the schema was fixed
+                            table = table.cast(self.schema)
+                        self.writer.write_table(table)
+        except BaseException:
+            _remove(self.temp_path)
+            raise
+
+    def write(self, rows):
+        self.pending.extend(rows)
+        while len(self.pending) >= PARQUET_ROW_GROUP_ROWS:
+            self._flush(PARQUET_ROW_GROUP_ROWS)
+
+    def _flush(self, size):
+        rows, self.pending = self.pending[:size], self.pending[size:]
+        self.writer.write_table(_parquet_table(self.headers, rows), row_group_size=PARQUET_ROW_GROUP_ROWS)
+        self.count += len(rows)
+
+    def close(self):
+        try:
+            if self.pending:
+                self._flush(len(self.pending))
+            self.writer.close()
+            os.replace(self.temp_path, self.path)
+        except BaseException:
+            _remove(self.temp_path)
+            raise
+        return self.count
+
+    def abort(self):
+        try:
+            self.writer.close()
+        finally:
+            _remove(self.temp_path)
+
+
+def write_csv(path, headers, rows, append=False):
+    """Writes rows with a CsvSink. Returns the number of rows written."""
+    return _write_all(CsvSink(path, headers, append), rows)
+
+def write_sqlite(path, headers, rows, append=False):
+    """Writes rows with a SqliteSink. Returns the number of rows written."""
+    return _write_all(SqliteSink(path, headers, append), rows)
+
+def write_parquet(path, headers, rows, append=False):
+    """Writes rows with a ParquetSink. Returns the number of rows written."""
+    return _write_all(ParquetSink(path, headers, append), rows)
+
+SINKS = {
+    ".csv": CsvSink,
+    ".sqlite": SqliteSink,
+    ".db": SqliteSink,
+    ".parquet": ParquetSink,
+}
+
+def sink_for(path):
+    """Returns the sink class for an output path, by its extension."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in SINKS:
+        raise ValueError(f"Unsupported output format: {path}. Use .xlsx or one of {', '.join(SINKS)}.")
+    return SINKS[extension]
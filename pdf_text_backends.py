@@ -0,0 +1,208 @@
+import os
+import shlex
+import shutil
+import subprocess
+import threading
+import time
+
+import PyPDF2
+
+# PDF text-layer backends. Every backend turns a PDF file into a list with one string per page
+# (empty for pages without a text layer) and raises if the file cannot be read:
+#   pypdf2     PyPDF2's pure-Python page.extract_text() (the original behaviour)
+#   pdftotext  poppler's pdftotext, one process per document; much faster on long digital
+#              statements. poppler is already needed for OCR (see packages.txt).
+# Backends lay out whitespace differently, so page text is measured with text_length (characters
+# other than whitespace) when deciding whether a page needs OCR; the fallback threshold then
+# means the same with every backend.
+#
+# "auto" benchmarks the available backends on a sample of the batch (choose_backend) and uses
+# the fastest one whose output is acceptable: it must not leave more pages below the OCR
+# threshold than any other backend, nor score lower on the caller's check (invoice_processor
+# counts the invoice fields parsed from the text). Until a sample has been benchmarked, "auto"
+# means pypdf2. The parent process passes its choice to worker processes (use_backend), so
+# extraction and cache keys match however the workers were started.
+
+BACKEND_NAMES = ("pypdf2", "pdftotext")
+PAGE_SEPARATOR = "\f"  # pdftotext ends every page with a form feed
+
+
+class PyPDF2TextBackend:
+    """
+    Extracts page texts with PyPDF2.
+    """
+    name = "pypdf2"
+
+    def is_available(self):
+        return True
+
+    def version(self):
+        return f"PyPDF2 {PyPDF2.__version__}"
+
+    def page_texts(self, pdf_path):
+        with open(pdf_path, 'rb') as f:
+            reader = PyPDF2.PdfReader(f)
+            return [page.extract_text() or "" for page in reader.pages]
+
+
+class PdftotextBackend:
+    """
+    Extracts page texts with one pdftotext process per document, read from
+    its standard output and split at the form feeds between pages. args are
+    extra pdftotext options, e.g. "-layout".
+    """
+    name = "pdftotext"
+
+    def __init__(self, command="pdftotext", args=""):
+        self.command = command
+        self.args = args
+        self._version = None
+
+    def is_available(self):
+        return shutil.which(self.command) is not None
+
+    def version(self):
+        if self._version is None:
+            try:
+                completed = subprocess.run([self.command, "-v"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+                self._version = completed.stdout.decode("utf-8", "replace").splitlines()[0].strip()
+            except (OSError, IndexError):
+                self._version = "pdftotext"
+        return f"{self._version} {self.args}".strip()
+
+    def page_texts(self, pdf_path):
+        command = [self.command, "-enc", "UTF-8"] + shlex.split(self.args) + [pdf_path, "-"]
+        completed = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if completed.returncode != 0:
+            raise RuntimeError(
+                f"pdftotext failed with exit code {completed.returncode}: {completed.stderr.decode('utf-8', 'replace').strip()}"
+            )
+        texts = completed.stdout.decode("utf-8", "replace").split(PAGE_SEPARATOR)
+        # The separator after the last page leaves one trailing empty piece
+        if len(texts) > 1 and not texts[-1].strip():
+            texts.pop()
+        return texts
+
+
+def text_length(page_text):
+    """Number of characters in page_text other than whitespace."""
+    return sum(1 for character in page_text if not character.isspace())
+
+def needs_ocr(page_text, min_chars):
+    """True if a page's text layer is too short to be used instead of OCR."""
+    return text_length(page_text) < min_chars
+
+def create_backend(name, pdftotext_command="pdftotext", pdftotext_args=""):
+    if name == "pypdf2":
+        return PyPDF2TextBackend()
+    if name == "pdftotext":
+        return PdftotextBackend(pdftotext_command, pdftotext_args)
+    raise ValueError(f"Unknown PDF text backend: {name}. Choose one of {', '.join(BACKEND_NAMES)} or auto.")
+
+def benchmark_backends(backends, sample_paths, min_chars, score=None):
+    """
+    Extracts every sample PDF with every backend. Returns one dict per
+    backend: name, seconds (total), pages, text_pages (pages at or above
+    min_chars), score (sum of score(text) over the samples, if given) and
+    error (None, or the first failure; the backend is then unusable).
+    """
+    results = []
+    for backend in backends:
+        result = {"name": backend.name, "seconds": 0.0, "pages": 0, "text_pages": 0, "score": 0, "error": None}
+        for pdf_path in sample_paths:
+            began = time.perf_counter()
+            try:
+                page_texts = backend.page_texts(pdf_path)
+            except Exception as e:
+                result["error"] = f"{os.path.basename(pdf_path)}: {type(e).__name__}: {e}"
+                break
+            result["seconds"] += time.perf_counter() - began
+            result["pages"] += len(page_texts)
+            result["text_pages"] += sum(1 for page_text in page_texts if not needs_ocr(page_text, min_chars))
+            if score is not None:
+                result["score"] += score("\n".join(page_texts))
+        results.append(result)
+    return results
+
+def choose_backend(results):
+    """
+    Picks from benchmark_backends results the fastest backend that did not
+    fail and matches the best text_pages and score of all backends. Returns
+    its name, or None if every backend failed.
+    """
+    usable = [result for result in results if result["error"] is None]
+    if not usable:
+        return None
+    best_text_pages = max(result["text_pages"] for result in usable)
+    best_score = max(result["score"] for result in usable)
+    acceptable = [result for result in usable if result["text_pages"] == best_text_pages and result["score"] == best_score]
+    return min(acceptable, key=lambda result: result["seconds"])["name"]
+
+
+_selected = {}  # (pdftotext_command, pdftotext_args) -> name chosen by select_backend
+_selected_lock = threading.Lock()
+
+def select_backend(sample_paths, min_chars, score=None, pdftotext_command="pdftotext", pdftotext_args=""):
+    """
+    Chooses the backend "auto" stands for in this process, by benchmarking
+    the available backends on sample_paths (see choose_backend). The choice
+    is made once per process; later calls return it without benchmarking.
+    Worker processes do not reliably inherit it (only under fork), so pass
+    the name to them and call use_backend there.
+    """
+    key = (pdftotext_command, pdftotext_args)
+    with _selected_lock:
+        if key in _selected:
+            return _selected[key]
+        backends = [create_backend(name, pdftotext_command, pdftotext_args) for name in BACKEND_NAMES]
+        backends = [backend for backend in backends if backend.is_available()]
+        name = None
+        if len(backends) > 1 and sample_paths:
+            results = benchmark_backends(backends, sample_paths, min_chars, score)
+            for result in results:
+                status = f"failed ({result['error']})" if result["error"] else f"{result['seconds']:.3f}s, {result['text_pages']}/{result['pages']} pages with text"
+                print(f"PDF text backend {result['name']}: {status}")
+            name = choose_backend(results)
+        if name is None:
+            return None  # Nothing to compare yet; resolve_backend_name falls back to its default
+        print(f"Using PDF text backend: {name}")
+        _selected[key] = name
+        return name
+
+def use_backend(name, pdftotext_command="pdftotext", pdftotext_args=""):
+    """
+    Makes "auto" stand for name in this process, e.g. in a worker process
+    given the backend select_backend chose in the parent.
+    """
+    if name not in BACKEND_NAMES:
+        raise ValueError(f"Unknown PDF text backend: {name}. Choose one of {', '.join(BACKEND_NAMES)}.")
+    with _selected_lock:
+        _selected[(pdftotext_command, pdftotext_args)] = name
+
+def resolve_backend_name(name, pdftotext_command="pdftotext", pdftotext_args=""):
+    """
+    Returns the backend name that will be used for name. "auto" is the
+    backend chosen by select_backend (or set by use_backend) in this
+    process, or pypdf2, the original extractor, before one was chosen.
+    """
+    if name != "auto":
+        if name not in BACKEND_NAMES:
+            raise ValueError(f"Unknown PDF text backend: {name}. Choose one of {', '.join(BACKEND_NAMES)} or auto.")
+        return name
+    return _selected.get((pdftotext_command, pdftotext_args)) or "pypdf2"
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+def get_pdf_text_backend(name, pdftotext_command="pdftotext", pdftotext_args=""):
+    """
+    Returns a shared backend instance for name (resolving "auto").
+    """
+    name = resolve_backend_name(name, pdftotext_command, pdftotext_args)
+    key = (name, pdftotext_command, pdftotext_args)
+    with _backends_lock:
+        backend = _backends.get(key)
+        if backend is None:
+            backend = create_backend(name, pdftotext_command, pdftotext_args)
+            _backends[key] = backend
+    return backend
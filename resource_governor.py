@@ -0,0 +1,100 @@
+import collections
+import multiprocessing
+import os
+import signal
+import time
+from multiprocessing.connection import wait
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; the memory ceiling is then not enforced
+    resource = None
+
+# Per-file resource governor. run_isolated runs every file in a child process of its own so
+# that a runaway file (a PDF that hangs the parser, a huge scan that exhausts memory) can be
+# killed without taking the batch down. Each child gets its own process group, so the
+# tesseract and pdftoppm processes it started are killed along with it, and an address-space
+# limit (RLIMIT_AS, inherited by those programs too) turns runaway allocations into
+# MemoryError. invoice_processor reports such files as quarantined.
+
+POLL_SECONDS = 0.2  # How often running children are checked against the timeout
+
+
+class ResourceLimitError(Exception):
+    """
+    Raised when a file exceeds a configured resource limit (pixels, pages,
+    time, memory). The file is quarantined instead of processed.
+    """
+
+
+def _child_main(conn, func, arg, max_memory_bytes):
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()  # Lets the parent kill this child's tesseract/pdftoppm processes as well
+    if resource is not None and max_memory_bytes:
+        resource.setrlimit(resource.RLIMIT_AS, (max_memory_bytes, max_memory_bytes))
+    try:
+        conn.send(("done", func(arg)))
+    except MemoryError:
+        conn.send(("memory", None))
+    finally:
+        conn.close()
+
+def _kill(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (AttributeError, ProcessLookupError, PermissionError):
+        process.kill()
+    process.join()
+
+def run_isolated(func, args, workers=1, timeout=None, max_memory_bytes=None, stop_event=None):
+    """
+    Calls func(arg) for every arg, each in a new child process, with at most
+    `workers` children at a time. func must be a module-level function and
+    its result picklable.
+    Yields (index, status, value) as children finish, in completion order:
+      "done"     value is func's return value
+      "timeout"  the child ran longer than timeout seconds and was killed
+      "memory"   the child hit max_memory_bytes (MemoryError escaped func)
+      "crashed"  the child died without a result; value is its exit code
+    Children still running when the generator is closed, or when stop_event
+    (a threading.Event) is set, are killed; no further results are yielded.
+    """
+    context = multiprocessing.get_context()
+    pending = collections.deque(enumerate(args))
+    running = {}  # connection -> (index, process, start time)
+    try:
+        while pending or running:
+            if stop_event is not None and stop_event.is_set():
+                return
+            while pending and len(running) < max(1, workers):
+                index, arg = pending.popleft()
+                parent_conn, child_conn = context.Pipe(duplex=False)
+                process = context.Process(target=_child_main, args=(child_conn, func, arg, max_memory_bytes))
+                process.start()
+                child_conn.close()
+                running[parent_conn] = (index, process, time.monotonic())
+
+            for conn in wait(list(running), timeout=POLL_SECONDS):
+                index, process, _ = running.pop(conn)
+                try:
+                    status, value = conn.recv()
+                except (EOFError, OSError):
+                    status, value = "crashed", None
+                conn.close()
+                process.join()
+                if status == "crashed":
+                    value = process.exitcode
+                yield index, status, value
+
+            if timeout:
+                now = time.monotonic()
+                for conn, (index, process, started) in list(running.items()):
+                    if now - started > timeout:
+                        del running[conn]
+                        _kill(process)
+                        conn.close()
+                        yield index, "timeout", None
+    finally:
+        for conn, (_, process, _) in running.items():
+            _kill(process)
+            conn.close()
@@ -0,0 +1,210 @@
+import io
+import zipfile
+
+import openpyxl
+import pytest
+
+import excel_stream
+
+HEADERS = ["Invoice Number", "Invoice Date", "Total Amount", "Vendor Name", "File Name", "Status"]
+
+
+def _write_workbook(path, rows):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+
+
+def _read_rows(path):
+    workbook = openpyxl.load_workbook(path)
+    return [list(row) for row in workbook.active.iter_rows(values_only=True)]
+
+
+def _sheet_xml(path):
+    with zipfile.ZipFile(path) as archive:
+        return archive.read("xl/worksheets/sheet1.xml")
+
+
+def _copy_sheet(xml, rows, chunk_size, monkeypatch):
+    monkeypatch.setattr(excel_stream, "CHUNK_SIZE", chunk_size)
+    target = io.BytesIO()
+    excel_stream._copy_sheet_with_rows(io.BytesIO(xml), target, rows)
+    return target.getvalue()
+
+
+def test_append_continues_numbering(tmp_path):
+    path = str(tmp_path / "ledger.xlsx")
+    _write_workbook(path, [HEADERS, ["INV-1", "01/02/2024", 10.5, "Acme", "a.pdf", None]])
+
+    assert excel_stream.append_rows_to_xlsx(path, [["INV-2", None, 3, "Globex", "b.pdf", "quarantined: timed out"]]) == 1
+
+    assert _read_rows(path) == [
+        HEADERS,
+        ["INV-1", "01/02/2024", 10.5, "Acme", "a.pdf", None],
+        ["INV-2", None, 3, "Globex", "b.pdf", "quarantined: timed out"],
+    ]
+    assert b'<dimension ref="A1:F3"/>' in _sheet_xml(path)
+
+
+def test_unchanged_members_are_copied_raw(tmp_path):
+    path = str(tmp_path / "ledger.xlsx")
+    _write_workbook(path, [HEADERS, ["INV-1", "01/02/2024", 10.5, "Acme", "a.pdf", None]])
+    with zipfile.ZipFile(path) as archive:
+        before = {item.filename: (item.CRC, item.compress_size) for item in archive.infolist()}
+
+    excel_stream.append_rows_to_xlsx(path, [["INV-2", None, 3, "Globex", "b.pdf", None]])
+
+    with zipfile.ZipFile(path) as archive:
+        assert archive.testzip() is None
+        after = {item.filename: (item.CRC, item.compress_size) for item in archive.infolist()}
+    assert before.keys() == after.keys()
+    changed = [name for name in before if before[name] != after[name]]
+    assert changed == ["xl/worksheets/sheet1.xml"]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 7, 11, 16, 64, 1 << 20])
+def test_tags_split_across_chunks(chunk_size, monkeypatch):
+    xml = (
+        b'<?xml version="1.0"?><worksheet><dimension ref="A1:B12"/><sheetData>'
+        b'<row r="1" spans="1:2"><c r="A1"><v>1</v></c></row>'
+        b'<row spans="1:2" customHeight="1" ht="15" r="12"><c r="A12"><v>2</v></c></row>'
+        b'</sheetData><pageMargins/></worksheet>'
+    )
+    output = _copy_sheet(xml, [["x", 1]], chunk_size, monkeypatch)
+
+    assert output == xml.replace(b"A1:B12", b"A1:B13").replace(
+        b"</sheetData>", b'<row r="13"><c r="A13" t="inlineStr"><is><t xml:space="preserve">x</t></is></c><c r="B13"><v>1</v></c></row></sheetData>'
+    )
+
+
+@pytest.mark.parametrize("chunk_size", [1, 4, 9, 1 << 20])
+@pytest.mark.parametrize("sheet_data", [b"<sheetData/>", b"<sheetData />", b"<sheetData></sheetData>"])
+def test_empty_sheet_data(chunk_size, sheet_data, monkeypatch):
+    xml = b'<worksheet><dimension ref="A1"/>' + sheet_data + b'<pageMargins/></worksheet>'
+    output = _copy_sheet(xml, [["a", "b", "c"], ["d"]], chunk_size, monkeypatch)
+
+    assert output.startswith(b'<worksheet><dimension ref="A1:C2"/><sheetData><row r="1">')
+    assert output.endswith(b'<row r="2"><c r="A2" t="inlineStr"><is><t xml:space="preserve">d</t></is></c></row></sheetData><pageMargins/></worksheet>')
+
+
+def test_dimension_without_range(monkeypatch):
+    xml = b'<worksheet><dimension ref="A1"/><sheetData><row r="1"><c r="A1"><v>1</v></c></row></sheetData></worksheet>'
+    output = _copy_sheet(xml, [[1, 2]], 1 << 20, monkeypatch)
+
+    assert b'<dimension ref="A1:B2"/>' in output
+    assert b'<row r="2">' in output
+
+
+def test_append_to_empty_workbook(tmp_path):
+    path = str(tmp_path / "empty.xlsx")
+    openpyxl.Workbook().save(path)
+
+    excel_stream.append_rows_to_xlsx(path, [HEADERS])
+
+    assert _read_rows(path) == [HEADERS]
+    assert b'<dimension ref="A1:F1"/>' in _sheet_xml(path)
+
+
+def test_missing_sheet_data_end_raises(monkeypatch):
+    with pytest.raises(ValueError):
+        _copy_sheet(b'<worksheet><sheetData><row r="1"></row>', [[1]], 4, monkeypatch)
+
+
+OLD_HEADERS = HEADERS[:5]  # Ledgers started before the Status column was added
+
+
+def _with_shared_string_header(path, headers):
+    """Rewrites the header row of an openpyxl workbook as shared string cells, like Excel saves it."""
+    with zipfile.ZipFile(path) as archive:
+        members = {item.filename: archive.read(item) for item in archive.infolist()}
+    sheet = members["xl/worksheets/sheet1.xml"]
+    for index, header in enumerate(headers):
+        column = excel_stream._column_letter(index + 1)
+        sheet = sheet.replace(
+            f'<c r="{column}1" t="inlineStr"><is><t>{header}</t></is></c>'.encode(),
+            f'<c r="{column}1" t="s"><v>{index}</v></c>'.encode(),
+        )
+    assert sheet.count(b't="s"') == len(headers)
+    members["xl/worksheets/sheet1.xml"] = sheet
+    items = "".join(f"<si><t>{header}</t></si>" for header in headers)
+    members["xl/sharedStrings.xml"] = (
+        f'<sst xmlns="{excel_stream._NS_MAIN}" count="{len(headers)}" uniqueCount="{len(headers)}">{items}</sst>'
+    ).encode()
+    members["xl/_rels/workbook.xml.rels"] = members["xl/_rels/workbook.xml.rels"].replace(
+        b"</Relationships>", f'<Relationship Id="rIdSst" Type="{excel_stream._SHARED_STRINGS_REL}" Target="sharedStrings.xml"/></Relationships>'.encode()
+    )
+    members["[Content_Types].xml"] = members["[Content_Types].xml"].replace(
+        b"</Types>",
+        b'<Override PartName="/xl/sharedStrings.xml" '
+        b'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/></Types>',
+    )
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+
+
+@pytest.mark.parametrize("shared_strings", [False, True])
+def test_append_extends_older_header(tmp_path, shared_strings):
+    path = str(tmp_path / "ledger.xlsx")
+    _write_workbook(path, [OLD_HEADERS, ["INV-1", "01/02/2024", 10.5, "Acme", "a.pdf"]])
+    if shared_strings:
+        _with_shared_string_header(path, OLD_HEADERS)
+
+    excel_stream.append_rows_to_xlsx(path, [["INV-2", None, 3, "Globex", "b.pdf", "quarantined: timed out"]], headers=HEADERS)
+
+    assert _read_rows(path) == [
+        HEADERS,
+        ["INV-1", "01/02/2024", 10.5, "Acme", "a.pdf", None],
+        ["INV-2", None, 3, "Globex", "b.pdf", "quarantined: timed out"],
+    ]
+    assert b'<dimension ref="A1:F3"/>' in _sheet_xml(path)
+
+
+def test_append_refuses_other_header(tmp_path):
+    path = str(tmp_path / "ledger.xlsx")
+    _write_workbook(path, [["Date", "Amount"], ["01/02/2024", 10.5]])
+    with open(path, "rb") as f:
+        before = f.read()
+
+    with pytest.raises(excel_stream.HeaderMismatchError):
+        excel_stream.append_rows_to_xlsx(path, [["INV-2", None, 3, "Globex", "b.pdf", None]], headers=HEADERS)
+
+    with open(path, "rb") as f:
+        assert f.read() == before
+    assert list(tmp_path.iterdir()) == [tmp_path / "ledger.xlsx"]
+
+
+def test_append_to_empty_sheet_writes_header(tmp_path):
+    path = str(tmp_path / "empty.xlsx")
+    openpyxl.Workbook().save(path)
+
+    assert excel_stream.append_rows_to_xlsx(path, [["INV-1", None, 1, "Acme", "a.pdf", None]], headers=HEADERS) == 1
+
+    assert _read_rows(path) == [HEADERS, ["INV-1", None, 1, "Acme", "a.pdf", None]]
+
+
+def test_failed_raw_copy_falls_back_to_recompressing(tmp_path, monkeypatch):
+    path = str(tmp_path / "ledger.xlsx")
+    _write_workbook(path, [HEADERS, ["INV-1", "01/02/2024", 10.5, "Acme", "a.pdf", None]])
+
+    def failing_copy(source_zip, item, target_zip):
+        target_zip.fp.seek(target_zip.start_dir)
+        target_zip.fp.write(b"partial copy")
+        raise ValueError("simulated")
+
+    monkeypatch.setattr(excel_stream, "_copy_member_raw", failing_copy)
+    excel_stream.append_rows_to_xlsx(path, [["INV-2", None, 3, "Globex", "b.pdf", None]])
+
+    with zipfile.ZipFile(path) as archive:
+        assert archive.testzip() is None
+    assert _read_rows(path)[-1] == ["INV-2", None, 3, "Globex", "b.pdf", None]
+
+
+def test_missing_headers():
+    assert excel_stream.missing_headers(OLD_HEADERS + [None], HEADERS) == ["Status"]
+    assert excel_stream.missing_headers([], HEADERS) == HEADERS
+    assert excel_stream.missing_headers(HEADERS, HEADERS) == []
+    with pytest.raises(excel_stream.HeaderMismatchError):
+        excel_stream.missing_headers(HEADERS + ["Notes"], HEADERS)
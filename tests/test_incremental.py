@@ -0,0 +1,93 @@
+import openpyxl
+
+import invoice_processor
+from invoice_manifest import load_manifest, manifest_path_for
+
+
+def _write_invoice(path, number, footer=""):
+    path.write_text(f"Acme Supplies Ltd\nInvoice Number: {number}\nTotal Amount: 10.00\n{footer}")
+
+
+def _statuses(output_file):
+    return {name: entry["status"] for name, entry in load_manifest(manifest_path_for(output_file))["files"].items()}
+
+
+def _invoice_numbers(output_file):
+    return [row[0] for row in openpyxl.load_workbook(output_file).active.iter_rows(min_row=2, values_only=True)]
+
+
+def test_duplicates_dropped_while_writing_are_recorded(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # The extraction cache is created in the working directory
+    monkeypatch.setattr(invoice_processor, "DUPLICATE_CHECK", True)
+    (tmp_path / "inv").mkdir()
+    output_file = str(tmp_path / "out.xlsx")
+    _write_invoice(tmp_path / "inv" / "a.txt", "INV-1")
+    _write_invoice(tmp_path / "inv" / "b.txt", "INV-1", "Scanned copy\n")  # Same invoice, other file content
+
+    invoice_processor.process_invoices_incremental("inv", output_file)
+
+    assert _invoice_numbers(output_file) == ["INV-1"]
+    assert _statuses(output_file) == {"a.txt": "ok", "b.txt": "duplicate"}
+
+    _write_invoice(tmp_path / "inv" / "c.txt", "INV-1", "Resent\n")  # Dropped while appending
+    _write_invoice(tmp_path / "inv" / "d.txt", "INV-2")
+    invoice_processor.process_invoices_incremental("inv", output_file)
+
+    assert _invoice_numbers(output_file) == ["INV-1", "INV-2"]
+    assert _statuses(output_file) == {"a.txt": "ok", "b.txt": "duplicate", "c.txt": "duplicate", "d.txt": "ok"}
+
+
+def _failing(monkeypatch, file_name, error, times):
+    """Makes process_invoice_file raise error for file_name on its next `times` calls."""
+    calls = []
+    process_invoice_file = invoice_processor.process_invoice_file
+
+    def flaky(file_path):
+        if file_path.endswith(file_name):
+            calls.append(file_path)
+            if len(calls) <= times:
+                raise error
+        return process_invoice_file(file_path)
+
+    monkeypatch.setattr(invoice_processor, "process_invoice_file", flaky)
+    return calls
+
+
+def test_failed_file_is_retried_until_the_attempt_limit(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(invoice_processor, "INCREMENTAL_MAX_ATTEMPTS", 2)
+    (tmp_path / "inv").mkdir()
+    output_file = str(tmp_path / "out.xlsx")
+    _write_invoice(tmp_path / "inv" / "a.txt", "INV-1")
+    _write_invoice(tmp_path / "inv" / "b.txt", "INV-2")
+    calls = _failing(monkeypatch, "b.txt", OSError("transient"), times=5)
+
+    for _ in range(3):
+        invoice_processor.process_invoices_incremental("inv", output_file)
+
+    assert len(calls) == 2
+    assert _statuses(output_file) == {"a.txt": "ok", "b.txt": "error"}
+
+    _write_invoice(tmp_path / "inv" / "b.txt", "INV-2", "Rescanned\n")  # A new version gets new attempts
+    invoice_processor.process_invoices_incremental("inv", output_file)
+    assert len(calls) == 3
+
+
+def test_transient_failures_are_recovered_on_the_next_run(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "inv").mkdir()
+    output_file = str(tmp_path / "out.xlsx")
+    _write_invoice(tmp_path / "inv" / "a.txt", "INV-1")
+    _write_invoice(tmp_path / "inv" / "b.txt", "INV-2")
+    _failing(monkeypatch, "a.txt", OSError("transient"), times=1)
+    _failing(monkeypatch, "b.txt", invoice_processor.ResourceLimitError("too large"), times=1)
+
+    invoice_processor.process_invoices_incremental("inv", output_file)
+
+    assert _statuses(output_file) == {"a.txt": "error", "b.txt": "quarantined"}
+    assert _invoice_numbers(output_file) == [None]  # The quarantine row of b.txt
+
+    invoice_processor.process_invoices_incremental("inv", output_file)
+
+    assert _statuses(output_file) == {"a.txt": "ok", "b.txt": "ok"}
+    assert _invoice_numbers(output_file) == ["INV-1", "INV-2"]
@@ -0,0 +1,24 @@
+import time
+
+import invoice_jobs
+import output_sinks
+
+
+def test_failed_extra_output_is_reported_in_job_status(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # The extraction cache is created in the working directory
+    monkeypatch.setattr(output_sinks, "pyarrow", None)
+    invoice_path = tmp_path / "invoice.txt"
+    invoice_path.write_text("Acme Supplies Ltd\nInvoice Number: INV-1\nTotal Amount: 10.00\n")
+
+    job_id = invoice_jobs.submit_job(
+        [str(invoice_path)], str(tmp_path / "out.xlsx"), extra_outputs=[str(tmp_path / "out.parquet"), str(tmp_path / "out.csv")]
+    )
+    job = invoice_jobs.get_job(job_id)
+    deadline = time.time() + 10
+    while not job.finished and time.time() < deadline:
+        time.sleep(0.02)
+
+    state = job.snapshot()
+    assert state["status"] == "done"
+    assert state["errors"] == ["out.parquet: Parquet output needs the pyarrow package (pip install pyarrow)."]
+    assert state["extra_outputs"] == [str(tmp_path / "out.csv")]
@@ -0,0 +1,135 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+import invoice_processor
+import invoice_service
+
+INVOICE_TEXT = b"Acme Supplies Ltd\nInvoice Number: INV-1001\nTotal Amount: 250.00\n"
+
+
+@pytest.fixture
+def start(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # The extraction cache is created in the working directory
+    servers = []
+
+    def start(**kwargs):
+        server = invoice_service.start_service(port=0, **kwargs)
+        servers.append(server)
+        return "http://%s:%d" % server.server_address[:2]
+
+    yield start
+    for server in servers:
+        invoice_service.stop_service(server)
+
+
+def _request(url, data=None):
+    """Returns (status, headers, decoded JSON body); HTTP errors are returned, not raised."""
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=data), timeout=10) as response:
+            return response.status, response.headers, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        with e:
+            return e.code, e.headers, json.loads(e.read())
+
+
+def _post(base_url, file_name, data=INVOICE_TEXT):
+    return _request(f"{base_url}/invoices?filename={file_name}", data)
+
+
+def _wait_for(predicate, timeout=10):
+    deadline = time.time() + timeout
+    while not predicate():
+        if time.time() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.02)
+
+
+def test_post_queues_file_and_result_holds_invoice(start):
+    base_url = start(workers=1)
+
+    status, headers, job = _post(base_url, "invoice.txt")
+    assert status == 202
+    assert headers["Location"] == f"/invoices/{job['job_id']}"
+    assert job["status"] in ("queued", "running", "done")
+
+    _wait_for(lambda: _request(base_url + job["result_url"])[0] == 200)
+    status, _, result = _request(base_url + job["result_url"])
+    assert result["status"] == "done"
+    assert result["invoice"]["invoice_number"] == "INV-1001"
+    assert result["invoice"]["total_amount"] == 250.0
+
+    status, _, state = _request(base_url + job["status_url"])
+    assert status == 200
+    assert state["status"] == "done" and "invoice" not in state
+
+
+def test_unknown_job_and_path_are_404(start):
+    base_url = start(workers=1)
+    assert _request(f"{base_url}/invoices/nosuchjob")[0] == 404
+    assert _request(f"{base_url}/invoices/nosuchjob/result")[0] == 404
+    assert _request(f"{base_url}/nothing")[0] == 404
+
+
+def test_unsupported_file_name_is_400(start):
+    base_url = start(workers=1)
+    assert _post(base_url, "invoice.docx")[0] == 400
+    assert _request(f"{base_url}/invoices", INVOICE_TEXT)[0] == 400
+
+
+def test_full_queue_is_429_with_retry_after(start, monkeypatch):
+    release = threading.Event()
+    process_invoice_file = invoice_processor.process_invoice_file
+
+    def blocked(file_path):
+        release.wait(10)
+        return process_invoice_file(file_path)
+
+    monkeypatch.setattr(invoice_processor, "process_invoice_file", blocked)
+    base_url = start(workers=1, queue_size=1)
+    try:
+        running = _post(base_url, "first.txt")[2]
+        _wait_for(lambda: _request(base_url + running["status_url"])[2]["status"] == "running")
+        assert _post(base_url, "second.txt")[0] == 202  # Waits in the queue
+
+        status, headers, body = _post(base_url, "third.txt")
+        assert status == 429
+        assert headers["Retry-After"] == str(invoice_service.SERVICE_RETRY_AFTER_SECONDS)
+        assert body == {"error": "queue is full"}
+
+        metrics = _request(f"{base_url}/metrics")[2]
+        assert metrics["queue_depth"] == 1
+        assert metrics["running"] == 1
+        assert metrics["rejected"] == 1
+    finally:
+        release.set()
+
+
+def test_metrics_count_processed_files(start):
+    base_url = start(workers=1)
+    job = _post(base_url, "invoice.txt")[2]
+    failed = _post(base_url, "empty.txt", b"")[2]
+    _wait_for(lambda: _request(base_url + failed["result_url"])[0] == 200)
+    assert _request(base_url + job["result_url"])[2]["status"] == "done"
+    assert _request(base_url + failed["result_url"])[2]["status"] == "failed"
+
+    status, _, metrics = _request(f"{base_url}/metrics")
+    assert status == 200
+    assert metrics["submitted"] == 2
+    assert metrics["completed"] == 1
+    assert metrics["failed"] == 1
+    assert metrics["queue_depth"] == 0
+    assert metrics["queue_capacity"] == invoice_service.SERVICE_QUEUE_SIZE
+    assert metrics["processing_seconds_p50"] is not None
+    assert metrics["throughput_per_second"] > 0
+
+
+def test_healthz(start):
+    base_url = start(workers=1)
+    status, _, body = _request(f"{base_url}/healthz")
+    assert status == 200
+    assert body == {"ok": True}
@@ -0,0 +1,42 @@
+import pytest
+from PIL import Image
+
+import invoice_processor
+
+
+@pytest.fixture
+def pdf_calls(monkeypatch):
+    """Replaces rasterization and OCR; records the DPI of every render and every text height profile."""
+    calls = {"dpi": [], "profiled": 0}
+
+    def convert_from_path(pdf_path, dpi, grayscale, first_page, last_page, poppler_path):
+        calls["dpi"].append(dpi)
+        return [Image.new("RGB", (40, 60), "white") for _ in range(first_page, last_page + 1)]
+
+    def estimate_text_height(gray):
+        calls["profiled"] += 1
+        return 80
+
+    monkeypatch.setattr(invoice_processor, "pdfinfo_from_path", lambda pdf_path, poppler_path: {"Pages": 4})
+    monkeypatch.setattr(invoice_processor, "convert_from_path", convert_from_path)
+    monkeypatch.setattr(invoice_processor, "estimate_text_height", estimate_text_height)
+    monkeypatch.setattr(invoice_processor, "_ocr_page_images", lambda images: ["text"] * len(images))
+    return calls
+
+
+def test_preset_off_does_not_profile_pages(pdf_calls, monkeypatch):
+    monkeypatch.setattr(invoice_processor, "OCR_PRESET", "off")
+
+    assert invoice_processor.ocr_pdf_pages("scan.pdf", chunk_size=2) == {page: "text" for page in range(1, 5)}
+
+    assert pdf_calls["profiled"] == 0
+    assert pdf_calls["dpi"] == [200, 200]
+
+
+def test_preset_with_target_height_calibrates_once(pdf_calls, monkeypatch):
+    monkeypatch.setattr(invoice_processor, "OCR_PRESET", "balanced")
+
+    invoice_processor.ocr_pdf_pages("scan.pdf", chunk_size=2)
+
+    assert pdf_calls["profiled"] == 1
+    assert pdf_calls["dpi"] == [200, 120]  # Text 80 px tall at 200 dpi; the target is 32 px, capped at min_dpi
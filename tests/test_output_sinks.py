@@ -0,0 +1,41 @@
+import pytest
+
+import output_sinks
+
+pyarrow = pytest.importorskip("pyarrow")
+parquet = pytest.importorskip("pyarrow.parquet")
+
+HEADERS = ["Invoice Number", "Invoice Date", "Total Amount", "Vendor Name", "File Name", "Status"]
+
+
+def test_parquet_append_with_column_empty_in_first_batch(tmp_path):
+    path = str(tmp_path / "invoices.parquet")
+    assert output_sinks.write_parquet(path, HEADERS, [["INV-1", "01/02/2024", 10.5, None, "a.pdf", None]]) == 1
+    assert output_sinks.write_parquet(path, HEADERS, [["INV-2", None, None, "Acme", "b.pdf", "quarantined: timed out"]], append=True) == 1
+
+    table = parquet.read_table(path)
+    assert table.schema == output_sinks.parquet_schema(HEADERS)
+    assert table.column("Vendor Name").to_pylist() == [None, "Acme"]
+    assert table.column("Status").to_pylist() == [None, "quarantined: timed out"]
+    assert table.column("Total Amount").to_pylist() == [10.5, None]
+
+
+def test_parquet_numeric_looking_text_stays_text(tmp_path):
+    path = str(tmp_path / "invoices.parquet")
+    output_sinks.write_parquet(path, HEADERS, [["12345", None, "7", None, "a.pdf", None]])
+    output_sinks.write_parquet(path, HEADERS, [["INV-9", "5 March 2024", 3, "Acme", "b.pdf", None]], append=True)
+
+    table = parquet.read_table(path)
+    assert table.column("Invoice Number").to_pylist() == ["12345", "INV-9"]
+    assert table.column("Total Amount").to_pylist() == [7.0, 3.0]
+
+
+def test_parquet_append_to_file_with_inferred_schema(tmp_path):
+    path = str(tmp_path / "invoices.parquet")
+    legacy = pyarrow.table({header: pyarrow.array([None], type=pyarrow.float64()) for header in HEADERS})
+    parquet.write_table(legacy, path)
+
+    output_sinks.write_parquet(path, HEADERS, [["INV-1", None, 1.0, "Acme", "a.pdf", None]], append=True)
+
+    table = parquet.read_table(path)
+    assert table.column("Vendor Name").to_pylist() == [None, "Acme"]
@@ -0,0 +1,24 @@
+import openpyxl
+
+import invoice_cli
+import invoice_processor
+
+
+def test_more_shards_than_files_merge(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # The extraction cache is created in the working directory
+    (tmp_path / "inv").mkdir()
+    for number in range(2):
+        (tmp_path / "inv" / f"{number}.txt").write_text(f"Acme Supplies Ltd\nInvoice Number: INV-{number}\nTotal Amount: 1{number}.00\n")
+
+    shard_files = []
+    for index in range(1, 5):
+        shard_file = f"sh{index}.xlsx"
+        assert invoice_cli.main(["process", "--input", "inv", "--output", shard_file, "--shard", f"{index}/4"]) == 0
+        shard_files.append(shard_file)
+    empty_shards = [path for path in shard_files if openpyxl.load_workbook(path).active.max_row == 1]
+    assert empty_shards  # 2 files cannot fill 4 shards
+
+    assert invoice_cli.main(["merge", "--output", "merged.xlsx"] + shard_files) == 0
+    rows = list(openpyxl.load_workbook("merged.xlsx").active.iter_rows(values_only=True))
+    assert rows[0] == tuple(invoice_processor.EXCEL_HEADERS)
+    assert [row[0] for row in rows[1:]] == ["INV-0", "INV-1"]
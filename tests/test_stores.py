@@ -0,0 +1,50 @@
+import gc
+import threading
+import weakref
+
+import pytest
+
+import invoice_cache
+import invoice_index
+import vendor_templates
+
+
+def test_hash_memo_keeps_most_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(invoice_cache, "HASH_MEMO_SIZE", 2)
+    monkeypatch.setattr(invoice_cache, "_hash_memo", invoice_cache._hash_memo.__class__())
+    paths = []
+    for number in range(3):
+        path = tmp_path / f"{number}.txt"
+        path.write_text(str(number))
+        paths.append(str(path))
+
+    invoice_cache.file_content_hash(paths[0])
+    invoice_cache.file_content_hash(paths[1])
+    invoice_cache.file_content_hash(paths[0])
+    invoice_cache.file_content_hash(paths[2])
+
+    assert [key[0] for key in invoice_cache._hash_memo] == [paths[0], paths[2]]
+
+
+@pytest.mark.parametrize("open_store", [
+    lambda path: invoice_cache.get_cache(path),
+    lambda path: vendor_templates.get_template_store(path),
+    lambda path: invoice_index.get_duplicate_index(path),
+], ids=["cache", "vendor_templates", "duplicate_index"])
+def test_store_is_shared_within_a_thread_and_closed_after_it(tmp_path, open_store):
+    path = str(tmp_path / "store.sqlite")
+    opened = []
+
+    def worker():
+        store = open_store(path)
+        assert open_store(path) is store
+        opened.append(weakref.ref(store))
+
+    for _ in range(3):
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+    gc.collect()
+
+    assert len(opened) == 3
+    assert all(store() is None for store in opened)  # Closed with their threads, not kept for the process
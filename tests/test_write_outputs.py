@@ -0,0 +1,116 @@
+import csv
+import sqlite3
+
+import openpyxl
+import pytest
+
+import invoice_processor
+import output_sinks
+
+
+def _invoice(number):
+    return {
+        "invoice_number": f"INV-{number}",
+        "invoice_date": "01/02/2024",
+        "total_amount": float(number),
+        "vendor_name": "Acme",
+        "file_name": f"{number}.pdf",
+    }
+
+
+def test_rows_are_written_while_the_generator_runs(tmp_path, monkeypatch):
+    monkeypatch.setattr(invoice_processor, "OUTPUT_BATCH_ROWS", 2)
+    events = []
+    csv_write = output_sinks.CsvSink.write
+
+    def recording_write(self, rows):
+        events.append(("write", len(rows)))
+        csv_write(self, rows)
+
+    monkeypatch.setattr(output_sinks.CsvSink, "write", recording_write)
+
+    def invoices():
+        for number in range(5):
+            events.append(("extract", number))
+            yield _invoice(number)
+
+    csv_path = tmp_path / "invoices.csv"
+    invoice_processor.write_outputs(invoices(), [str(tmp_path / "invoices.xlsx"), str(csv_path)])
+
+    assert events == [
+        ("extract", 0), ("extract", 1), ("write", 2),
+        ("extract", 2), ("extract", 3), ("write", 2),
+        ("extract", 4), ("write", 1),
+    ]
+    assert len(list(csv.reader(open(csv_path, newline="")))) == 6
+    assert openpyxl.load_workbook(tmp_path / "invoices.xlsx").active.max_row == 6
+
+
+def test_duplicates_skipped_by_excel_are_left_out_of_sinks(tmp_path, monkeypatch):
+    monkeypatch.setattr(invoice_processor, "DUPLICATE_CHECK", True)
+    monkeypatch.setattr(invoice_processor, "OUTPUT_BATCH_ROWS", 2)
+    excel_path = str(tmp_path / "invoices.xlsx")
+    sqlite_path = str(tmp_path / "invoices.sqlite")
+
+    invoice_processor.write_outputs([_invoice(1), _invoice(2)], [excel_path, sqlite_path])
+    duplicates = invoice_processor.write_outputs(
+        iter([_invoice(2), _invoice(3), _invoice(3)]), [excel_path, sqlite_path], existing_excel_path=excel_path, append=True
+    )
+
+    assert duplicates == ["2.pdf", "3.pdf"]
+    with sqlite3.connect(sqlite_path) as conn:
+        numbers = [row[0] for row in conn.execute("SELECT invoice_number FROM invoices ORDER BY rowid")]
+    assert numbers == ["INV-1", "INV-2", "INV-3"]
+    assert openpyxl.load_workbook(excel_path).active.max_row == 4
+
+
+@pytest.mark.parametrize("streaming", [True, False])
+def test_append_to_older_ledger_extends_header(tmp_path, monkeypatch, streaming):
+    if not streaming:
+        def unsupported(*args, **kwargs):
+            raise ValueError("simulated")
+
+        monkeypatch.setattr(invoice_processor, "append_rows_to_xlsx", unsupported)
+    excel_path = str(tmp_path / "invoices.xlsx")
+    workbook = openpyxl.Workbook()
+    workbook.active.append(invoice_processor.EXCEL_HEADERS[:5])
+    workbook.active.append(["INV-0", None, 0.0, "Acme", "0.pdf"])
+    workbook.save(excel_path)
+
+    invoice_processor.write_to_excel([_invoice(1)], excel_path, existing_excel_path=excel_path)
+
+    rows = list(openpyxl.load_workbook(excel_path).active.iter_rows(values_only=True))
+    assert rows[0] == tuple(invoice_processor.EXCEL_HEADERS)
+    assert [row[0] for row in rows[1:]] == ["INV-0", "INV-1"]
+
+
+@pytest.mark.parametrize("streaming", [True, False])
+def test_append_to_foreign_sheet_is_refused(tmp_path, monkeypatch, streaming):
+    if not streaming:
+        def unsupported(*args, **kwargs):
+            raise ValueError("simulated")
+
+        monkeypatch.setattr(invoice_processor, "append_rows_to_xlsx", unsupported)
+    excel_path = str(tmp_path / "budget.xlsx")
+    workbook = openpyxl.Workbook()
+    workbook.active.append(["Month", "Budget"])
+    workbook.save(excel_path)
+
+    with pytest.raises(invoice_processor.HeaderMismatchError):
+        invoice_processor.write_to_excel([_invoice(1)], excel_path, existing_excel_path=excel_path)
+
+    assert list(openpyxl.load_workbook(excel_path).active.iter_rows(values_only=True)) == [("Month", "Budget")]
+
+
+def test_failing_sink_is_reported_and_others_written(tmp_path, monkeypatch):
+    monkeypatch.setattr(output_sinks, "pyarrow", None)
+    csv_path = str(tmp_path / "invoices.csv")
+    output_errors = []
+
+    invoice_processor.write_outputs(
+        [_invoice(1)], [str(tmp_path / "invoices.xlsx"), str(tmp_path / "invoices.parquet"), csv_path], output_errors=output_errors
+    )
+
+    assert output_errors == ["invoices.parquet: Parquet output needs the pyarrow package (pip install pyarrow)."]
+    assert len(list(csv.reader(open(csv_path, newline="")))) == 2
+    assert not (tmp_path / "invoices.parquet").exists()
@@ -0,0 +1,227 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+# --- Configuration ---
+CHUNK_BYTES = 1024 * 1024  # Uploads are hashed and written in chunks of this size
+BLOBS_DIR = "blobs"
+SESSIONS_DIR = "sessions"
+
+# Content-addressed store for uploaded files, shared by all sessions of the Streamlit app.
+# Every upload is stored once under blobs/<sha256>, however many sessions upload it. A session
+# sees its files under their original names in sessions/<session id>/, as hard links to the
+# blobs (copies where the file system has no hard links), because the pipeline takes the file
+# name from the path. Session directories also hold the session's outputs.
+#
+# evict() bounds disk usage: sessions not used for ttl_seconds are removed, then, while the
+# store is larger than max_bytes, the least recently used idle sessions; blobs no session links
+# to any more go with them. A session is used whenever session_dir() is called for it (on
+# every page run of the app).
+
+# --- Helper Functions ---
+
+def _hash_stream(stream):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(CHUNK_BYTES), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+def _link_or_copy(source, target):
+    try:
+        os.link(source, target)
+    except OSError:  # No hard links on this file system
+        shutil.copyfile(source, target)
+
+def _tree_size(path, seen_inodes):
+    """Bytes of the files under path whose inodes are not in seen_inodes (which is updated)."""
+    total = 0
+    for directory, _, file_names in os.walk(path):
+        for file_name in file_names:
+            try:
+                stat = os.stat(os.path.join(directory, file_name))
+            except OSError:
+                continue  # Removed meanwhile
+            if (stat.st_dev, stat.st_ino) not in seen_inodes:
+                seen_inodes.add((stat.st_dev, stat.st_ino))
+                total += stat.st_size
+    return total
+
+
+class UploadStore:
+    """
+    Uploaded files stored by content hash under root_dir, linked into
+    per-session directories under their upload names.
+    """
+
+    def __init__(self, root_dir, ttl_seconds=24 * 3600, max_bytes=2 * 1024 ** 3, idle_seconds=600):
+        self.root_dir = root_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds  # Sessions used more recently are never evicted for size
+        self.blobs_dir = os.path.join(root_dir, BLOBS_DIR)
+        self.sessions_dir = os.path.join(root_dir, SESSIONS_DIR)
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        os.makedirs(self.sessions_dir, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def session_dir(self, session_id):
+        """Returns the directory of a session, creating it, and marks the session as used."""
+        path = os.path.join(self.sessions_dir, session_id)
+        os.makedirs(path, exist_ok=True)
+        os.utime(path)
+        return path
+
+    def put(self, stream):
+        """
+        Stores the content of a binary file object (read from its current
+        position) unless the store already holds it. Seekable streams are
+        hashed first, so known content is never written; others are written
+        to a temporary file while hashing. Returns the content hash.
+        """
+        if stream.seekable():
+            start = stream.tell()
+            content_hash = _hash_stream(stream)
+            blob_path = self.blob_path(content_hash)
+            if not os.path.exists(blob_path):
+                stream.seek(start)
+                self._write_blob(stream, blob_path)
+        else:
+            fd, temp_path = tempfile.mkstemp(dir=self.blobs_dir, suffix=".part")
+            digest = hashlib.sha256()
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    for chunk in iter(lambda: stream.read(CHUNK_BYTES), b""):
+                        digest.update(chunk)
+                        f.write(chunk)
+                content_hash = digest.hexdigest()
+                blob_path = self.blob_path(content_hash)
+                if os.path.exists(blob_path):
+                    os.remove(temp_path)
+                else:
+                    os.replace(temp_path, blob_path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+        os.utime(blob_path)
+        return content_hash
+
+    def _write_blob(self, stream, blob_path):
+        fd, temp_path = tempfile.mkstemp(dir=self.blobs_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in iter(lambda: stream.read(CHUNK_BYTES), b""):
+                    f.write(chunk)
+            os.replace(temp_path, blob_path)  # Atomic: other sessions never see a partial blob
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def blob_path(self, content_hash):
+        return os.path.join(self.blobs_dir, content_hash)
+
+    def link(self, session_id, file_name, content_hash):
+        """
+        Makes the blob content_hash available as file_name in the session's
+        directory. Does nothing if it already is. Returns the path.
+        """
+        path = os.path.join(self.session_dir(session_id), os.path.basename(file_name))
+        blob_path = self.blob_path(content_hash)
+        if os.path.exists(path):
+            if os.path.samefile(path, blob_path):
+                return path
+            os.remove(path)  # Same name, different upload: replace it
+        _link_or_copy(blob_path, path)
+        return path
+
+    def add(self, session_id, file_name, stream):
+        """put() followed by link(). Returns (path, content_hash)."""
+        content_hash = self.put(stream)
+        try:
+            return self.link(session_id, file_name, content_hash), content_hash
+        except FileNotFoundError:  # Evicted between put and link by another session
+            stream.seek(0)
+            content_hash = self.put(stream)
+            return self.link(session_id, file_name, content_hash), content_hash
+
+    def clear_session(self, session_id):
+        """Removes a session's files; blobs are removed by evict() once unreferenced."""
+        shutil.rmtree(os.path.join(self.sessions_dir, session_id), ignore_errors=True)
+
+    def size(self):
+        """Bytes on disk, counting linked files once."""
+        seen_inodes = set()
+        return _tree_size(self.blobs_dir, seen_inodes) + _tree_size(self.sessions_dir, seen_inodes)
+
+    def evict(self, keep_session_id=None):
+        """
+        Removes sessions unused for ttl_seconds, then the least recently used
+        sessions idle for idle_seconds while the store exceeds max_bytes, and
+        blobs no longer linked from any session. keep_session_id is never
+        removed. Returns the number of sessions removed.
+        """
+        with self._lock:
+            now = time.time()
+            sessions = []
+            for session_id in os.listdir(self.sessions_dir):
+                if session_id == keep_session_id:
+                    continue
+                try:
+                    sessions.append((os.stat(os.path.join(self.sessions_dir, session_id)).st_mtime, session_id))
+                except OSError:
+                    continue
+            sessions.sort()
+            removed = 0
+            for used_at, session_id in sessions:
+                if now - used_at > self.ttl_seconds:
+                    self.clear_session(session_id)
+                    removed += 1
+            self._remove_unlinked_blobs(now)
+            if self.max_bytes:
+                total = self.size()
+                for used_at, session_id in sessions:
+                    if total <= self.max_bytes:
+                        break
+                    if now - used_at <= self.ttl_seconds and now - used_at > self.idle_seconds:
+                        self.clear_session(session_id)
+                        removed += 1
+                        self._remove_unlinked_blobs(now)
+                        total = self.size()
+                if total > self.max_bytes:
+                    print(f"Upload store {self.root_dir} holds {total} bytes, above its limit of {self.max_bytes}, in active sessions.")
+            return removed
+
+    def _remove_unlinked_blobs(self, now):
+        for file_name in os.listdir(self.blobs_dir):
+            path = os.path.join(self.blobs_dir, file_name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if file_name.endswith(".part"):
+                if now - stat.st_mtime > self.ttl_seconds:  # Left behind by a crashed upload
+                    os.remove(path)
+            elif stat.st_nlink <= 1 and now - stat.st_mtime > self.idle_seconds:
+                os.remove(path)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_upload_store(root_dir, ttl_seconds=24 * 3600, max_bytes=2 * 1024 ** 3):
+    """
+    Returns the UploadStore for root_dir, shared by all sessions (threads)
+    of the app process.
+    """
+    key = os.path.abspath(root_dir)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = UploadStore(root_dir, ttl_seconds, max_bytes)
+            _stores[key] = store
+        store.ttl_seconds, store.max_bytes = ttl_seconds, max_bytes
+    return store
@@ -0,0 +1,260 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from PIL import Image
+
+# --- Configuration ---
+BAND_PADDING = 0.01  # Fraction of the page height added above and below every learned band
+STACK_GAP = 24  # White pixels between stacked bands
+MAX_ASPECT_DIFFERENCE = 0.1  # Pages whose aspect ratio differs more than this from the template's do not use it
+
+# Per-vendor layout templates. A template stores, for one vendor (identified by the letterhead
+# at the top of the page, see invoice_processor._supplier_key), the horizontal bands of
+# the page (as fractions of the page height) that held the invoice fields, learned from
+# Tesseract word boxes of a full-page OCR. Later pages of that vendor OCR only those bands,
+# stacked into one small image. Full-width bands are used because the vertical position of
+# a field is stable on fixed layouts while the width of its value is not.
+
+# --- Helper Functions ---
+
+def words_from_data(data, x_offset=0, y_offset=0):
+    """
+    Converts pytesseract.image_to_data(output_type=DICT) output into a list
+    of words: dicts with text, conf, left, top, width, height and line_key.
+    """
+    words = []
+    for index, text in enumerate(data["text"]):
+        if not text or not text.strip():
+            continue
+        words.append({
+            "text": text,
+            "conf": float(data["conf"][index]),
+            "left": data["left"][index] + x_offset,
+            "top": data["top"][index] + y_offset,
+            "width": data["width"][index],
+            "height": data["height"][index],
+            "line_key": (data["block_num"][index], data["par_num"][index], data["line_num"][index]),
+        })
+    return words
+
+def group_lines(words):
+    """
+    Groups words into text lines in reading order.
+    Returns dicts with text, left, right, top, bottom and the mean word
+    confidence.
+    """
+    lines = {}
+    for word in words:
+        lines.setdefault(word["line_key"], []).append(word)
+    grouped = []
+    for line_words in lines.values():
+        line_words.sort(key=lambda word: word["left"])
+        grouped.append({
+            "text": " ".join(word["text"] for word in line_words),
+            "left": line_words[0]["left"],
+            "right": max(word["left"] + word["width"] for word in line_words),
+            "top": min(word["top"] for word in line_words),
+            "bottom": max(word["top"] + word["height"] for word in line_words),
+            "conf": sum(word["conf"] for word in line_words) / len(line_words),
+        })
+    grouped.sort(key=lambda line: line["top"])
+    return grouped
+
+def lines_to_text(lines):
+    return "\n".join(line["text"] for line in lines)
+
+def merge_bands(bands):
+    """
+    Merges overlapping (top, bottom) bands; returns them sorted by top.
+    """
+    merged = []
+    for top, bottom in sorted(bands):
+        if merged and top <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], bottom))
+        else:
+            merged.append((top, bottom))
+    return merged
+
+def learn_bands(lines, page_height, field_matchers):
+    """
+    Finds, for every field, the first line matching field_matchers[field]
+    (a predicate on the line text) and returns the band around it, including
+    the lines just above and below it (labels are often printed there), as
+    fractions of page_height. Returns None unless every field was found.
+    """
+    bands = {}
+    for field, matches in field_matchers.items():
+        for index, line in enumerate(lines):
+            if matches(line["text"]):
+                neighbours = lines[max(0, index - 1):index + 2]
+                top = min(l["top"] for l in neighbours) / page_height - BAND_PADDING
+                bottom = max(l["bottom"] for l in neighbours) / page_height + BAND_PADDING
+                bands[field] = (max(0.0, top), min(1.0, bottom))
+                break
+        else:
+            return None
+    return bands
+
+def stack_bands(image, bands):
+    """
+    Crops full-width bands (fractions of the page height) from image and
+    stacks them vertically, separated by STACK_GAP white pixels.
+    Returns (stacked_image, offsets) where offsets[i] is the (top, bottom)
+    of band i in the stacked image.
+    """
+    crops = [image.crop((0, int(top * image.height), image.width, int(bottom * image.height))) for top, bottom in bands]
+    height = sum(crop.height for crop in crops) + STACK_GAP * max(0, len(crops) - 1)
+    stacked = Image.new(image.mode, (image.width, max(1, height)), color=255 if image.mode in ("1", "L") else (255, 255, 255))
+    offsets = []
+    y = 0
+    for crop in crops:
+        stacked.paste(crop, (0, y))
+        offsets.append((y, y + crop.height))
+        y += crop.height + STACK_GAP
+    return stacked, offsets
+
+def split_stacked_words(words, offsets):
+    """
+    Assigns words OCR'd from a stacked image back to their bands.
+    Returns one list of words per band.
+    """
+    per_band = [[] for _ in offsets]
+    for word in words:
+        middle = word["top"] + word["height"] / 2
+        for index, (top, bottom) in enumerate(offsets):
+            if top <= middle < bottom:
+                per_band[index].append(word)
+                break
+    return per_band
+
+
+class VendorTemplateStore:
+    """
+    SQLite store of per-vendor layout templates, keyed by a normalized vendor
+    letterhead. Besides the learned bands it counts how often a vendor was
+    seen, how often its template was used or fell back to full-page OCR, and
+    when learning is due again (see learning_due and record_learning).
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")  # Shared by parallel batch workers
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS vendor_templates (
+                vendor_key TEXT PRIMARY KEY,
+                bands TEXT,
+                aspect REAL,
+                seen INTEGER NOT NULL DEFAULT 0,
+                hits INTEGER NOT NULL DEFAULT 0,
+                fallbacks INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL,
+                learn_failures INTEGER NOT NULL DEFAULT 0,
+                next_learn_at INTEGER
+            )
+            """
+        )
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(vendor_templates)")}
+        for column, declaration in (("learn_failures", "INTEGER NOT NULL DEFAULT 0"), ("next_learn_at", "INTEGER")):
+            if column not in columns:  # Store created by an older version
+                self.conn.execute(f"ALTER TABLE vendor_templates ADD COLUMN {column} {declaration}")
+        self.conn.commit()
+
+    def get(self, vendor_key, aspect):
+        """
+        Returns the learned {field: (top, bottom)} bands for vendor_key, or
+        None if there is no template or it was learned on a page of another shape.
+        """
+        row = self.conn.execute(
+            "SELECT bands, aspect FROM vendor_templates WHERE vendor_key = ?", (vendor_key,)
+        ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        if abs(row[1] - aspect) > MAX_ASPECT_DIFFERENCE * row[1]:
+            return None
+        return {field: tuple(band) for field, band in json.loads(row[0]).items()}
+
+    def mark_seen(self, vendor_key):
+        """Counts one more invoice of vendor_key and returns the new count."""
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO vendor_templates (vendor_key, seen, updated_at) VALUES (?, 1, ?) "
+                "ON CONFLICT(vendor_key) DO UPDATE SET seen = seen + 1",
+                (vendor_key, time.time()),
+            )
+            return self.conn.execute("SELECT seen FROM vendor_templates WHERE vendor_key = ?", (vendor_key,)).fetchone()[0]
+
+    def save(self, vendor_key, bands, aspect):
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO vendor_templates (vendor_key, bands, aspect, seen, updated_at) VALUES (?, ?, ?, 1, ?) "
+                "ON CONFLICT(vendor_key) DO UPDATE SET bands = excluded.bands, aspect = excluded.aspect, updated_at = excluded.updated_at",
+                (vendor_key, json.dumps(bands), aspect, time.time()),
+            )
+
+    def learning_due(self, vendor_key, learn_after, max_failures):
+        """
+        Whether the template of vendor_key should be (re)learned now: the
+        vendor has been seen learn_after times (or as often as the last
+        learning attempt scheduled) and learning has not failed max_failures
+        times in a row.
+        """
+        row = self.conn.execute(
+            "SELECT seen, COALESCE(next_learn_at, ?), learn_failures FROM vendor_templates WHERE vendor_key = ?",
+            (learn_after, vendor_key),
+        ).fetchone()
+        return row is not None and row[0] >= row[1] and row[2] < max_failures
+
+    def record_learning(self, vendor_key, learned, learn_after):
+        """
+        Records a learning attempt. The next one is due learn_after sightings
+        later, doubling with every failure in a row.
+        """
+        with self.conn:
+            if learned:
+                self.conn.execute(
+                    "UPDATE vendor_templates SET learn_failures = 0, next_learn_at = seen + ? WHERE vendor_key = ?",
+                    (learn_after, vendor_key),
+                )
+            else:
+                self.conn.execute(
+                    "UPDATE vendor_templates SET learn_failures = learn_failures + 1, "
+                    "next_learn_at = seen + ? * (1 << (learn_failures + 1)) WHERE vendor_key = ?",
+                    (learn_after, vendor_key),
+                )
+
+    def record_use(self, vendor_key, hit):
+        column = "hits" if hit else "fallbacks"
+        with self.conn:
+            self.conn.execute(f"UPDATE vendor_templates SET {column} = {column} + 1 WHERE vendor_key = ?", (vendor_key,))
+
+    def stats(self):
+        """Returns [(vendor_key, has_template, seen, hits, fallbacks)] for all known vendors."""
+        return [
+            (key, bands is not None, seen, hits, fallbacks)
+            for key, bands, seen, hits, fallbacks in self.conn.execute(
+                "SELECT vendor_key, bands, seen, hits, fallbacks FROM vendor_templates ORDER BY seen DESC"
+            )
+        ]
+
+    def close(self):
+        self.conn.close()
+
+
+_stores = threading.local()
+
+def get_template_store(db_path):
+    """
+    Returns a VendorTemplateStore for db_path, shared within the current
+    process and thread (like invoice_cache.get_cache, its connection is
+    closed when the thread exits).
+    """
+    stores = _stores.__dict__.setdefault("stores", {})
+    key = (os.getpid(), os.path.abspath(db_path))
+    if key not in stores:
+        stores[key] = VendorTemplateStore(db_path)
+    return stores[key]